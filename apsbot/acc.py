@@ -1,13 +1,22 @@
 import click
 from .config import Config
 from aps_toolkit import BIM360
+from .session import use_http_cache
 import json
 from .tokenconfig import TokenConfig
-from tabulate import tabulate
+from .dm import DataManagement, FolderCrawler, ITEM_COLUMNS
+from .export import format_option, save_frame, resolve_format, FrameWriter
+from .output import output_options, show, TableWriter
+from .checkpoint import Checkpoint
 import os
+import sys
 import pandas as pd
 
 
+# hub, project, folder and item reads are served from the local HTTP cache
+use_http_cache(BIM360)
+
+
 @click.command()
 @click.option('--url', prompt='URL', help='The URL to parse.')
 def parse_url(url):
@@ -22,7 +31,8 @@ def parse_url(url):
 
 @click.command()
 @click.option('--save_data', prompt='Save Data(y/n)', default='n', help='Save data to file.')
-def hubs(save_data):
+@output_options
+def hubs(save_data, output, limit):
     """This command lists all hubs."""
     token = TokenConfig.load_config()
     bim360 = BIM360(token)
@@ -35,7 +45,7 @@ def hubs(save_data):
         file_path = os.path.join(folder, 'hubs.json')
         with open(file_path, 'w') as f:
             json.dump(result, f, indent=4)
-        click.echo(f"Hubs data saved to {file_path}")
+        click.echo(f"Hubs data saved to {file_path}", err=True)
     # get hubids and names show dataframe from result json
     df = pd.DataFrame()
     for hub in result["data"]:
@@ -45,7 +55,7 @@ def hubs(save_data):
             region = hub["attributes"]["region"]
             type = hub["attributes"]["extension"]["type"]
             df = pd.concat([df, pd.DataFrame({"id": [id], "name": [name], "region": [region], "type": [type]})])
-    print(tabulate(df, headers="keys", tablefmt="psql"))
+    show(df, output, limit)
 
 
 
@@ -53,7 +63,9 @@ def hubs(save_data):
 @click.option('--hub_id', prompt='Hub Id', default=lambda: Config.load_hub_id(),
               help='The projects information from hub id.')
 @click.option('--save_data', prompt='Save Data(y/n)', default='n', help='Save data to file.')
-def projects(hub_id, save_data):
+@format_option
+@output_options
+def projects(hub_id, save_data, save_format, output, limit):
     """Get batch all projects with general information by hub_id"""
     if not hub_id:
         click.echo("Please provide a Hub Id.")
@@ -67,11 +79,9 @@ def projects(hub_id, save_data):
         click.echo("No projects found.")
         return
     if str.lower(save_data) == 'y':
-        folder = Config.load_folder_path()
-        file_path = os.path.join(folder, 'projects.csv')
-        df.to_csv(file_path, index=False)
-        click.echo(f"Projects data saved to {file_path}")
-    print(tabulate(df, headers="keys", tablefmt="psql"))
+        file_path = save_frame(df, 'projects', save_format)
+        click.echo(f"Projects data saved to {file_path}", err=True)
+    show(df, output, limit)
 
 
 @click.command()
@@ -80,7 +90,9 @@ def projects(hub_id, save_data):
 @click.option('--project_id', prompt='Project Id', default=lambda: Config.load_project_id(),
               help='The projects information from project id.')
 @click.option('--save_data', prompt='Save Data(y/n)', default='n', help='Save data to file.')
-def top_folders(hub_id, project_id, save_data):
+@format_option
+@output_options
+def top_folders(hub_id, project_id, save_data, save_format, output, limit):
     """Get batch all top folders with general information by hub_id and project_id"""
     if not hub_id or not project_id:
         click.echo("Please provide a Hub Id and Project Id.")
@@ -94,13 +106,11 @@ def top_folders(hub_id, project_id, save_data):
         click.echo("No top folder found.")
         return
     if str.lower(save_data) == 'y':
-        folder = Config.load_folder_path()
-        file_path = os.path.join(folder, 'top_folders.csv')
-        df.to_csv(file_path, index=False)
-        click.echo(f"Top folders data saved to {file_path}")
+        file_path = save_frame(df, 'top_folders', save_format)
+        click.echo(f"Top folders data saved to {file_path}", err=True)
     # just show df id,name
     df = df[['id', 'name']]
-    print(tabulate(df, headers="keys", tablefmt="psql", ))
+    show(df, output, limit)
 
 
 @click.command()
@@ -112,7 +122,12 @@ def top_folders(hub_id, project_id, save_data):
 @click.option('--is_sub_folder', prompt='Is Sub Folder(y/n)', default="n",
               help='The projects information from is sub folder.')
 @click.option('--save_data', prompt='Save Data(y/n)', default="n", help='Save data to file.')
-def items(project_id, folder_id, extension, is_sub_folder, save_data):
+@format_option
+@click.option('--workers', default=lambda: Config.load_crawl_workers(), type=int,
+              help='The number of folders listed in parallel.')
+@click.option('--resume', default='n', help='Continue an interrupted run from its last checkpoint (y/n).')
+@output_options
+def items(project_id, folder_id, extension, is_sub_folder, save_data, save_format, workers, resume, output, limit):
     """Get batch all items with general information by project_id and folder_id"""
     if not project_id or not folder_id:
         click.echo("Please provide a Hub Id and Project Id.")
@@ -120,23 +135,67 @@ def items(project_id, folder_id, extension, is_sub_folder, save_data):
     Config.save_folder_id(folder_id)
     Config.save_project_id(project_id)
     token = TokenConfig.load_config()
-    bim360 = BIM360(token)
-    if str.lower(is_sub_folder) == 'y':
-        is_sub_folder = True
-    else:
-        is_sub_folder = False
-    df = bim360.batch_report_items(project_id, folder_id, extension, is_sub_folder)
-    if df.empty:
-        click.echo("No items found.")
-        return
+    crawler = FolderCrawler(DataManagement(token, workers=workers), project_id, workers)
+    is_sub_folder = str.lower(is_sub_folder) == 'y'
+    # folders listed so far are saved in partitions, an interrupted crawl resumes from the folders left
+    checkpoint = Checkpoint('items', {'project_id': project_id, 'folder_id': folder_id, 'extension': extension,
+                                      'is_sub_folder': is_sub_folder}, str.lower(resume) == 'y')
+    saver = None
     if str.lower(save_data) == 'y':
-        folder = Config.load_folder_path()
-        file_path = os.path.join(folder, 'items.csv')
-        df.to_csv(file_path, index=False)
-        click.echo(f"Items data saved to {file_path}")
-    # just show item_id, item_name, derivative_urn
-    df = df[['item_id', 'item_name', 'derivative_urn']]
-    print(tabulate(df, headers="keys", tablefmt="psql"))
+        saver = FrameWriter(Config.load_folder_path(), 'items', resolve_format(save_format))
+    show_progress = sys.stderr.isatty()
+    writer = TableWriter(output, limit)
+    count = 0
+
+    def write(df):
+        if saver:
+            saver.write(df)
+        if show_progress:
+            click.echo('\r\033[K', err=True, nl=False)
+        if writer.format == 'table':
+            # just show item_id, item_name, derivative_urn
+            df = df[['item_id', 'item_name', 'derivative_urn']]
+        writer.write(df)
+
+    for df in checkpoint.frames():
+        write(df)
+        count += len(df)
+    if checkpoint.resumed:
+        click.echo(f"Resumed with {count} items found earlier.", err=True)
+    cursor = checkpoint.cursor or {'done': [], 'frontier': None}
+    done = list(cursor['done'])
+    buffer = []
+    buffered_folders = []
+    folders = []
+    if cursor['frontier'] != []:
+        folders = crawler.crawl(folder_id, extension, is_sub_folder, frontier=cursor['frontier'],
+                                seen=cursor['done'])
+    # rows are written out and appended to the saved file as each folder finishes
+    for current, rows in folders:
+        buffered_folders.append(current)
+        if rows:
+            df = pd.DataFrame(rows, columns=ITEM_COLUMNS)
+            write(df)
+            buffer.append(df)
+            count += len(rows)
+        if checkpoint.due(sum(len(df) for df in buffer)) or not crawler.frontier:
+            done.extend(buffered_folders)
+            checkpoint.save(len(done), pd.concat(buffer, ignore_index=True) if buffer else pd.DataFrame(),
+                            cursor={'done': done, 'frontier': crawler.frontier})
+            buffer = []
+            buffered_folders = []
+        if show_progress:
+            click.echo(f"\rFolders {crawler.folders_done}/{crawler.folders_found}, items {count}", err=True, nl=False)
+    writer.close()
+    file_path = saver.close() if saver else None
+    checkpoint.clear()
+    if show_progress:
+        click.echo(err=True)
+    if count == 0:
+        click.echo("No items found.", err=True)
+        return
+    if file_path:
+        click.echo(f"Items data saved to {file_path}", err=True)
 
 
 @click.command()
@@ -144,7 +203,9 @@ def items(project_id, folder_id, extension, is_sub_folder, save_data):
               help='The projects information from project id.')
 @click.option('--item_id', prompt='Item Id', default=lambda: Config.load_item_id(), help='The urn of the item.')
 @click.option('--save_data', prompt='Save Data(y/n)', default="n", help='Save data to file.')
-def item_versions(project_id, item_id, save_data):
+@format_option
+@output_options
+def item_versions(project_id, item_id, save_data, save_format, output, limit):
     """Get batch all item versions with general information by project_id and item_id"""
 
     if not project_id or not item_id:
@@ -159,8 +220,6 @@ def item_versions(project_id, item_id, save_data):
         click.echo("No top folder found.")
         return
     if str.lower(save_data) == 'y':
-        folder = Config.load_folder_path()
-        file_path = os.path.join(folder, 'item_versions.csv')
-        df.to_csv(file_path, index=False)
-        click.echo(f"Item Versions data saved to {file_path}")
-    print(tabulate(df, headers="keys", tablefmt="psql"))
+        file_path = save_frame(df, 'item_versions', save_format)
+        click.echo(f"Item Versions data saved to {file_path}", err=True)
+    show(df, output, limit)
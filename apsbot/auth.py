@@ -1,5 +1,6 @@
 import click
 from .tokenconfig import TokenConfig
+from .httpcache import HttpCache
 from aps_toolkit import Auth, AuthGoogleColab
 import requests
 import os
@@ -17,6 +18,7 @@ def login(auth_type):
     if auth_type == '1':
         token = auth.auth2leg()
         TokenConfig.save_config(token)
+        HttpCache.clear()
         click.echo("Token saved to token_config.json. Authentication type: 2-legged.")
     elif auth_type == '2':
         auth = Auth()
@@ -24,6 +26,7 @@ def login(auth_type):
         print("Please make sure you added the callback 'http://localhost:8080/api/auth/callback' to your app settings.")
         token = auth.auth3leg()
         TokenConfig.save_config(token)
+        HttpCache.clear()
         click.echo("Token saved to token_config.json. Authentication type: 3-legged.")
     else:
         click.echo("Invalid authentication type.")
@@ -49,6 +52,7 @@ def auth2leg():
     token = auth.auth2leg()
     click.echo("Auth 2 legged success!")
     TokenConfig.save_config(token)
+    HttpCache.clear()
     print("Token Saved to Environment Variables")
     print("Access Token: ", token.access_token)
     print("Expires in: ", token.expires_in)
@@ -69,6 +73,7 @@ def auth3leg(callback, scope):
         click.echo("Auth 3 legged failed.")
         return
     TokenConfig.save_config(result)
+    HttpCache.clear()
     click.echo("Auth 3 legged success! Saving token to token_config.json.")
     print("Access Token: ", result.access_token)
     print("Refresh Token: ", result.refresh_token)
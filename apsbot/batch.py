@@ -0,0 +1,175 @@
+import click
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from .tokenconfig import TokenConfig
+from .cache import PropDbCache
+from .config import Config
+from .snapshot import RevitSnapshot
+from .output import output_options, show
+from .export import FORMATS, save_frame, parameter_units
+import pandas as pd
+
+
+def _split(value):
+    """Accept both 'Walls,Doors' and ['Walls', 'Doors'] in a manifest."""
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [v.strip() for v in value.split(',') if v.strip()]
+    return list(value)
+
+
+def _dict_frame(data, column):
+    df = pd.DataFrame.from_dict(data, orient='index', columns=[column])
+    df.index.name = 'DbId'
+    return df.reset_index()
+
+
+# extraction type -> function(propdb, job) returning a DataFrame, same calls as the revit commands
+EXTRACTIONS = {
+    'parameters': lambda propdb, job: pd.DataFrame(pd.Series(propdb.get_all_parameters()), columns=['Parameter']),
+    'categories': lambda propdb, job: _dict_frame(propdb.get_all_categories(), 'Category'),
+    'families': lambda propdb, job: _dict_frame(propdb.get_all_families(), 'Family'),
+    'family_types': lambda propdb, job: _dict_frame(propdb.get_all_families_types(), 'Family Type'),
+    'categories_families_types': lambda propdb, job: propdb.get_categories_families_types(),
+    'data_by_categories': lambda propdb, job: propdb.get_data_by_categories(
+        _split(job.get('categories')), job['is_sub_family'], display_unit=job['display_unit']),
+    'data_by_cats_params': lambda propdb, job: propdb.get_data_by_categories_and_params(
+        _split(job.get('categories')), _split(job.get('parameters')), job['is_sub_family'],
+        display_unit=job['display_unit']),
+    'data_by_families': lambda propdb, job: propdb.get_data_by_families(
+        _split(job.get('families')), job['is_sub_family'], display_unit=job['display_unit']),
+    'data_by_family_types': lambda propdb, job: propdb.get_data_by_family_types(
+        _split(job.get('family_types')), display_unit=job['display_unit']),
+}
+
+
+def load_manifest(path):
+    """Read a YAML or JSON batch manifest."""
+    with open(path, 'r') as file:
+        if path.lower().endswith(('.yaml', '.yml')):
+            try:
+                import yaml
+            except ImportError:
+                raise click.ClickException("YAML manifests need PyYAML, install it with: pip install apsbot[yaml]")
+            return yaml.safe_load(file)
+        return json.load(file)
+
+
+def split_output(output, save_format=None):
+    """Split an output path into the path without extension and its save format.
+
+    An explicit save_format wins, then the extension of the path, then the export format setting.
+    """
+    name = output
+    extension = None
+    # longest first, so .csv.gz is not taken for .gz
+    for candidate in sorted(FORMATS[1:], key=len, reverse=True):
+        if output.lower().endswith('.' + candidate):
+            name = output[:-len(candidate) - 1]
+            extension = candidate
+            break
+    return name, save_format or extension or Config.load_export_format()
+
+
+def expand_jobs(manifest):
+    """Expand every manifest entry into one job per URN and extraction type."""
+    output_folder = manifest.get('output_folder') or Config.load_folder_path()
+    region = manifest.get('region') or Config.load_region()
+    for entry in [manifest] + manifest.get('jobs', []):
+        if entry.get('format') and str(entry['format']).lower() not in FORMATS:
+            raise click.ClickException(f"Unknown format: {entry['format']}, use one of {', '.join(FORMATS)}")
+    jobs = []
+    for entry in manifest.get('jobs', []):
+        urns = _split(entry.get('urns')) or _split(entry.get('urn'))
+        for urn in urns:
+            for extract in _split(entry.get('extract')):
+                job = dict(entry)
+                job.pop('urns', None)
+                job['urn'] = urn
+                job['extract'] = extract
+                job['region'] = entry.get('region') or region
+                job['is_sub_family'] = str(entry.get('is_sub_family', 'n')).lower() in ['y', 'true']
+                job['display_unit'] = str(entry.get('display_unit', 'n')).lower() in ['y', 'true']
+                key = PropDbCache.cache_key(urn, job['region'])[:8]
+                output = entry.get('output') or '{extract}-{key}'
+                output = os.path.join(output_folder, output.format(extract=extract, key=key, index=len(jobs)))
+                save_format = entry.get('format') or manifest.get('format')
+                job['output'], job['format'] = split_output(output, save_format and str(save_format).lower())
+                jobs.append(job)
+    return jobs
+
+
+def run_model_jobs(token, jobs):
+    """Run all jobs of one URN on a single property database. Return one status dict per job."""
+    statuses = []
+    propdb = None
+    for job in jobs:
+        status = {'urn': job['urn'], 'extract': job['extract'], 'output': job['output'], 'status': 'ok', 'rows': 0,
+                  'seconds': 0.0, 'error': None}
+        start = time.time()
+        try:
+            if job['extract'] not in EXTRACTIONS and job['extract'] != 'snapshot':
+                raise ValueError(f"Unknown extract type: {job['extract']}")
+            if propdb is None:
+                propdb = PropDbCache.load(job['urn'], token, job['region'])
+            if job['extract'] == 'snapshot':
+                status['rows'] = RevitSnapshot.build(propdb, job['urn'], job['region'], job['is_sub_family'],
+                                                     job['display_unit'])
+                status['output'] = RevitSnapshot.path(job['urn'], job['region'], job['is_sub_family'],
+                                                      job['display_unit'])
+            else:
+                df = EXTRACTIONS[job['extract']](propdb, job)
+                output = os.path.abspath(job['output'])
+                status['output'] = save_frame(df, os.path.basename(output), job['format'],
+                                              parameter_units(propdb, df.columns), os.path.dirname(output))
+                status['rows'] = len(df)
+        except Exception as e:
+            status['status'] = 'failed'
+            status['error'] = str(e)
+        status['seconds'] = round(time.time() - start, 2)
+        statuses.append(status)
+    return statuses
+
+
+@click.command()
+@click.option('--manifest', required=True, type=click.Path(exists=True, dir_okay=False),
+              help='The YAML or JSON job manifest.')
+@click.option('--workers', default=None, type=int, help='The number of models processed in parallel.')
+@click.option('--report', default=None, help='The path of the JSON status report.')
+@output_options
+def batch(manifest, workers, report, output, limit):
+    """Run many revit extractions from a job manifest in one process."""
+    data = load_manifest(manifest)
+    jobs = expand_jobs(data)
+    if not jobs:
+        click.echo("No jobs found in manifest.")
+        return
+    workers = workers or data.get('workers') or 4
+    token = TokenConfig.load_config()
+    TokenConfig.start_auto_refresh(token)
+    # group by model so each property database is loaded once and held by one worker
+    models = {}
+    for job in jobs:
+        models.setdefault((job['urn'], job['region']), []).append(job)
+    click.echo(f"Running {len(jobs)} jobs on {len(models)} models with {workers} workers.", err=True)
+    statuses = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(run_model_jobs, token, model_jobs) for model_jobs in models.values()]
+        for future in as_completed(futures):
+            for status in future.result():
+                statuses.append(status)
+                click.echo(f"[{len(statuses)}/{len(jobs)}] {status['status']} {status['extract']} "
+                           f"{status['urn']} ({status['seconds']}s)", err=True)
+    TokenConfig.stop_auto_refresh()
+    report = report or data.get('report') or os.path.join(Config.load_folder_path(), 'batch_report.json')
+    with open(report, 'w') as file:
+        json.dump(statuses, file, indent=4)
+    df = pd.DataFrame(statuses)[['extract', 'status', 'rows', 'seconds', 'output', 'error']]
+    show(df, output, limit)
+    click.echo(f"Batch report saved to {report}", err=True)
+    failed = len([s for s in statuses if s['status'] != 'ok'])
+    if failed:
+        raise click.ClickException(f"{failed} of {len(jobs)} jobs failed.")
@@ -3,8 +3,13 @@ from aps_toolkit import Bucket
 from .tokenconfig import TokenConfig
 from aps_toolkit.Bucket import PublicKey
 from .config import Config
+from .oss import OSS
+from .transfer import MultipartUpload, RangedDownload
 import json
-from tabulate import tabulate
+import os
+import time
+from .output import output_options, show, TableWriter
+import pandas as pd
 
 
 @click.command()
@@ -38,7 +43,8 @@ def bucket_create(bucket_name, bucket_key, region):
 # get all buckets
 @click.command()
 @click.option('--region', prompt='Region', default=lambda: Config.load_region(), help='The region of the bucket.')
-def buckets(region):
+@output_options
+def buckets(region, output, limit):
     """This command lists all buckets."""
     token = TokenConfig.load_config()
     Config.save_region(region)
@@ -47,7 +53,7 @@ def buckets(region):
     if df.empty:
         click.echo("No buckets found.")
         return
-    print(tabulate(df, headers="keys", tablefmt="psql"))
+    show(df, output, limit)
 
 
 # get objects
@@ -55,17 +61,24 @@ def buckets(region):
 @click.option('--bucket_name', prompt='Bucket Name', default=lambda: Config.load_bucket_object_name(),
               help='The key of the bucket.')
 @click.option('--region', prompt='Region', default=lambda: Config.load_region(), help='The region of the bucket.')
-def bucket_objects(bucket_name, region):
+@click.option('--prefix', default='', help='Only list objects whose name starts with the prefix.')
+@click.option('--page_size', default=100, type=int, help='The number of objects requested per page.')
+@output_options
+def bucket_objects(bucket_name, region, prefix, page_size, output, limit):
     """This command lists all objects in a bucket."""
     token = TokenConfig.load_config()
     Config.save_region(region)
     Config.save_bucket_name(bucket_name)
-    bucket = Bucket(token, region)
-    df = bucket.get_objects(bucket_name)
-    if df.empty:
-        click.echo("No objects found.")
-        return
-    print(tabulate(df, headers="keys", tablefmt="psql"))
+    oss = OSS(token, region)
+    writer = TableWriter(output, limit)
+    # rows are written as each page arrives, paging stops once the limit is reached
+    for page in oss.iter_objects(bucket_name, prefix or None, min(page_size, 100)):
+        writer.write(pd.DataFrame(page))
+        if writer.full:
+            break
+    writer.close()
+    if writer.rows == 0:
+        click.echo("No objects found.", err=True)
 
 
 # upload object bucket
@@ -75,18 +88,31 @@ def bucket_objects(bucket_name, region):
 @click.option('--region', prompt='Region', default=lambda: Config.load_region(), help='The region of the bucket.')
 @click.option('--object_name', prompt='Object Name',default=lambda: Config.load_bucket_object_name(), help='The name of the object.')
 @click.option('--file_path', prompt='File Path', help='The path of the file.')
-def bucket_upload_object(bucket_name, region, object_name, file_path):
+@click.option('--chunk_size', default=lambda: Config.load_chunk_size(), type=int, help='The size of each part in MB.')
+@click.option('--workers', default=lambda: Config.load_transfer_workers(), type=int,
+              help='The number of parts uploaded in parallel.')
+def bucket_upload_object(bucket_name, region, object_name, file_path, chunk_size, workers):
     """This command uploads an object to a bucket."""
+    if not os.path.isfile(file_path):
+        click.echo("Invalid file path.")
+        return
+    if chunk_size < 5:
+        click.echo("Chunk size must be at least 5 MB.")
+        return
     token = TokenConfig.load_config()
     Config.save_region(region)
     Config.save_bucket_object_name(object_name)
     Config.save_bucket_name(bucket_name)
-    bucket = Bucket(token, region)
-    result = bucket.upload_object(bucket_name, file_path, object_name)
+    upload = MultipartUpload(OSS(token, region), bucket_name, object_name, file_path, chunk_size, workers)
+    start = time.time()
+    with click.progressbar(length=upload.size, label=f"Uploading {upload.parts} parts") as bar:
+        result = upload.run(on_progress=bar.update)
     if not result:
         click.echo("Object upload failed.")
         return
-    click.echo("Object uploaded successfully!")
+    seconds = max(time.time() - start, 0.001)
+    click.echo(f"Object uploaded successfully! {upload.size / 1024 / 1024:.1f} MB in {seconds:.1f}s "
+               f"({upload.size / 1024 / 1024 / seconds:.1f} MB/s)")
     print(json.dumps(result, indent=4))
 
 
@@ -96,19 +122,31 @@ def bucket_upload_object(bucket_name, region, object_name, file_path):
               help='The key of the bucket.')
 @click.option('--region', prompt='Region', default=lambda: Config.load_region(), help='The region of the bucket.')
 @click.option('--object_name', prompt='Object Name',default=lambda: Config.load_bucket_object_name(), help='The name of the object.')
-@click.option('--file_path', prompt='File Path', help='The path of the file.')
-def bucket_download_object(bucket_name, region, object_name, file_path):
+@click.option('--file_path', prompt='File Path', help='The path of the file, use - to write to stdout.')
+@click.option('--chunk_size', default=lambda: Config.load_chunk_size(), type=int, help='The size of each range in MB.')
+@click.option('--workers', default=lambda: Config.load_transfer_workers(), type=int,
+              help='The number of ranges downloaded in parallel.')
+def bucket_download_object(bucket_name, region, object_name, file_path, chunk_size, workers):
     """This command downloads an object from a bucket."""
     token = TokenConfig.load_config()
     Config.save_region(region)
     Config.save_bucket_object_name(object_name)
     Config.save_bucket_name(bucket_name)
-    bucket = Bucket(token, region)
-    result = bucket.download_object(bucket_name, object_name, file_path)
-    if not result:
+    download = RangedDownload(OSS(token, region), bucket_name, object_name, file_path, chunk_size, workers)
+    size = download.prepare()
+    start = time.time()
+    if file_path == '-':
+        # stdout carries the data, keep everything else on stderr
+        download.stream(click.get_binary_stream('stdout'))
+        return
+    with click.progressbar(length=size, label="Downloading") as bar:
+        result = download.run(on_progress=bar.update)
+    if result is None:
         click.echo("Object download failed.")
         return
-    click.echo("Object downloaded successfully!")
+    seconds = max(time.time() - start, 0.001)
+    click.echo(f"Object downloaded successfully! {size / 1024 / 1024:.1f} MB in {seconds:.1f}s "
+               f"({size / 1024 / 1024 / seconds:.1f} MB/s)")
 
 
 # delete object
@@ -0,0 +1,237 @@
+import click
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from aps_toolkit import PropDbReaderRevit
+from .config import Config, atomic_write_json, file_lock
+from .dataset import DatasetCache
+from .httpcache import HttpCache
+from .output import output_options, show
+from .revitindex import RevitIndex
+from .trace import span
+import pandas as pd
+
+# file name in the svf resource -> attribute name on PropReader
+PROPDB_FILES = {
+    'objects_ids.json.gz': 'ids',
+    'objects_offs.json.gz': 'offsets',
+    'objects_avs.json.gz': 'avs',
+    'objects_attrs.json.gz': 'attrs',
+    'objects_vals.json.gz': 'vals',
+}
+
+
+class PropDbCache:
+    """Local LRU cache of downloaded property databases.
+
+    Each entry is a folder holding the five ``objects_*.json.gz`` files of one
+    derivative, so it can be read back with ``PropReader.read_from_json_gzip_files``.
+    A derivative URN already encodes the item version, so URN plus region is
+    enough to address an immutable database.
+    """
+    index_name = 'index.json'
+    _lock = threading.Lock()
+
+    @classmethod
+    def cache_key(cls, urn, region):
+        """Build the cache key of a derivative URN in a region."""
+        return hashlib.sha1(f"{str(region).upper()}:{urn}".encode('utf-8')).hexdigest()
+
+    @classmethod
+    def load(cls, urn, token, region):
+        """Return a PropDbReaderRevit for the urn, downloading it only on a cache miss."""
+        key = cls.cache_key(urn, region)
+        folder = os.path.join(Config.load_cache_folder(), key)
+        with cls._lock, file_lock(cls._index_path()):
+            index = cls._load_index()
+            entry = index.get(key)
+            if entry is not None and cls._is_complete(folder):
+                entry['last_access'] = time.time()
+                cls._save_index(index)
+            else:
+                entry = None
+        if entry is not None:
+            with span('read cached property database', 'parse', urn=urn):
+                propdb = PropDbReaderRevit.read_from_json_gzip_files(
+                    *[os.path.join(folder, name) for name in PROPDB_FILES])
+            propdb.host = "https://developer.api.autodesk.com"
+            propdb.urn = urn
+            propdb.token = token
+            propdb.region = region
+            RevitIndex.attach(propdb, urn, region)
+            return propdb
+        with span('download property database', 'parse', urn=urn):
+            propdb = PropDbReaderRevit(urn, token, region)
+        cls.store(urn, region, propdb)
+        RevitIndex.attach(propdb, urn, region)
+        return propdb
+
+    @classmethod
+    def store(cls, urn, region, propdb):
+        """Write the property database of a reader into the cache."""
+        key = cls.cache_key(urn, region)
+        cache_folder = Config.load_cache_folder()
+        folder = os.path.join(cache_folder, key)
+        # write into a temp folder first so a crash never leaves a half entry
+        temp_folder = folder + f'.tmp{os.getpid()}.{threading.get_ident()}'
+        os.makedirs(temp_folder, exist_ok=True)
+        size = 0
+        for name, attribute in PROPDB_FILES.items():
+            data = gzip.compress(json.dumps(getattr(propdb, attribute)).encode('utf-8'), compresslevel=1)
+            with open(os.path.join(temp_folder, name), 'wb') as file:
+                file.write(data)
+            size += len(data)
+        with cls._lock, file_lock(cls._index_path()):
+            if os.path.exists(folder):
+                shutil.rmtree(folder, ignore_errors=True)
+            os.replace(temp_folder, folder)
+            index = cls._load_index()
+            pinned = index.get(key, {}).get('pinned', False)
+            index[key] = {
+                'urn': urn,
+                'region': region,
+                'size': size,
+                'created': time.time(),
+                'last_access': time.time(),
+                'pinned': pinned,
+            }
+            cls._evict(index, Config.load_cache_max_size() * 1024 * 1024)
+            cls._save_index(index)
+
+    @classmethod
+    def entries(cls):
+        """Return the cache index as a DataFrame, most recently used first."""
+        with cls._lock, file_lock(cls._index_path()):
+            index = cls._load_index()
+        rows = []
+        for key, entry in index.items():
+            rows.append({
+                'key': key,
+                'urn': entry['urn'],
+                'region': entry['region'],
+                'size_mb': round(entry['size'] / 1024 / 1024, 2),
+                'last_access': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(entry['last_access'])),
+                'pinned': entry['pinned'],
+            })
+        df = pd.DataFrame(rows)
+        if not df.empty:
+            df = df.sort_values(by='last_access', ascending=False).reset_index(drop=True)
+        return df
+
+    @classmethod
+    def pin(cls, urn, region, pinned=True):
+        """Pin or unpin an entry so LRU eviction skips it. Return False if it is not cached."""
+        key = cls.cache_key(urn, region)
+        with cls._lock, file_lock(cls._index_path()):
+            index = cls._load_index()
+            if key not in index:
+                return False
+            index[key]['pinned'] = pinned
+            cls._save_index(index)
+        return True
+
+    @classmethod
+    def prune(cls, max_size_mb, include_pinned=False):
+        """Evict least recently used entries until the cache fits max_size_mb. Return the removed keys."""
+        with cls._lock, file_lock(cls._index_path()):
+            index = cls._load_index()
+            removed = cls._evict(index, max_size_mb * 1024 * 1024, include_pinned)
+            cls._save_index(index)
+        return removed
+
+    @classmethod
+    def _evict(cls, index, max_size, include_pinned=False):
+        total = sum(entry['size'] for entry in index.values())
+        candidates = sorted(index.items(), key=lambda item: item[1]['last_access'])
+        removed = []
+        for key, entry in candidates:
+            if total <= max_size:
+                break
+            if entry['pinned'] and not include_pinned:
+                continue
+            shutil.rmtree(os.path.join(Config.load_cache_folder(), key), ignore_errors=True)
+            total -= entry['size']
+            del index[key]
+            removed.append(key)
+        return removed
+
+    @classmethod
+    def _is_complete(cls, folder):
+        return all(os.path.exists(os.path.join(folder, name)) for name in PROPDB_FILES)
+
+    @classmethod
+    def _index_path(cls):
+        return os.path.join(Config.load_cache_folder(), cls.index_name)
+
+    @classmethod
+    def _load_index(cls):
+        path = cls._index_path()
+        if not os.path.exists(path):
+            return {}
+        with open(path, 'r') as file:
+            return json.load(file)
+
+    @classmethod
+    def _save_index(cls, index):
+        atomic_write_json(cls._index_path(), index)
+
+
+@click.group()
+def cache():
+    """Manage the local cache of downloaded property databases."""
+    pass
+
+
+@cache.command('list')
+@output_options
+def cache_list(output, limit):
+    """List all cached property databases."""
+    df = PropDbCache.entries()
+    if df.empty:
+        click.echo("Cache is empty.")
+        return
+    show(df, output, limit)
+    click.echo(f"Total size: {round(df['size_mb'].sum(), 2)} MB in {Config.load_cache_folder()}", err=True)
+
+
+@cache.command('prune')
+@click.option('--max_size', prompt='Max Size(MB)', default=lambda: Config.load_cache_max_size(), type=int,
+              help='The maximum cache size in MB, use 0 to remove all unpinned entries.')
+@click.option('--include_pinned', prompt='Include Pinned(y/n)', default='n', help='Also evict pinned entries.')
+def cache_prune(max_size, include_pinned):
+    """Evict least recently used property databases until the cache fits the size."""
+    Config.save_cache_max_size(max_size)
+    removed = PropDbCache.prune(max_size, str.lower(include_pinned) == 'y')
+    click.echo(f"Removed {len(removed)} cache entries.")
+
+
+@cache.command('pin')
+@click.option('--urn', prompt='URN', default=lambda: Config.load_derivative_urn(),
+              help='The derivative urn of the item version.')
+@click.option('--region', prompt='Region', default=lambda: Config.load_region(), help='The region of the item.')
+@click.option('--unpin', prompt='Unpin(y/n)', default='n', help='Unpin the entry instead.')
+def cache_pin(urn, region, unpin):
+    """Pin a cached property database so it is never evicted."""
+    pinned = str.lower(unpin) != 'y'
+    if not PropDbCache.pin(urn, region, pinned):
+        click.echo("URN is not in the cache, run a revit command first.")
+        return
+    click.echo(f"Cache entry has been {'pinned' if pinned else 'unpinned'}.")
+
+
+@cache.command('clear-http')
+def cache_clear_http():
+    """Remove all cached Data Management responses."""
+    HttpCache.clear()
+    click.echo("HTTP cache has been cleared.")
+
+
+@cache.command('clear-data')
+def cache_clear_data():
+    """Remove the prepared data files of chat_data."""
+    DatasetCache.clear()
+    click.echo("Prepared data cache has been cleared.")
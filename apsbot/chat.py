@@ -1,11 +1,12 @@
 import click
 import os
-import pandas as pd
 from langchain_experimental.agents.agent_toolkits import create_pandas_dataframe_agent
 from langchain_openai import OpenAI
 from .config import Config
+from .dataset import DatasetCache
 import openai
 
+
 @click.command()
 @click.option('--model_name', prompt='Model', default=lambda: Config.load_ai_model(), help='The model to use.')
 def chat(model_name):
@@ -32,7 +33,9 @@ def chat(model_name):
 @click.command()
 @click.option('--folder_path', prompt='Folder Path', default=lambda: Config.load_folder_path(), help='The folder path.')
 @click.option('--model_name', prompt='Model', default=lambda: Config.load_ai_model(), help='The model to use.')
-def chat_data(folder_path, model_name):
+@click.option('--workers', default=lambda: Config.load_data_workers(), type=int,
+              help='The number of data files read in parallel.')
+def chat_data(folder_path, model_name, workers):
     """This command starts a chat with knowledge based on data in the specified folder."""
     click.echo("Starting chat with the bot. Type 'exit' to end the chat.")
     if not os.path.exists(folder_path):
@@ -41,7 +44,7 @@ def chat_data(folder_path, model_name):
     # Read and process CSV files in the specified folder
     Config.save_folder_path(folder_path)
     Config.save_ai_model(model_name)
-    dfs = read_and_process_csv(folder_path)
+    dfs = read_and_process_csv(folder_path, workers)
     while True:
         user_input = input("You: ")
         if user_input.lower() == 'exit':
@@ -52,10 +55,12 @@ def chat_data(folder_path, model_name):
         click.echo(f"Bot: {bot_response}")
 
 
-def read_and_process_csv(folder_path):
-    # List all CSV files in the specified folder
-    dataframes = [pd.read_csv(os.path.join(folder_path, file)) for file in os.listdir(folder_path) if
-                  file.endswith('.csv')]
+def read_and_process_csv(folder_path, workers=None):
+    # Load all files saved with --save_data in the specified folder, unchanged ones from the prepared cache
+    dataset = DatasetCache(folder_path, workers)
+    dataframes = dataset.load()
+    click.echo(f"Loaded {len(dataframes)} data files, {dataset.reused} from the prepared cache and "
+               f"{dataset.read} read again.")
     return dataframes
 
 
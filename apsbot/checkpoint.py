@@ -0,0 +1,104 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+from .config import Config, atomic_write_json
+from .export import save_frame, read_frame, _has_pyarrow
+
+# a running extraction saves a partition after this many rows or seconds, whichever comes first
+FLUSH_ROWS = 5000
+FLUSH_SECONDS = 30
+# models with at least this many elements keep their partitions on disk even without --resume
+PERSIST_ELEMENTS = 200000
+
+
+class Checkpoint:
+    """Partitions and cursor of a long extraction, kept so an interrupted run can resume.
+
+    A checkpoint lives in ``<folder>/_checkpoints/<name>-<key>`` where the key hashes the
+    job options, so only a run with the same options picks it up. Each partition file is
+    written before the state that lists it, so the state never names a missing partition.
+    With ``persist=False`` the partitions are only kept in memory, for runs too short to
+    be worth resuming.
+    """
+    folder_name = '_checkpoints'
+    state_name = 'state.json'
+
+    def __init__(self, name, job, resume=False, folder=None, persist=True):
+        key = hashlib.sha1(json.dumps(job, sort_keys=True, default=str).encode('utf-8')).hexdigest()[:12]
+        self.path = os.path.join(folder or Config.load_folder_path(), self.folder_name, f"{name}-{key}")
+        self.persist = persist
+        self._frames = {}
+        self.state = self._load() if resume else None
+        self.resumed = self.state is not None
+        if self.state is None:
+            # a run that does not resume starts over
+            shutil.rmtree(self.path, ignore_errors=True)
+            self.state = {'name': name, 'job': job, 'partitions': [], 'cursor': None, 'units': {}}
+        self._flushed_at = time.time()
+
+    @property
+    def cursor(self):
+        return self.state['cursor']
+
+    @property
+    def units(self):
+        return self.state['units']
+
+    def rows(self, key=None):
+        """Rows saved so far, or in the partitions of key."""
+        return sum(partition['rows'] for partition in self.state['partitions']
+                   if key is None or partition['key'] == key)
+
+    def done(self, key):
+        """Check whether the partition of key was saved by this run or the one it resumes."""
+        return any(partition['key'] == key for partition in self.state['partitions'])
+
+    def due(self, rows):
+        """Check whether the work buffered since the last partition, rows of it, is worth saving now."""
+        return rows >= FLUSH_ROWS or time.time() - self._flushed_at >= FLUSH_SECONDS
+
+    def save(self, key, df, cursor=None, units=None):
+        """Save the rows of a finished partition, then record it with the cursor to resume from."""
+        partitions = self.state['partitions']
+        file_name = None
+        if len(df):
+            name = f"part-{len(partitions):05d}"
+            if self.persist:
+                file_path = save_frame(df, name, 'parquet' if _has_pyarrow() else 'csv', folder=self.path)
+                file_name = os.path.basename(file_path)
+            else:
+                file_name = name
+                self._frames[name] = df
+        partitions.append({'key': key, 'file': file_name, 'rows': len(df)})
+        if cursor is not None:
+            self.state['cursor'] = cursor
+        self.state['units'].update(units or {})
+        self.state['saved'] = time.time()
+        if self.persist:
+            atomic_write_json(os.path.join(self.path, self.state_name), self.state)
+        self._flushed_at = time.time()
+
+    def frames(self):
+        """Yield the saved partitions in the order they were saved."""
+        for partition in self.state['partitions']:
+            if partition['file'] in self._frames:
+                yield self._frames[partition['file']]
+            elif partition['file']:
+                yield read_frame(os.path.join(self.path, partition['file']))
+
+    def clear(self):
+        """Remove the checkpoint once the extraction is complete."""
+        self._frames = {}
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def _load(self):
+        path = os.path.join(self.path, self.state_name)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r') as file:
+                return json.load(file)
+        except ValueError:
+            return None
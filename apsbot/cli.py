@@ -1,58 +1,143 @@
-from .acc import *
-from .auth import *
-from .bucket import *
-from .chat import *
-from .revit import *
-from .settings import *
-from .webhook import *
-
-@click.group()
-def apsbot():
+import importlib
+import sys
+import click
+
+
+class LazyGroup(click.Group):
+    """Click group that imports the module of a command only when the command is used.
+
+    Names and help text are registered up front, so ``apsbot --help`` never imports
+    pandas, aps_toolkit or langchain.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # command name -> (module, attribute, help)
+        self.lazy_commands = {}
+
+    def add_lazy_command(self, module_name, attribute, help):
+        """Register a command by the module and attribute it lives in."""
+        name = attribute.lower().replace('_', '-')
+        self.lazy_commands[name] = (module_name, attribute, help)
+
+    def list_commands(self, ctx):
+        return sorted(set(self.commands) | set(self.lazy_commands))
+
+    def get_command(self, ctx, cmd_name):
+        if cmd_name not in self.commands and cmd_name in self.lazy_commands:
+            module_name, attribute, _ = self.lazy_commands[cmd_name]
+            module = importlib.import_module(module_name, __package__)
+            self.add_command(getattr(module, attribute), cmd_name)
+            # commands that use aps_toolkit get its calls pooled and retried
+            if 'aps_toolkit' in sys.modules:
+                importlib.import_module('.session', __package__).install_session()
+        return super().get_command(ctx, cmd_name)
+
+    def format_commands(self, ctx, formatter):
+        names = self.list_commands(ctx)
+        if not names:
+            return
+        limit = formatter.width - 6 - max(len(name) for name in names)
+        rows = []
+        for name in names:
+            if name in self.commands:
+                command = self.commands[name]
+                if command.hidden:
+                    continue
+                rows.append((name, command.get_short_help_str(limit)))
+            else:
+                rows.append((name, click.utils.make_default_short_help(self.lazy_commands[name][2], limit)))
+        with formatter.section("Commands"):
+            formatter.write_dl(rows)
+
+
+@click.group(cls=LazyGroup)
+@click.option('--profile', is_flag=True, envvar='APSBOT_TRACE',
+              help='Time each stage of the command, print a summary and save a Chrome trace.')
+@click.option('--cprofile', is_flag=True, envvar='APSBOT_CPROFILE',
+              help='Also run the command under cProfile and save its stats.')
+@click.option('--trace_file', envvar='APSBOT_TRACE_FILE', default=None,
+              help='The Chrome trace file, by default under traces in the default folder.')
+@click.pass_context
+def apsbot(ctx, profile, cprofile, trace_file):
     """Welcome to CLI apsbot! This CLI tool is used to interact with the Autodesk Platform Services(Former Autodesk Forge) API."""
-    pass
+    if profile or cprofile:
+        from .trace import Tracer, instrument_toolkit
+        Tracer.start(ctx.invoked_subcommand, cprofile)
+        # the subcommand is resolved before this callback, so the toolkit readers are wrapped only now
+        instrument_toolkit()
+        ctx.call_on_close(lambda: Tracer.finish(trace_file))
 
 
 # settings
-apsbot.add_command(set_folder)
+apsbot.add_lazy_command('.settings', 'set_folder', 'This command sets the default folder for saving data.')
+apsbot.add_lazy_command('.settings', 'set_token_margin',
+                        'This command sets how long before expiry a saved token is refreshed.')
+apsbot.add_lazy_command('.settings', 'set_http_cache_ttl',
+                        'This command sets how long cached responses of an endpoint are used without revalidation.')
+apsbot.add_lazy_command('.settings', 'set_export_format', 'This command sets the default file format of saved data.')
 
 # auth
-apsbot.add_command(auth2leg)
-apsbot.add_command(auth3leg)
-apsbot.add_command(login)
-apsbot.add_command(show_ports)
-apsbot.add_command(refresh_token)
+apsbot.add_lazy_command('.auth', 'auth2leg',
+                        'This command authenticates with 2-legged OAuth and copies the token to the clipboard.')
+apsbot.add_lazy_command('.auth', 'auth3leg',
+                        'This command authenticates with 3-legged OAuth and copies the token to the clipboard.')
+apsbot.add_lazy_command('.auth', 'login', 'This command logs in to the Autodesk Platform Services.')
+apsbot.add_lazy_command('.auth', 'show_ports',
+                        'This command displays all network ports currently in use on the system.')
+apsbot.add_lazy_command('.auth', 'refresh_token', 'This command refreshes the access token.')
 # bucket
-apsbot.add_command(buckets)
-apsbot.add_command(bucket_create)
-apsbot.add_command(bucket_objects)
-apsbot.add_command(bucket_delete_object)
-apsbot.add_command(bucket_upload_object)
-apsbot.add_command(bucket_download_object)
+apsbot.add_lazy_command('.bucket', 'buckets', 'This command lists all buckets.')
+apsbot.add_lazy_command('.bucket', 'bucket_create', 'This command creates a new bucket.')
+apsbot.add_lazy_command('.bucket', 'bucket_objects', 'This command lists all objects in a bucket.')
+apsbot.add_lazy_command('.bucket', 'bucket_delete_object', 'This command deletes an object from a bucket.')
+apsbot.add_lazy_command('.bucket', 'bucket_upload_object', 'This command uploads an object to a bucket.')
+apsbot.add_lazy_command('.bucket', 'bucket_download_object', 'This command downloads an object from a bucket.')
+apsbot.add_lazy_command('.sync', 'bucket_sync',
+                        'This command syncs a local folder with a bucket, transferring only changed files.')
 
 # acc
-apsbot.add_command(parse_url)
-apsbot.add_command(hubs)
-apsbot.add_command(projects)
-apsbot.add_command(top_folders)
-apsbot.add_command(items)
-apsbot.add_command(item_versions)
+apsbot.add_lazy_command('.acc', 'parse_url', 'This command parses the URL to see the detail information of the URL.')
+apsbot.add_lazy_command('.acc', 'hubs', 'This command lists all hubs.')
+apsbot.add_lazy_command('.acc', 'projects', 'Get batch all projects with general information by hub_id')
+apsbot.add_lazy_command('.acc', 'top_folders',
+                        'Get batch all top folders with general information by hub_id and project_id')
+apsbot.add_lazy_command('.acc', 'items', 'Get batch all items with general information by project_id and folder_id')
+apsbot.add_lazy_command('.acc', 'item_versions',
+                        'Get batch all item versions with general information by project_id and item_id')
+apsbot.add_lazy_command('.inventory', 'hub_inventory',
+                        'Update the local inventory of a hub and show what was added, changed or removed.')
+apsbot.add_lazy_command('.versions', 'hub_versions',
+                        'Report the version history of every item in every project of a hub.')
 
 # revit
-apsbot.add_command(revit_categories)
-apsbot.add_command(revit_parameters)
-apsbot.add_command(revit_families)
-apsbot.add_command(revit_family_types)
-apsbot.add_command(revit_categories_families_types)
-apsbot.add_command(data_revit_by_categories)
-apsbot.add_command(data_revit_by_cats_params)
-apsbot.add_command(data_revit_by_family)
-apsbot.add_command(data_revit_by_family_types)
+apsbot.add_lazy_command('.revit', 'revit_categories', 'Read all categories by urn.')
+apsbot.add_lazy_command('.revit', 'revit_parameters', 'Read all parameters by urn.')
+apsbot.add_lazy_command('.revit', 'revit_families', 'Read all families by urn.')
+apsbot.add_lazy_command('.revit', 'revit_family_types', 'Read all family types by urn.')
+apsbot.add_lazy_command('.revit', 'revit_categories_families_types',
+                        'Read all categories, families, and family types by urn.')
+apsbot.add_lazy_command('.revit', 'data_revit_by_categories', 'Read Revit data by categories.')
+apsbot.add_lazy_command('.revit', 'data_revit_by_cats_params', 'Read Revit data by categories and parameters.')
+apsbot.add_lazy_command('.revit', 'data_revit_by_family', 'Read Revit data by family.')
+apsbot.add_lazy_command('.revit', 'data_revit_by_family_types', 'Read Revit data by family types.')
+apsbot.add_lazy_command('.query', 'revit_query', 'Read the Revit elements matching a query by urn.')
+apsbot.add_lazy_command('.diff', 'revit_diff', 'Compare the elements of two versions of a Revit model.')
+apsbot.add_lazy_command('.snapshot', 'revit_snapshot',
+                        'Snapshot all Revit data by urn so data_revit commands read it without the property database.')
+
+# cache
+apsbot.add_lazy_command('.cache', 'cache', 'Manage the local cache of downloaded property databases.')
+
+# batch
+apsbot.add_lazy_command('.batch', 'batch', 'Run many revit extractions from a job manifest in one process.')
 
 # webhook
-apsbot.add_command(webhooks_get_all)
-apsbot.add_command(webhook_get_by_id)
-apsbot.add_command(webhook_create)
-apsbot.add_command(webhook_delete)
+apsbot.add_lazy_command('.webhook', 'webhooks_get_all', 'This command lists all webhooks.')
+apsbot.add_lazy_command('.webhook', 'webhook_get_by_id', 'Get webhook by id from user input')
+apsbot.add_lazy_command('.webhook', 'webhook_create', 'This command lists all webhooks.')
+apsbot.add_lazy_command('.webhook', 'webhook_delete', 'This command deletes a webhook.')
 # chat
-apsbot.add_command(chat)
-apsbot.add_command(chat_data)
\ No newline at end of file
+apsbot.add_lazy_command('.chat', 'chat', 'This command starts a chat session with the bot.')
+apsbot.add_lazy_command('.chat', 'chat_data',
+                        'This command starts a chat with knowledge based on data in the specified folder.')
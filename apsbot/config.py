@@ -1,9 +1,65 @@
+import atexit
+import contextlib
 import json
 import os
+import tempfile
+import threading
 import uuid as guid
 
+
+@contextlib.contextmanager
+def file_lock(path):
+    """Hold an exclusive lock on a side-car lock file, so parallel processes take turns."""
+    lock_path = path + '.lock'
+    folder = os.path.dirname(os.path.abspath(lock_path))
+    os.makedirs(folder, exist_ok=True)
+    with open(lock_path, 'a+') as lock_file:
+        if os.name == 'nt':
+            import msvcrt
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def atomic_write_json(path, data):
+    """Write JSON to a temp file next to path and rename it over path, readers never see half a file."""
+    folder = os.path.dirname(os.path.abspath(path))
+    os.makedirs(folder, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(prefix=os.path.basename(path) + '.', suffix='.tmp', dir=folder)
+    try:
+        with os.fdopen(fd, 'w') as file:
+            # save indent for easy read
+            json.dump(data, file, indent=4)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
 class Config:
+    """Settings stored in config.json.
+
+    The file is read once per process into memory, getters and setters work on that
+    view and the changed keys are merged into the file once at exit.
+    """
     config_path = 'config.json'
+    _data = None
+    _changes = {}
+    _lock = threading.RLock()
 
     @classmethod
     def save_folder_path(cls, path):
@@ -146,6 +202,16 @@ class Config:
         """Load the list of Revit parameters from a JSON file."""
         return cls._load_from_config('REVIT_PARAMETERS')
 
+    @classmethod
+    def save_revit_query(cls, revit_query):
+        """Save the last Revit query to a JSON file."""
+        cls._save_to_config('REVIT_QUERY', revit_query)
+
+    @classmethod
+    def load_revit_query(cls):
+        """Load the last Revit query from a JSON file."""
+        return cls._load_from_config('REVIT_QUERY')
+
     @classmethod
     def save_region(cls, region):
         """Save the default region to a JSON file."""
@@ -182,26 +248,184 @@ class Config:
         return model
 
     @classmethod
-    def _save_to_config(cls, key, value):
-        """Generic save method for any configuration setting."""
-        if not os.path.exists(cls.config_path):
-            config_data = {}
-        else:
-            with open(cls.config_path, 'r') as file:
-                config_data = json.load(file)
+    def save_token_margin(cls, seconds):
+        """Save the token expiry safety margin in seconds to a JSON file."""
+        cls._save_to_config('TOKEN_EXPIRY_MARGIN', seconds)
 
-        config_data[key] = value
+    @classmethod
+    def load_token_margin(cls):
+        """Load the token expiry safety margin in seconds from a JSON file."""
+        seconds = cls._load_from_config('TOKEN_EXPIRY_MARGIN')
+        if seconds is None or seconds == '':
+            return 300
+        return int(seconds)
 
-        with open(cls.config_path, 'w') as file:
-            # save indent for easy read
-            json.dump(config_data, file, indent=4)
+    @classmethod
+    def save_cache_folder(cls, path):
+        """Save the property database cache folder to a JSON file."""
+        cls._save_to_config('CACHE_FOLDER', path)
 
     @classmethod
-    def _load_from_config(cls, key):
-        """Generic load method for any configuration setting."""
-        if not os.path.exists(cls.config_path):
-            return None
+    def load_cache_folder(cls):
+        """Load the property database cache folder from a JSON file."""
+        folder = cls._load_from_config('CACHE_FOLDER')
+        if folder is None or folder == '':
+            return os.path.join(os.path.expanduser('~'), '.apsbot', 'cache')
+        return folder
+
+    @classmethod
+    def save_cache_max_size(cls, max_size):
+        """Save the maximum cache size in MB to a JSON file."""
+        cls._save_to_config('CACHE_MAX_SIZE', max_size)
+
+    @classmethod
+    def load_cache_max_size(cls):
+        """Load the maximum cache size in MB from a JSON file."""
+        max_size = cls._load_from_config('CACHE_MAX_SIZE')
+        if max_size is None or max_size == '':
+            return 5120
+        return int(max_size)
+
+    @classmethod
+    def save_chunk_size(cls, chunk_size):
+        """Save the transfer chunk size in MB to a JSON file."""
+        cls._save_to_config('CHUNK_SIZE', chunk_size)
+
+    @classmethod
+    def load_chunk_size(cls):
+        """Load the transfer chunk size in MB from a JSON file."""
+        chunk_size = cls._load_from_config('CHUNK_SIZE')
+        if chunk_size is None or chunk_size == '':
+            return 16
+        return int(chunk_size)
+
+    @classmethod
+    def save_transfer_workers(cls, workers):
+        """Save the number of parallel transfer workers to a JSON file."""
+        cls._save_to_config('TRANSFER_WORKERS', workers)
+
+    @classmethod
+    def load_transfer_workers(cls):
+        """Load the number of parallel transfer workers from a JSON file."""
+        workers = cls._load_from_config('TRANSFER_WORKERS')
+        if workers is None or workers == '':
+            return 8
+        return int(workers)
+
+    @classmethod
+    def save_crawl_workers(cls, workers):
+        """Save the number of parallel Data Management requests to a JSON file."""
+        cls._save_to_config('CRAWL_WORKERS', workers)
+
+    @classmethod
+    def load_crawl_workers(cls):
+        """Load the number of parallel Data Management requests from a JSON file."""
+        workers = cls._load_from_config('CRAWL_WORKERS')
+        if workers is None or workers == '':
+            return 8
+        return int(workers)
+
+    @classmethod
+    def save_model_workers(cls, workers):
+        """Save the number of models extracted in parallel processes to a JSON file."""
+        cls._save_to_config('MODEL_WORKERS', workers)
+
+    @classmethod
+    def load_model_workers(cls):
+        """Load the number of models extracted in parallel processes from a JSON file."""
+        workers = cls._load_from_config('MODEL_WORKERS')
+        if workers is None or workers == '':
+            return min(4, os.cpu_count() or 1)
+        return int(workers)
+
+    @classmethod
+    def save_model_memory(cls, max_memory):
+        """Save the memory cap in MB of each model extraction process to a JSON file."""
+        cls._save_to_config('MODEL_MEMORY', max_memory)
+
+    @classmethod
+    def load_model_memory(cls):
+        """Load the memory cap in MB of each model extraction process from a JSON file, 0 for none."""
+        max_memory = cls._load_from_config('MODEL_MEMORY')
+        if max_memory is None or max_memory == '':
+            return 0
+        return int(max_memory)
 
+    @classmethod
+    def save_data_workers(cls, workers):
+        """Save the number of data files chat_data reads in parallel to a JSON file."""
+        cls._save_to_config('DATA_WORKERS', workers)
+
+    @classmethod
+    def load_data_workers(cls):
+        """Load the number of data files chat_data reads in parallel from a JSON file."""
+        workers = cls._load_from_config('DATA_WORKERS')
+        if workers is None or workers == '':
+            return min(8, os.cpu_count() or 1)
+        return int(workers)
+
+    @classmethod
+    def save_http_cache_ttl(cls, endpoint, seconds):
+        """Save the HTTP cache time to live in seconds of one endpoint to a JSON file."""
+        ttls = cls.load_http_cache_ttls()
+        ttls[endpoint] = seconds
+        cls._save_to_config('HTTP_CACHE_TTL', ttls)
+
+    @classmethod
+    def load_http_cache_ttls(cls):
+        """Load the HTTP cache time to live in seconds by endpoint from a JSON file."""
+        return dict(cls._load_from_config('HTTP_CACHE_TTL') or {})
+
+    @classmethod
+    def save_export_format(cls, save_format):
+        """Save the file format of saved data to a JSON file."""
+        cls._save_to_config('EXPORT_FORMAT', save_format)
+
+    @classmethod
+    def load_export_format(cls):
+        """Load the file format of saved data from a JSON file."""
+        save_format = cls._load_from_config('EXPORT_FORMAT')
+        if save_format is None or save_format == '':
+            return 'auto'
+        return save_format
+
+    @classmethod
+    def flush(cls):
+        """Merge the changed keys into config.json with a locked, atomic write."""
+        with cls._lock:
+            if not cls._changes:
+                return
+            with file_lock(cls.config_path):
+                # re-read under the lock so keys written by other processes are kept
+                config_data = cls._read_file()
+                config_data.update(cls._changes)
+                atomic_write_json(cls.config_path, config_data)
+            cls._changes = {}
+            cls._data = config_data
+
+    @classmethod
+    def _view(cls):
+        if cls._data is None:
+            cls._data = cls._read_file()
+            atexit.register(cls.flush)
+        return cls._data
+
+    @classmethod
+    def _read_file(cls):
+        if not os.path.exists(cls.config_path):
+            return {}
         with open(cls.config_path, 'r') as file:
-            config_data = json.load(file)
-            return config_data.get(key)
+            return json.load(file)
+
+    @classmethod
+    def _save_to_config(cls, key, value):
+        """Generic save method for any configuration setting."""
+        with cls._lock:
+            cls._view()[key] = value
+            cls._changes[key] = value
+
+    @classmethod
+    def _load_from_config(cls, key):
+        """Generic load method for any configuration setting."""
+        with cls._lock:
+            return cls._view().get(key)
@@ -0,0 +1,159 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from .config import Config, atomic_write_json, file_lock
+from .export import read_frame, arrow_safe, _has_pyarrow
+from .trace import span
+
+# extensions of the files save_frame writes
+DATA_EXTENSIONS = ('.csv', '.csv.gz', '.parquet', '.feather', '.jsonl')
+# text columns with at most this share of distinct values become categories
+CATEGORY_RATIO = 0.5
+
+
+def downcast(df):
+    """Shrink every column of a DataFrame to the smallest dtype that holds its values."""
+    import pandas as pd
+    for column in df.columns:
+        series = df[column]
+        if isinstance(series.dtype, pd.CategoricalDtype) or series.dtype.kind == 'b':
+            continue
+        if series.dtype.kind in 'iu':
+            df[column] = pd.to_numeric(series, downcast='integer' if series.dtype.kind == 'i' else 'unsigned')
+        elif series.dtype.kind == 'f':
+            # float32 only when no value changes, ids and coordinates need every digit
+            smaller = series.astype('float32')
+            if ((smaller == series) | series.isna()).all():
+                df[column] = smaller
+        elif series.dtype.kind == 'O':
+            values = series.dropna()
+            if len(values) and pd.api.types.infer_dtype(values, skipna=True) == 'string' and \
+                    values.nunique() <= CATEGORY_RATIO * len(values):
+                df[column] = series.astype('category')
+    return df
+
+
+class DatasetCache:
+    """Prepared copies of the data files of a folder, so chat_data starts without parsing them again.
+
+    Every file is read and downcast once, then written as an uncompressed Arrow file under
+    ``<cache folder>/datasets/<folder key>``. Later loads memory-map that file while the
+    source keeps its mtime and size, and only read again the files that changed. Files
+    are read on a thread pool with the pyarrow CSV parser, which releases the GIL.
+    Without pyarrow the files are still read in parallel and downcast, but not kept.
+    """
+    folder_name = 'datasets'
+    index_name = 'index.json'
+
+    def __init__(self, folder_path, workers=None):
+        self.folder_path = os.path.abspath(folder_path)
+        self.workers = workers or Config.load_data_workers()
+        key = hashlib.sha1(os.path.realpath(folder_path).encode('utf-8')).hexdigest()[:16]
+        self.path = os.path.join(Config.load_cache_folder(), self.folder_name, key)
+        self.reused = 0
+        self.read = 0
+
+    def files(self):
+        """Names of the data files in the folder, in name order."""
+        return [name for name in sorted(os.listdir(self.folder_path))
+                if name.endswith(DATA_EXTENSIONS) and os.path.isfile(os.path.join(self.folder_path, name))]
+
+    def load(self):
+        """Return a DataFrame per data file of the folder, in file name order."""
+        names = self.files()
+        keep = _has_pyarrow()
+        index = self._load_index() if keep else {}
+        frames = {}
+        stale = []
+        for name in names:
+            stat = os.stat(os.path.join(self.folder_path, name))
+            entry = index.get(name)
+            if entry is not None and entry['mtime_ns'] == stat.st_mtime_ns and entry['size'] == stat.st_size:
+                try:
+                    frames[name] = self._read_prepared(entry)
+                    self.reused += 1
+                    continue
+                except (OSError, ValueError):
+                    # a missing or damaged prepared file is made again
+                    pass
+            stale.append((name, stat))
+        if stale:
+            with ThreadPoolExecutor(max_workers=max(1, min(self.workers, len(stale)))) as executor:
+                futures = {executor.submit(self._prepare, name, stat, keep): name for name, stat in stale}
+                for future in as_completed(futures):
+                    name = futures[future]
+                    frames[name], entry = future.result()
+                    if entry is not None:
+                        index[name] = entry
+                    self.read += 1
+        if keep:
+            for name in set(index) - set(names):
+                # the source file is gone
+                self._remove(index.pop(name))
+            self._save_index(index)
+        return [frames[name] for name in names]
+
+    @classmethod
+    def clear(cls):
+        """Remove the prepared files of every folder."""
+        shutil.rmtree(os.path.join(Config.load_cache_folder(), cls.folder_name), ignore_errors=True)
+
+    def _prepare(self, name, stat, keep):
+        with span('read data file', 'parse', file=name, bytes=stat.st_size):
+            df = downcast(read_frame(os.path.join(self.folder_path, name), 'pyarrow' if keep else None))
+        if not keep:
+            return df, None
+        entry = {
+            'file': hashlib.sha1(name.encode('utf-8')).hexdigest()[:16] + '.arrow',
+            'mtime_ns': stat.st_mtime_ns,
+            'size': stat.st_size,
+            'rows': len(df),
+        }
+        self._write_prepared(df, os.path.join(self.path, entry['file']))
+        # the mapped copy replaces the parsed one, which is freed
+        return self._read_prepared(entry), entry
+
+    def _write_prepared(self, df, path):
+        import pyarrow as pa
+        import pyarrow.ipc as ipc
+        table = pa.Table.from_pandas(arrow_safe(df), preserve_index=False)
+        os.makedirs(self.path, exist_ok=True)
+        temp_path = path + f'.tmp{os.getpid()}.{threading.get_ident()}'
+        with pa.OSFile(temp_path, 'wb') as sink, ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        os.replace(temp_path, path)
+
+    def _read_prepared(self, entry):
+        import pyarrow as pa
+        import pyarrow.ipc as ipc
+        path = os.path.join(self.path, entry['file'])
+        with span('map prepared file', 'parse', file=entry['file']):
+            table = ipc.open_file(pa.memory_map(path, 'r')).read_all()
+            return table.to_pandas(split_blocks=True)
+
+    def _remove(self, entry):
+        path = os.path.join(self.path, entry['file'])
+        if os.path.exists(path):
+            os.remove(path)
+
+    def _index_path(self):
+        return os.path.join(self.path, self.index_name)
+
+    def _load_index(self):
+        path = self._index_path()
+        if not os.path.exists(path):
+            return {}
+        with file_lock(path):
+            try:
+                with open(path, 'r') as file:
+                    return json.load(file).get('files', {})
+            except ValueError:
+                return {}
+
+    def _save_index(self, index):
+        path = self._index_path()
+        with file_lock(path):
+            atomic_write_json(path, {'folder': self.folder_path, 'files': index})
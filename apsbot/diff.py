@@ -0,0 +1,166 @@
+import click
+import hashlib
+import json
+import numpy as np
+from .tokenconfig import TokenConfig
+from .cache import PropDbCache
+from .config import Config
+from .output import output_options, show
+from .export import format_option, save_frame
+from .query import RevitQuery, IGNORED_PROPERTIES
+from .trace import traced
+
+# odd 64 bit constants that mix an attribute and a value hash into one pair hash
+MIX = np.uint64(0x9E3779B97F4A7C15)
+TYPE_MIX = np.uint64(0xBF58476D1CE4E5B9)
+DIFF_COLUMNS = ['change', 'external_id', 'old_dbId', 'new_dbId', 'Category', 'Name', 'parameter', 'old_value',
+                'new_value']
+
+
+def _hashes(texts):
+    return np.array([int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'little')
+                     for text in texts], dtype=np.uint64)
+
+
+def element_hashes(arrays, ids):
+    """One 64 bit hash per element of ids over its properties and the ones of its type.
+
+    Every attribute/value pair is hashed from its name and value, so two property
+    databases with different attribute and value tables hash the same element alike.
+    The pair hashes are summed per element, which does not depend on the pair order.
+    """
+    attr_hashes = _hashes(arrays.attr_names.astype(str).tolist())
+    value_hashes = _hashes([json.dumps(value, sort_keys=True, default=str) for value in arrays.propdb.vals])
+    pairs = attr_hashes[arrays.attrs] * MIX ^ value_hashes[arrays.values]
+    pairs ^= pairs >> np.uint64(31)
+    ignored = np.isin(arrays.attr_names[arrays.attrs], IGNORED_PROPERTIES)
+    own = _sum_by_owner(arrays, np.where(ignored, np.uint64(0), pairs))
+    typed = _sum_by_owner(arrays, np.where(arrays.type_attrs[arrays.attrs], pairs, np.uint64(0)))
+    types = arrays.instance_of[ids]
+    result = own[ids]
+    result[types >= 0] += typed[types[types >= 0]] * TYPE_MIX
+    return result
+
+
+def _sum_by_owner(arrays, pairs):
+    # the pairs of an element are one run starting at its offset
+    sums = np.zeros(arrays.count, dtype=np.uint64)
+    starts = arrays.offsets[:-1]
+    filled = starts < arrays.offsets[1:]
+    if len(pairs):
+        sums[filled] = np.add.reduceat(pairs, starts[filled])
+    return sums
+
+
+class RevitDiff:
+    """Compare the elements of two property databases of the same model.
+
+    Elements are matched by external id, which stays the same across versions while
+    dbIds do not. Only a hash per element is kept for the whole model; properties are
+    read back just for the added, removed and changed elements.
+    """
+
+    def __init__(self, old_propdb, new_propdb, is_sub_family=False):
+        self.old = RevitQuery(old_propdb)
+        self.new = RevitQuery(new_propdb)
+        self.is_sub_family = is_sub_family
+        self.counts = {}
+
+    @traced('diff', 'transform')
+    def run(self):
+        """Return a DataFrame with a row per added or removed element and per changed parameter."""
+        import pandas as pd
+        old_ids = self.old.element_ids(is_sub_family=self.is_sub_family)
+        new_ids = self.new.element_ids(is_sub_family=self.is_sub_family)
+        old_external = pd.Index([self.old.propdb.ids[i] for i in old_ids.tolist()])
+        new_external = pd.Index([self.new.propdb.ids[i] for i in new_ids.tolist()])
+        positions = old_external.get_indexer(new_external)
+        matched = positions >= 0
+        added = new_ids[~matched]
+        removed = old_ids[~np.isin(np.arange(len(old_ids)), positions[matched])]
+        old_hashes = element_hashes(self.old.arrays, old_ids[positions[matched]])
+        new_hashes = element_hashes(self.new.arrays, new_ids[matched])
+        changed = old_hashes != new_hashes
+        changed_old = old_ids[positions[matched]][changed]
+        changed_new = new_ids[matched][changed]
+        self.counts = {'added': len(added), 'removed': len(removed), 'changed': int(changed.sum())}
+        rows = self._element_rows('added', self.new, added) + self._element_rows('removed', self.old, removed)
+        rows += self._change_rows(changed_old, changed_new)
+        df = pd.DataFrame(rows, columns=DIFF_COLUMNS)
+        df[['old_dbId', 'new_dbId']] = df[['old_dbId', 'new_dbId']].astype('Int64')
+        return df
+
+    def _element_rows(self, change, engine, ids):
+        categories = engine.index_names('Category', ids)
+        names = engine.arrays.column('Name', ids)
+        db_column = 'new_dbId' if change == 'added' else 'old_dbId'
+        return [{'change': change, 'external_id': engine.propdb.ids[db_id], db_column: db_id, 'Category': category,
+                 'Name': name} for db_id, category, name in zip(ids.tolist(), categories, names)]
+
+    def _change_rows(self, old_ids, new_ids):
+        rows = []
+        categories = self.new.index_names('Category', new_ids)
+        for old_id, new_id, category in zip(old_ids.tolist(), new_ids.tolist(), categories):
+            old_properties = self.old.arrays.properties(old_id)
+            new_properties = self.new.arrays.properties(new_id)
+            for name in dict.fromkeys(list(old_properties) + list(new_properties)):
+                old_value, new_value = old_properties.get(name), new_properties.get(name)
+                if old_value == new_value:
+                    continue
+                rows.append({'change': 'changed', 'external_id': self.new.propdb.ids[new_id], 'old_dbId': old_id,
+                             'new_dbId': new_id, 'Category': category,
+                             'Name': new_properties.get('Name', old_properties.get('Name')), 'parameter': name,
+                             'old_value': old_value, 'new_value': new_value})
+        return rows
+
+
+def _version_urns(project_id, item_id, old, new):
+    """Derivative urns of two version numbers of an item."""
+    from aps_toolkit import BIM360
+    if not project_id or not item_id:
+        raise click.ClickException("Please provide a Project Id and Item Id to compare versions.")
+    versions = BIM360(TokenConfig.load_config()).batch_report_item_versions(project_id, item_id)
+    urns = dict(zip(versions['version'].astype(int), versions['derivative_urn']))
+    missing = [version for version in [old, new] if int(version) not in urns]
+    if missing:
+        raise click.ClickException(f"Item {item_id} has no translated version {', '.join(missing)}.")
+    return urns[int(old)], urns[int(new)]
+
+
+@click.command()
+@click.option('--old', prompt='Old URN or Version',
+              help='The derivative urn, or the version number of the item, to compare from.')
+@click.option('--new', prompt='New URN or Version',
+              help='The derivative urn, or the version number of the item, to compare to.')
+@click.option('--project_id', default=lambda: Config.load_project_id(),
+              help='The project id of the item when comparing version numbers.')
+@click.option('--item_id', default=lambda: Config.load_item_id(),
+              help='The item id when comparing version numbers.')
+@click.option('--region', prompt='Region', default=lambda: Config.load_region(), help='The region of the item.')
+@click.option('--is_sub_family', prompt='Is Sub Family(y/n)', default="n", help='The is sub family of the elements.')
+@click.option('--save_data', prompt='Save Data(y/n)', default='n', help='Save data to file.')
+@format_option
+@output_options
+def revit_diff(old, new, project_id, item_id, region, is_sub_family, save_data, save_format, output, limit):
+    """Compare the elements of two versions of a Revit model."""
+    if not old or not new:
+        click.echo("Please provide two urns or version numbers.")
+        return
+    Config.save_region(region)
+    if old.strip().isdigit() and new.strip().isdigit():
+        old, new = _version_urns(project_id, item_id, old.strip(), new.strip())
+    token = TokenConfig.load_config()
+    old_propdb = PropDbCache.load(old, token, region)
+    new_propdb = PropDbCache.load(new, token, region)
+    revit_diff = RevitDiff(old_propdb, new_propdb, str.lower(is_sub_family) == 'y')
+    df = revit_diff.run()
+    counts = revit_diff.counts
+    click.echo(f"{counts['added']} added, {counts['removed']} removed, {counts['changed']} changed elements.",
+               err=True)
+    if df.empty:
+        click.echo("No changes found.")
+        return
+    if str.lower(save_data) == 'y':
+        file_path = save_frame(df, 'revit_diff', save_format)
+        click.echo(f"Revit diff saved to {file_path}", err=True)
+    show(df, output, limit)
@@ -0,0 +1,164 @@
+import os
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from urllib.parse import quote
+from .session import shared_session
+
+ITEM_COLUMNS = ['project_id', 'folder_id', 'item_name', 'item_id', 'last_version', 'derivative_urn',
+                'last_modified_time']
+
+
+class DataManagement:
+    """Thread-safe client for the Data Management endpoints the crawlers need.
+
+    Requests go through the shared session, which retries 429 and 5xx responses and
+    refreshes the token on a 401.
+    """
+
+    def __init__(self, token, session=None, workers=8):
+        self.token = token
+        self.host = os.environ.get('APS_HOST', 'https://developer.api.autodesk.com').rstrip('/')
+        self.session = session or shared_session(workers)
+
+    def get(self, url, params=None):
+        """GET a Data Management url and return the JSON body."""
+        if not url.startswith('http'):
+            url = self.host + url
+        response = self.session.get(url, headers={'Authorization': f'Bearer {self.token.access_token}'},
+                                    params=params)
+        if response.status_code != 200:
+            raise Exception(response.reason)
+        return response.json()
+
+    def iter_pages(self, url, params=None):
+        """Yield every page of a paginated JSON:API endpoint."""
+        while url:
+            result = self.get(url, params)
+            yield result
+            url, params = result.get('links', {}).get('next', {}).get('href'), None
+
+    def get_folder_contents(self, project_id, folder_id, params=None):
+        """Return (subfolders, tip versions) of a folder across all pages."""
+        folders, versions = [], []
+        for page in self.iter_pages(f"/data/v1/projects/{project_id}/folders/{folder_id}/contents", params):
+            folders.extend(data for data in page.get('data', []) if data['type'] == 'folders')
+            versions.extend(page.get('included', []))
+        return folders, versions
+
+    def iter_projects(self, hub_id):
+        """Yield the project json of a hub across all pages."""
+        for page in self.iter_pages(f"/project/v1/hubs/{hub_id}/projects"):
+            yield from page.get('data', [])
+
+    def get_top_folders(self, hub_id, project_id):
+        """Return the top folder json of a project, each with its lastModifiedTimeRollup."""
+        return self.get(f"/project/v1/hubs/{hub_id}/projects/{project_id}/topFolders").get('data', [])
+
+    def search_folder(self, project_id, folder_id, since=None, include_hidden=True):
+        """Return (versions, {item id: parent folder id}) changed under a folder tree since a time."""
+        params = {}
+        if since:
+            params['filter[lastModifiedTime]-ge'] = since
+        if include_hidden:
+            params['includeHidden'] = 'true'
+        versions, parents = [], {}
+        for page in self.iter_pages(f"/data/v1/projects/{project_id}/folders/{folder_id}/search", params):
+            versions.extend(page.get('data', []))
+            for item in page.get('included', []):
+                parent = item.get('relationships', {}).get('parent', {}).get('data') or {}
+                parents[item['id']] = parent.get('id')
+        return versions, parents
+
+    def get_item_versions(self, project_id, item_id):
+        """Return every version json of an item, newest first."""
+        versions = []
+        for page in self.iter_pages(f"/data/v1/projects/{project_id}/items/{quote(item_id, safe='')}/versions"):
+            versions.extend(page.get('data', []))
+        return versions
+
+
+def version_row(project_id, folder_id, version):
+    """Flatten a tip version of a folder listing into an items row."""
+    relationships = version.get('relationships', {})
+    derivatives = relationships.get('derivatives', {}).get('data') or {}
+    return {
+        'project_id': project_id,
+        'folder_id': folder_id,
+        'item_name': version['attributes'].get('displayName'),
+        'item_id': relationships.get('item', {}).get('data', {}).get('id'),
+        'last_version': version['attributes'].get('versionNumber'),
+        'derivative_urn': derivatives.get('id'),
+        'last_modified_time': version['attributes'].get('lastModifiedTime'),
+    }
+
+
+def is_deleted(version):
+    """Check whether a version marks its item as deleted."""
+    return 'Deleted' in (version['attributes'].get('extension') or {}).get('type', '')
+
+
+def match_extension(name, extensions):
+    """Check a file name against a comma separated list of extensions, empty matches everything."""
+    extensions = [extension.strip().lstrip('.').lower() for extension in (extensions or '').split(',')]
+    extensions = [extension for extension in extensions if extension]
+    return not extensions or (name or '').split('.')[-1].lower() in extensions
+
+
+class FolderCrawler:
+    """Breadth-first crawl of a folder tree with a bounded number of requests in flight.
+
+    ``crawl`` yields the item rows of each folder as soon as that folder is listed,
+    so callers can stream results while the rest of the tree is still being walked.
+    ``frontier`` holds the folders found but not listed yet, a later crawl can start
+    from it to resume.
+    """
+
+    def __init__(self, dm, project_id, workers=8, executor=None):
+        self.dm = dm
+        self.project_id = project_id
+        self.workers = workers
+        self.executor = executor
+        self.folders_done = 0
+        self.folders_found = 0
+        self.items_found = 0
+        self._pending = {}
+
+    @property
+    def frontier(self):
+        return list(self._pending.values())
+
+    def crawl(self, folder_id, extensions=None, recursive=True, frontier=None, seen=None):
+        """Yield (folder_id, rows) for every folder under folder_id, the root included.
+
+        To resume a crawl, pass the frontier it left and the folders it already listed as
+        seen: only the frontier and the new folders found under it are listed.
+        """
+        if self.executor is not None:
+            yield from self._crawl(self.executor, folder_id, extensions, recursive, frontier, seen)
+            return
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            yield from self._crawl(executor, folder_id, extensions, recursive, frontier, seen)
+
+    def _crawl(self, executor, folder_id, extensions, recursive, frontier=None, seen=None):
+        roots = [folder_id] if frontier is None else list(frontier)
+        seen = set(seen or []) | set(roots)
+        self.folders_found += len(roots)
+        pending = self._pending
+        for root in roots:
+            pending[executor.submit(self.dm.get_folder_contents, self.project_id, root)] = root
+        while pending:
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                current = pending.pop(future)
+                folders, versions = future.result()
+                if recursive:
+                    folders = [folder for folder in folders if folder['id'] not in seen]
+                    for folder in folders:
+                        seen.add(folder['id'])
+                        pending[executor.submit(self.dm.get_folder_contents, self.project_id,
+                                                folder['id'])] = folder['id']
+                    self.folders_found += len(folders)
+                rows = [version_row(self.project_id, current, version) for version in versions
+                        if match_extension(version['attributes'].get('displayName'), extensions)]
+                self.folders_done += 1
+                self.items_found += len(rows)
+                yield current, rows
@@ -0,0 +1,199 @@
+import click
+import gzip
+import json
+import os
+from .config import Config
+from .trace import traced
+
+FORMATS = ['auto', 'parquet', 'feather', 'csv', 'csv.gz', 'jsonl']
+# auto saves frames with at least this many rows as parquet, smaller ones as csv
+LARGE_ROWS = 100000
+# rows per parquet row group, also the rows converted at a time for every format
+ROW_GROUP_ROWS = 65536
+
+
+def format_option(command):
+    """Add the --format option of commands that save data."""
+    return click.option('--format', 'save_format', type=click.Choice(FORMATS, case_sensitive=False),
+                        default=lambda: Config.load_export_format(),
+                        help='The file format of saved data, auto is parquet for large tables and csv otherwise.')(command)
+
+
+def resolve_format(save_format, rows=None):
+    """Turn auto into parquet for large frames (when pyarrow is installed) and csv otherwise."""
+    save_format = (save_format or 'auto').lower()
+    if save_format == 'auto':
+        if rows is not None and rows >= LARGE_ROWS and _has_pyarrow():
+            return 'parquet'
+        return 'csv'
+    if save_format in ['parquet', 'feather'] and not _has_pyarrow():
+        raise click.ClickException(f"{save_format.capitalize()} output needs pyarrow, "
+                                   f"install it with: pip install apsbot[parquet]")
+    return save_format
+
+
+def _has_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def parameter_units(propdb, columns):
+    """Map the Revit parameters among columns to their display unit symbol."""
+    columns = set(columns)
+    units = {}
+    for attr in propdb.attrs[1:]:
+        if not isinstance(attr, list) or len(attr) < 4 or attr[0] not in columns or attr[0] in units:
+            continue
+        if attr[3]:
+            symbol = propdb.units.parse_symbol(attr[3])
+            if symbol:
+                units[attr[0]] = symbol
+    return units
+
+
+def arrow_safe(df):
+    """Turn object columns that mix numbers and text into text, arrow needs one type per column."""
+    for column in df.columns:
+        if df[column].dtype == object and df[column].dropna().map(type).nunique() > 1:
+            df[column] = df[column].map(lambda value: value if value is None or value != value else str(value))
+    return df
+
+
+class FrameWriter:
+    """Write DataFrames chunk by chunk into one file of a saved data format.
+
+    Every format is written to a temp file and renamed when closed. Parquet and feather
+    keep the pandas dtypes and the ``apsbot`` metadata (dtypes and parameter units) in
+    the file schema, the text formats get them in a ``.schema.json`` side-car file.
+    """
+
+    def __init__(self, folder, name, save_format='csv', units=None):
+        self.format = resolve_format(save_format)
+        self.path = os.path.join(folder, f"{name}.{self.format}")
+        self.units = units or {}
+        self.rows = 0
+        self._temp_path = self.path + f'.tmp{os.getpid()}'
+        self._file = None
+        self._writer = None
+        self._schema = None
+        self._dtypes = None
+        self._header_written = False
+
+    @traced('write file', 'save')
+    def write(self, df):
+        if self._dtypes is None:
+            self._dtypes = {str(column): str(dtype) for column, dtype in df.dtypes.items()}
+        if self.format in ['parquet', 'feather']:
+            df = arrow_safe(df.copy())
+        for start in range(0, len(df), ROW_GROUP_ROWS):
+            self._write_chunk(df.iloc[start:start + ROW_GROUP_ROWS])
+        if len(df) == 0 and self.rows == 0:
+            self._write_chunk(df)
+        self.rows += len(df)
+
+    @traced('close file', 'save')
+    def close(self):
+        """Finish the file and move it into place. Return its path."""
+        if self._writer is not None:
+            self._writer.close()
+        if self._file is not None:
+            self._file.close()
+        if not os.path.exists(self._temp_path):
+            return None
+        os.replace(self._temp_path, self.path)
+        schema_path = self.path + '.schema.json'
+        if self.format in ['csv', 'csv.gz', 'jsonl']:
+            with open(schema_path, 'w') as file:
+                json.dump(self.metadata(), file, indent=4)
+        elif os.path.exists(schema_path):
+            os.remove(schema_path)
+        return self.path
+
+    def metadata(self):
+        return {'dtypes': self._dtypes or {}, 'units': self.units}
+
+    def _write_chunk(self, chunk):
+        if self.format in ['parquet', 'feather']:
+            self._write_arrow(chunk)
+            return
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            if self.format == 'csv.gz':
+                self._file = gzip.open(self._temp_path, 'wt', compresslevel=6, newline='', encoding='utf-8')
+            else:
+                self._file = open(self._temp_path, 'w', newline='', encoding='utf-8')
+        if self.format == 'jsonl':
+            if len(chunk):
+                self._file.write(chunk.to_json(orient='records', lines=True, date_format='iso', default_handler=str))
+                self._file.write('\n')
+        else:
+            chunk.to_csv(self._file, header=not self._header_written, index=False)
+            self._header_written = True
+
+    def _write_arrow(self, chunk):
+        import pyarrow as pa
+        if self._writer is None:
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            # a column that is empty in the first chunk is text, later chunks may fill it
+            schema = pa.schema([field.with_type(pa.string()) if pa.types.is_null(field.type) else field
+                                for field in table.schema])
+            metadata = dict(table.schema.metadata or {})
+            metadata[b'apsbot'] = json.dumps(self.metadata()).encode('utf-8')
+            self._schema = schema.with_metadata(metadata)
+            table = table.cast(self._schema)
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            if self.format == 'parquet':
+                import pyarrow.parquet as pq
+                self._writer = pq.ParquetWriter(self._temp_path, self._schema, compression='zstd')
+            else:
+                import pyarrow.ipc as ipc
+                self._file = pa.OSFile(self._temp_path, 'wb')
+                self._writer = ipc.new_file(self._file, self._schema,
+                                            options=ipc.IpcWriteOptions(compression='zstd'))
+        else:
+            # later chunks follow the schema of the first one, all-null columns included
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            table = table.select(self._schema.names).cast(self._schema)
+        if self.format == 'parquet':
+            self._writer.write_table(table, row_group_size=ROW_GROUP_ROWS)
+        else:
+            self._writer.write_table(table, max_chunksize=ROW_GROUP_ROWS)
+
+
+def save_frame(df, name, save_format='auto', units=None, folder=None):
+    """Save a DataFrame as <folder>/<name>.<format> in chunks. Return the file path."""
+    writer = FrameWriter(folder or Config.load_folder_path(), name, resolve_format(save_format, len(df)), units)
+    writer.write(df)
+    return writer.close()
+
+
+def read_frame(path, engine=None):
+    """Read a file saved by save_frame back into a DataFrame with its saved dtypes.
+
+    engine picks the pandas CSV parser, 'pyarrow' parses on several threads and also
+    turns ISO timestamps into datetimes.
+    """
+    import pandas as pd
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path)
+    if path.endswith('.feather'):
+        return pd.read_feather(path)
+    dtypes = {}
+    if os.path.exists(path + '.schema.json'):
+        with open(path + '.schema.json', 'r') as file:
+            dtypes = json.load(file).get('dtypes', {})
+    if path.endswith('.jsonl'):
+        df = pd.read_json(path, lines=True)
+    else:
+        df = pd.read_csv(path, engine=engine, dtype={column: dtype for column, dtype in dtypes.items()
+                                                     if dtype in ['str', 'string', 'object', 'category']})
+    for column, dtype in dtypes.items():
+        if column in df.columns and str(df[column].dtype) != dtype:
+            try:
+                df[column] = df[column].astype(dtype)
+            except (TypeError, ValueError):
+                pass
+    return df
@@ -0,0 +1,145 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+from urllib.parse import urlencode, urlparse
+from .config import Config, atomic_write_json
+from .trace import span
+
+# endpoint name -> url path pattern of the Data Management reads worth caching
+ENDPOINTS = {
+    'hubs': r'^/project/v1/hubs$',
+    'projects': r'^/project/v1/hubs/[^/]+/projects$',
+    'top_folders': r'^/project/v1/hubs/[^/]+/projects/[^/]+/topFolders$',
+    'folder_contents': r'^/data/v1/projects/[^/]+/folders/[^/]+/contents$',
+    'item_versions': r'^/data/v1/projects/[^/]+/items/[^/]+/versions$',
+    'items': r'^/data/v1/projects/[^/]+/items/[^/]+$',
+    'versions': r'^/data/v1/projects/[^/]+/versions/[^/]+$',
+}
+
+# seconds a cached response is used without asking the server, after that it is revalidated
+DEFAULT_TTLS = {
+    'hubs': 3600,
+    'projects': 600,
+    'top_folders': 600,
+    'folder_contents': 60,
+    'item_versions': 60,
+    'items': 60,
+    'versions': 3600,
+}
+
+
+class HttpCache:
+    """On-disk cache of Data Management GET responses.
+
+    A response younger than the endpoint TTL is served without a request. An older one
+    is revalidated with If-None-Match / If-Modified-Since, and a 304 refreshes it. A
+    negative TTL turns caching off for that endpoint. Entries are kept per credential
+    identity, the APS app and the token_config.json they were fetched with, so another
+    account never gets them.
+    """
+    folder_name = 'http'
+
+    @classmethod
+    def endpoint(cls, url):
+        """Return the endpoint name of a url, or None if it is not cached."""
+        path = urlparse(url).path
+        for name, pattern in ENDPOINTS.items():
+            if re.match(pattern, path):
+                return name
+        return None
+
+    @classmethod
+    def ttl(cls, endpoint):
+        ttls = Config.load_http_cache_ttls()
+        return ttls.get(endpoint, DEFAULT_TTLS.get(endpoint, 0))
+
+    @classmethod
+    def get(cls, session, url, params=None, **kwargs):
+        """GET through the cache with a requests session. Return a requests.Response."""
+        endpoint = cls.endpoint(url)
+        ttl = cls.ttl(endpoint) if endpoint else -1
+        if ttl < 0 or kwargs.get('stream'):
+            return session.request('GET', url, params=params, **kwargs)
+        full_url = url + ('?' + urlencode(params, doseq=True) if params else '')
+        identity = cls.identity()
+        path = cls._entry_path(identity, full_url)
+        entry = cls._load(path)
+        if entry is not None and entry.get('identity') != identity:
+            entry = None
+        if entry is not None and time.time() - entry['stored_at'] < ttl:
+            with span(f"cache {endpoint}", 'http', url=full_url, bytes=len(entry['body'])):
+                return cls._response(entry)
+        headers = dict(kwargs.pop('headers', None) or {})
+        if entry is not None:
+            if entry['headers'].get('ETag'):
+                headers['If-None-Match'] = entry['headers']['ETag']
+            if entry['headers'].get('Last-Modified'):
+                headers['If-Modified-Since'] = entry['headers']['Last-Modified']
+        response = session.request('GET', url, params=params, headers=headers, **kwargs)
+        if response.status_code == 304 and entry is not None:
+            entry['stored_at'] = time.time()
+            atomic_write_json(path, entry)
+            return cls._response(entry)
+        if response.status_code == 200:
+            try:
+                body = response.content.decode('utf-8')
+            except UnicodeDecodeError:
+                return response
+            atomic_write_json(path, {
+                'identity': identity,
+                'url': full_url,
+                'stored_at': time.time(),
+                'headers': {key: response.headers[key] for key in ['Content-Type', 'ETag', 'Last-Modified']
+                            if key in response.headers},
+                'body': body,
+            })
+        return response
+
+    @classmethod
+    def identity(cls):
+        """Return a hash of the APS app and the token file the requests of this process are made with."""
+        from .tokenconfig import TokenConfig
+        client_id = os.environ.get('APS_CLIENT_ID') or ''
+        token_path = os.path.realpath(TokenConfig.config_path)
+        return hashlib.sha1(f"{client_id}\n{token_path}".encode('utf-8')).hexdigest()
+
+    @classmethod
+    def clear(cls):
+        """Remove every cached response."""
+        shutil.rmtree(cls._folder(), ignore_errors=True)
+
+    @classmethod
+    def _response(cls, entry):
+        # imported here so settings can read DEFAULT_TTLS without loading requests
+        import requests
+        from requests.structures import CaseInsensitiveDict
+        response = requests.Response()
+        response.status_code = 200
+        response.reason = 'OK'
+        response.url = entry['url']
+        response.headers = CaseInsensitiveDict(entry['headers'])
+        response.encoding = 'utf-8'
+        response._content = entry['body'].encode('utf-8')
+        return response
+
+    @classmethod
+    def _folder(cls):
+        return os.path.join(Config.load_cache_folder(), cls.folder_name)
+
+    @classmethod
+    def _entry_path(cls, identity, url):
+        key = hashlib.sha1(f"{identity}\n{url}".encode('utf-8')).hexdigest()
+        return os.path.join(cls._folder(), key + '.json')
+
+    @classmethod
+    def _load(cls, path):
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r') as file:
+                return json.load(file)
+        except ValueError:
+            return None
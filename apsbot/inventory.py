@@ -0,0 +1,219 @@
+import click
+import os
+import sqlite3
+import sys
+import time
+import pandas as pd
+from .config import Config
+from .export import format_option, save_frame
+from .output import output_options, show
+from .dm import DataManagement, FolderCrawler, ITEM_COLUMNS, is_deleted, version_row
+from .tokenconfig import TokenConfig
+
+CHANGELOG_COLUMNS = ['change', 'project_id', 'folder_id', 'item_id', 'item_name', 'old_version', 'new_version',
+                     'last_modified_time']
+# columns of a stored item that a removal logs
+REMOVED_COLUMNS = "item_id, project_id, folder_id, item_name, last_version, last_modified_time"
+
+
+class Inventory:
+    """Local SQLite record of every item in a hub, kept current with delta crawls.
+
+    A top folder whose ``lastModifiedTimeRollup`` is unchanged since the last run is
+    skipped. Otherwise only versions modified since that time are fetched with the
+    folder search endpoint, hidden ones included so deletions are seen too. Every item
+    keeps the top folder it was found under, so a crawl of that top folder removes the
+    items it no longer finds, whichever subfolder they were in.
+    """
+    schema = """
+    CREATE TABLE IF NOT EXISTS projects (
+        project_id TEXT PRIMARY KEY, hub_id TEXT, name TEXT, last_seen REAL);
+    CREATE TABLE IF NOT EXISTS top_folders (
+        folder_id TEXT PRIMARY KEY, project_id TEXT, name TEXT, last_modified_rollup TEXT, last_seen REAL);
+    CREATE TABLE IF NOT EXISTS items (
+        item_id TEXT PRIMARY KEY, project_id TEXT, folder_id TEXT, item_name TEXT, last_version INTEGER,
+        derivative_urn TEXT, last_modified_time TEXT, last_seen REAL, top_folder_id TEXT);
+    CREATE TABLE IF NOT EXISTS changelog (
+        run_id INTEGER, change TEXT, project_id TEXT, folder_id TEXT, item_id TEXT, item_name TEXT,
+        old_version INTEGER, new_version INTEGER, last_modified_time TEXT);
+    CREATE TABLE IF NOT EXISTS runs (
+        run_id INTEGER PRIMARY KEY AUTOINCREMENT, hub_id TEXT, full INTEGER, started REAL, finished REAL);
+    CREATE INDEX IF NOT EXISTS items_project ON items (project_id);
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(Config.load_cache_folder(), 'inventory.db')
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.db = sqlite3.connect(self.path)
+        self.db.executescript(self.schema)
+        columns = [row[1] for row in self.db.execute("PRAGMA table_info(items)")]
+        if 'top_folder_id' not in columns:
+            # inventories made before the top folder was kept, their projects are crawled in full once
+            self.db.execute("ALTER TABLE items ADD COLUMN top_folder_id TEXT")
+            self.db.commit()
+        self.run_id = None
+
+    def sync(self, dm, hub_id, full=False, workers=8, on_folder=None):
+        """Bring the inventory of a hub up to date. Return the changelog of this run as a DataFrame."""
+        started = time.time()
+        self.run_id = self.db.execute("INSERT INTO runs (hub_id, full, started) VALUES (?, ?, ?)",
+                                      (hub_id, int(full), started)).lastrowid
+        known_projects = {row[0] for row in self.db.execute("SELECT project_id FROM projects WHERE hub_id = ?",
+                                                            (hub_id,))}
+        seen_projects = set()
+        for project in dm.iter_projects(hub_id):
+            project_id = project['id']
+            seen_projects.add(project_id)
+            self.db.execute("INSERT OR REPLACE INTO projects VALUES (?, ?, ?, ?)",
+                            (project_id, hub_id, project['attributes'].get('name'), started))
+            legacy = self.db.execute("SELECT 1 FROM items WHERE project_id = ? AND top_folder_id IS NULL LIMIT 1",
+                                     (project_id,)).fetchone() is not None
+            known_folders = {row[0] for row in self.db.execute("SELECT folder_id FROM top_folders WHERE project_id = ?",
+                                                               (project_id,))}
+            seen_folders = set()
+            for folder in dm.get_top_folders(hub_id, project_id):
+                seen_folders.add(folder['id'])
+                rollup = folder['attributes'].get('lastModifiedTimeRollup')
+                row = self.db.execute("SELECT last_modified_rollup FROM top_folders WHERE folder_id = ?",
+                                      (folder['id'],)).fetchone()
+                if row is None or full or legacy:
+                    self._crawl(dm, project_id, folder['id'], workers, on_folder)
+                elif rollup != row[0]:
+                    self._delta(dm, project_id, folder['id'], row[0])
+                self.db.execute("INSERT OR REPLACE INTO top_folders VALUES (?, ?, ?, ?, ?)",
+                                (folder['id'], project_id, folder['attributes'].get('name'), rollup, started))
+            if legacy:
+                # every top folder was crawled, an item still without one was not found in any
+                self._remove(self.db.execute(f"SELECT {REMOVED_COLUMNS} FROM items "
+                                             "WHERE project_id = ? AND top_folder_id IS NULL", (project_id,)).fetchall())
+            # every item of a top folder that disappeared from the project is gone
+            for folder_id in known_folders - seen_folders:
+                self._remove(self.db.execute(f"SELECT {REMOVED_COLUMNS} FROM items WHERE top_folder_id = ?",
+                                             (folder_id,)).fetchall())
+                self.db.execute("DELETE FROM top_folders WHERE folder_id = ?", (folder_id,))
+            self.db.commit()
+        # every item of a project that disappeared from the hub is gone
+        for project_id in known_projects - seen_projects:
+            self._remove(self.db.execute(f"SELECT {REMOVED_COLUMNS} FROM items WHERE project_id = ?",
+                                         (project_id,)).fetchall())
+            self.db.execute("DELETE FROM projects WHERE project_id = ?", (project_id,))
+            self.db.execute("DELETE FROM top_folders WHERE project_id = ?", (project_id,))
+        self.db.execute("UPDATE runs SET finished = ? WHERE run_id = ?", (time.time(), self.run_id))
+        self.db.commit()
+        return self.changelog(self.run_id)
+
+    def changelog(self, run_id=None):
+        """Return the changes recorded by a run, the latest one by default."""
+        if run_id is None:
+            run_id = self.db.execute("SELECT MAX(run_id) FROM runs").fetchone()[0]
+        return pd.read_sql_query(f"SELECT {', '.join(CHANGELOG_COLUMNS)} FROM changelog WHERE run_id = ?",
+                                 self.db, params=(run_id,))
+
+    def items(self, project_id=None):
+        """Return the recorded items, of one project or of all."""
+        query = f"SELECT {', '.join(ITEM_COLUMNS)} FROM items"
+        if project_id:
+            return pd.read_sql_query(query + " WHERE project_id = ?", self.db, params=(project_id,))
+        return pd.read_sql_query(query, self.db)
+
+    def close(self):
+        self.db.close()
+
+    def _crawl(self, dm, project_id, folder_id, workers, on_folder):
+        """List a whole top folder tree, items of it not found anymore are removed."""
+        crawler = FolderCrawler(dm, project_id, workers)
+        seen = set()
+        for current, rows in crawler.crawl(folder_id):
+            for row in rows:
+                seen.add(row['item_id'])
+                self._upsert(row, folder_id)
+            if on_folder:
+                on_folder(crawler)
+        stored = self.db.execute(f"SELECT {REMOVED_COLUMNS} FROM items WHERE top_folder_id = ?",
+                                 (folder_id,)).fetchall()
+        self._remove([row for row in stored if row[0] not in seen])
+
+    def _delta(self, dm, project_id, folder_id, since):
+        """Fetch only the versions changed under a top folder since the last recorded rollup."""
+        versions, parents = dm.search_folder(project_id, folder_id, since)
+        tips = {}
+        for version in versions:
+            item_id = version['relationships']['item']['data']['id']
+            if item_id not in tips or version['attributes']['versionNumber'] > tips[item_id]['attributes']['versionNumber']:
+                tips[item_id] = version
+        for item_id, version in tips.items():
+            if is_deleted(version):
+                self._remove(self.db.execute(f"SELECT {REMOVED_COLUMNS} FROM items WHERE item_id = ?",
+                                             (item_id,)).fetchall())
+            else:
+                self._upsert(version_row(project_id, parents.get(item_id), version), folder_id)
+
+    def _upsert(self, row, top_folder_id):
+        stored = self.db.execute("SELECT last_version, folder_id FROM items WHERE item_id = ?",
+                                 (row['item_id'],)).fetchone()
+        if stored is None:
+            self._log('added', row, None, row['last_version'])
+        else:
+            if row['folder_id'] is None:
+                # the search did not include the parent folder, keep the recorded one
+                row = dict(row, folder_id=stored[1])
+            if stored[0] != row['last_version']:
+                self._log('changed', row, stored[0], row['last_version'])
+        self.db.execute("INSERT OR REPLACE INTO items (item_id, project_id, folder_id, item_name, last_version, "
+                        "derivative_urn, last_modified_time, last_seen, top_folder_id) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (row['item_id'], row['project_id'], row['folder_id'], row['item_name'], row['last_version'],
+                         row['derivative_urn'], row['last_modified_time'], time.time(), top_folder_id))
+
+    def _remove(self, stored_rows):
+        for item_id, project_id, folder_id, item_name, last_version, last_modified_time in stored_rows:
+            self._log('removed', {'project_id': project_id, 'folder_id': folder_id, 'item_id': item_id,
+                                  'item_name': item_name, 'last_modified_time': last_modified_time}, last_version, None)
+            self.db.execute("DELETE FROM items WHERE item_id = ?", (item_id,))
+
+    def _log(self, change, row, old_version, new_version):
+        self.db.execute("INSERT INTO changelog VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (self.run_id, change, row['project_id'], row['folder_id'], row['item_id'], row['item_name'],
+                         old_version, new_version, row['last_modified_time']))
+
+
+@click.command()
+@click.option('--hub_id', prompt='Hub Id', default=lambda: Config.load_hub_id(),
+              help='The hub to keep an inventory of.')
+@click.option('--full', prompt='Full Crawl(y/n)', default='n', help='Crawl every folder instead of only the changes.')
+@click.option('--save_data', prompt='Save Data(y/n)', default='n', help='Save the changelog to file.')
+@format_option
+@click.option('--workers', default=lambda: Config.load_crawl_workers(), type=int,
+              help='The number of folders listed in parallel.')
+@output_options
+def hub_inventory(hub_id, full, save_data, save_format, workers, output, limit):
+    """Update the local inventory of a hub and show what was added, changed or removed."""
+    if not hub_id:
+        click.echo("Please provide a Hub Id.")
+        return
+    Config.save_hub_id(hub_id)
+    token = TokenConfig.load_config()
+    inventory = Inventory()
+    start = time.time()
+
+    def on_folder(crawler):
+        if sys.stderr.isatty():
+            click.echo(f"\rFolders {crawler.folders_done}/{crawler.folders_found}", err=True, nl=False)
+
+    try:
+        df = inventory.sync(DataManagement(token, workers=workers), hub_id, str.lower(full) == 'y', workers,
+                            on_folder)
+        total = len(inventory.items())
+    finally:
+        inventory.close()
+    if sys.stderr.isatty():
+        click.echo(err=True)
+    click.echo(f"Inventory has {total} items, {len(df)} changes in {time.time() - start:.1f}s.", err=True)
+    if df.empty:
+        return
+    counts = df.groupby('change').size()
+    click.echo(', '.join(f"{count} {change}" for change, count in counts.items()), err=True)
+    if str.lower(save_data) == 'y':
+        file_path = save_frame(df, 'changelog', save_format)
+        click.echo(f"Changelog saved to {file_path}", err=True)
+    show(df[['change', 'item_name', 'old_version', 'new_version', 'last_modified_time']], output, limit)
@@ -0,0 +1,183 @@
+import click
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from .config import Config
+from .trace import traced
+
+SOURCE_COLUMN = 'source_model'
+
+
+def model_options(command):
+    """Add the --workers and --max_memory options of commands that extract many models."""
+    command = click.option('--max_memory', default=lambda: Config.load_model_memory(), type=int,
+                           help='The memory cap in MB of each extraction process, 0 for none.')(command)
+    command = click.option('--workers', default=lambda: Config.load_model_workers(), type=int,
+                           help='The number of models extracted in parallel processes.')(command)
+    return command
+
+
+def read_models(value):
+    """Turn a --urn value into a list of (urn, model name) pairs.
+
+    The value is one urn, urns separated by commas, or the path of a file saved by
+    ``items`` whose derivative_urn and item_name columns name the models.
+    """
+    if value and os.path.isfile(value):
+        from .export import read_frame
+        df = read_frame(value)
+        if 'derivative_urn' not in df.columns:
+            raise click.ClickException(f"{value} has no derivative_urn column.")
+        names = df['item_name'] if 'item_name' in df.columns else df['derivative_urn']
+        models = [(urn, name) for urn, name in zip(df['derivative_urn'], names) if isinstance(urn, str) and urn]
+    else:
+        models = [(urn.strip(), urn.strip()) for urn in (value or '').split(',') if urn.strip()]
+    # the same model listed twice is extracted once
+    return list(dict(models).items())
+
+
+def _init_worker(token, max_memory):
+    # a worker over its memory cap gets a MemoryError for its own model instead of starving the others
+    if max_memory and sys.platform != 'win32':
+        import resource
+        limit = max_memory * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    from .session import install_session
+    from .tokenconfig import TokenConfig
+    import aps_toolkit  # noqa: F401
+    TokenConfig.current = token
+    install_session()
+
+
+def _extract_model(token, urn, region, extract, job):
+    from .batch import EXTRACTIONS, _split
+    from .cache import PropDbCache
+    from .snapshot import RevitSnapshot
+    from .tokenconfig import TokenConfig
+    TokenConfig.current = token
+    df = RevitSnapshot.read(urn, region, job['is_sub_family'], job['display_unit'],
+                            categories=_split(job.get('categories')) or None,
+                            families=_split(job.get('families')) or None,
+                            family_types=_split(job.get('family_types')) or None,
+                            parameters=_split(job.get('parameters')) or None)
+    units = {}
+    if df is None:
+        from .export import parameter_units
+        propdb = PropDbCache.load(urn, token, region)
+        df = EXTRACTIONS[extract](propdb, job)
+        units = parameter_units(propdb, df.columns)
+    return df, units
+
+
+class ModelExtraction:
+    """Run one revit extraction on many models in a process pool and combine the results.
+
+    Parsing a property database is CPU bound, so every model is loaded and extracted in
+    a worker process of its own (a fresh process per model, so memory goes back to the
+    system between models). A failing model, or a worker that dies, only fails that
+    model; the rows of the others get a source_model column and are concatenated.
+    With a checkpoint, the rows of each model are saved as it finishes and the models
+    saved by an earlier run are not extracted again.
+    """
+
+    def __init__(self, token, region, extract, job, workers=None, max_memory=0, checkpoint=None):
+        self.token = token
+        self.region = region
+        self.extract = extract
+        self.job = job
+        self.workers = workers or Config.load_model_workers()
+        self.max_memory = max_memory
+        self.checkpoint = checkpoint
+        self.units = {}
+
+    @traced('extract models', 'transform')
+    def run(self, models, on_model=None):
+        """Extract every (urn, name) model. Return the combined DataFrame and a status row per model."""
+        import pandas as pd
+        frames = []
+        statuses = []
+        attempts = {}
+        queue = list(models)
+        if self.checkpoint is not None:
+            queue = [(urn, name) for urn, name in models if not self.checkpoint.done(urn)]
+            for urn, name in models:
+                if self.checkpoint.done(urn):
+                    statuses.append({'model': name, 'urn': urn, 'status': 'done earlier',
+                                     'rows': self.checkpoint.rows(urn), 'seconds': 0.0, 'error': None})
+        while queue:
+            crashed, queue = self._run_pool(queue, self.workers, attempts, frames, statuses, on_model)
+            while crashed:
+                # models of a crashed pool run again one at a time, the one that kills its worker only fails itself
+                again, rest = self._run_pool(crashed, 1, attempts, frames, statuses, on_model)
+                crashed = again + rest
+        if self.checkpoint is not None:
+            frames = list(self.checkpoint.frames())
+            self.units.update(self.checkpoint.units)
+        df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+        return df, pd.DataFrame(statuses, columns=['model', 'urn', 'status', 'rows', 'seconds', 'error'])
+
+    def _run_pool(self, models, workers, attempts, frames, statuses, on_model):
+        """Run models in one pool until they are done or a worker crashes.
+
+        Return the models that were running when it crashed and the ones not started yet.
+        """
+        retry = []
+        options = {}
+        if sys.version_info >= (3, 11):
+            options['max_tasks_per_child'] = 1
+        with ProcessPoolExecutor(max_workers=min(workers, len(models)), mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=_init_worker, initargs=(self.token, self.max_memory),
+                                 **options) as executor:
+            queue = list(models)
+            running = {}
+            broken = False
+            while (queue and not broken) or running:
+                # submit lazily so each model gets the token as it is when it starts
+                while queue and not broken and len(running) < workers:
+                    try:
+                        future = executor.submit(_extract_model, self.token, queue[0][0], self.region, self.extract,
+                                                 self.job)
+                    except BrokenProcessPool:
+                        broken = True
+                        break
+                    urn, name = queue.pop(0)
+                    attempts[urn] = attempts.get(urn, 0) + 1
+                    running[future] = (urn, name, time.time())
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    urn, name, start = running.pop(future)
+                    status = {'model': name, 'urn': urn, 'status': 'ok', 'rows': 0, 'seconds': 0.0, 'error': None}
+                    try:
+                        df, units = future.result()
+                        df.insert(0, SOURCE_COLUMN, name)
+                        if self.checkpoint is not None:
+                            self.checkpoint.save(urn, df, units=units)
+                        else:
+                            frames.append(df)
+                        self.units.update(units)
+                        status['rows'] = len(df)
+                    except BrokenProcessPool:
+                        # any running model may have killed the pool, run each again once
+                        broken = True
+                        if attempts[urn] < 2:
+                            retry.append((urn, name))
+                            continue
+                        status['status'] = 'failed'
+                        status['error'] = 'worker process died, it may have run out of memory'
+                    except MemoryError:
+                        status['status'] = 'failed'
+                        status['error'] = f'over the {self.max_memory} MB worker memory cap'
+                    except Exception as e:
+                        status['status'] = 'failed'
+                        status['error'] = str(e)
+                    status['seconds'] = round(time.time() - start, 2)
+                    statuses.append(status)
+                    if on_model:
+                        on_model(status)
+        # after a crash the models not started yet go to the next pool
+        return retry, queue
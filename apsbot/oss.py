@@ -0,0 +1,89 @@
+import os
+from urllib.parse import quote
+from .session import shared_session
+
+
+class OSS:
+    """Client for the OSS endpoints that aps_toolkit's Bucket does not expose (multipart signed S3 transfers).
+
+    The host can be pointed at a local mock server with the APS_HOST environment variable.
+    """
+    # OSS hands out at most 25 signed part urls per request
+    max_urls = 25
+
+    def __init__(self, token, region='US', session=None):
+        self.token = token
+        self.region = region
+        self.host = os.environ.get('APS_HOST', 'https://developer.api.autodesk.com').rstrip('/')
+        self.session = session or shared_session()
+
+    def _headers(self):
+        return {'Authorization': f'Bearer {self.token.access_token}'}
+
+    def _object_url(self, bucket_name, object_name):
+        return f"{self.host}/oss/v2/buckets/{bucket_name}/objects/{quote(object_name, safe='')}"
+
+    def get_upload_urls(self, bucket_name, object_name, parts, first_part=1, upload_key=None, minutes=60):
+        """Get signed S3 urls for parts first_part..first_part+parts-1 of a multipart upload."""
+        params = {'parts': parts, 'firstPart': first_part, 'minutesExpiration': minutes}
+        if upload_key:
+            params['uploadKey'] = upload_key
+        response = self.session.get(self._object_url(bucket_name, object_name) + '/signeds3upload',
+                                    headers=self._headers(), params=params)
+        response.raise_for_status()
+        return response.json()
+
+    def complete_upload(self, bucket_name, object_name, upload_key, size=None):
+        """Tell OSS that all parts of an upload are sent."""
+        data = {'uploadKey': upload_key}
+        if size is not None:
+            data['size'] = size
+        response = self.session.post(self._object_url(bucket_name, object_name) + '/signeds3upload',
+                                     headers=self._headers(), json=data)
+        response.raise_for_status()
+        return response.json()
+
+    def put_part(self, url, data):
+        """Upload one part to its signed S3 url."""
+        response = self.session.put(url, data=data)
+        response.raise_for_status()
+        return response
+
+    def get_download_url(self, bucket_name, object_name, minutes=60):
+        """Get a signed S3 download url with the size and sha1 of the object."""
+        response = self.session.get(self._object_url(bucket_name, object_name) + '/signeds3download',
+                                    headers=self._headers(), params={'minutesExpiration': minutes})
+        response.raise_for_status()
+        result = response.json()
+        if result.get('status', 'complete') != 'complete':
+            raise Exception(f"Object is not ready to download: {result.get('status')}")
+        return result
+
+    def get_range(self, url, start, end):
+        """Open a streaming request for bytes start..end (inclusive) of a signed S3 url."""
+        response = self.session.get(url, headers={'Range': f'bytes={start}-{end}'}, stream=True)
+        response.raise_for_status()
+        if response.status_code != 206 and (start != 0 or end != int(response.headers.get('Content-Length', -1)) - 1):
+            response.close()
+            raise Exception("Server ignored the range request.")
+        return response
+
+    def iter_objects(self, bucket_name, prefix=None, page_size=100):
+        """Yield the objects of a bucket one page at a time, following the OSS ``next`` links."""
+        params = {'limit': page_size}
+        if prefix:
+            params['beginsWith'] = prefix
+        url = f"{self.host}/oss/v2/buckets/{bucket_name}/objects"
+        while url:
+            response = self.session.get(url, headers=self._headers(), params=params)
+            response.raise_for_status()
+            result = response.json()
+            yield result.get('items', [])
+            # the next link already carries limit, startAt and beginsWith
+            url, params = result.get('next'), None
+
+    def delete_object(self, bucket_name, object_name):
+        """Delete an object from a bucket."""
+        response = self.session.delete(self._object_url(bucket_name, object_name), headers=self._headers())
+        response.raise_for_status()
+        return response
@@ -0,0 +1,123 @@
+import click
+import os
+import shutil
+import sys
+from tabulate import tabulate
+from .trace import traced
+
+FORMATS = ['auto', 'table', 'csv', 'ndjson', 'parquet']
+# rows formatted per table page, a page is only rendered when the pager asks for it
+PAGE_ROWS = 100
+# rows per write for the machine readable formats
+CHUNK_ROWS = 10000
+
+
+def output_options(command):
+    """Add the --output and --limit/--head options of data commands."""
+    command = click.option('--limit', '--head', 'limit', default=0, type=int,
+                           help='Only output the first rows, 0 for all.')(command)
+    command = click.option('--output', type=click.Choice(FORMATS, case_sensitive=False), default='auto',
+                           help='The output format, auto is a table on a terminal and CSV in a pipe.')(command)
+    return command
+
+
+def resolve_format(output):
+    """Turn auto into table on a terminal and csv when stdout is piped or redirected."""
+    output = (output or 'auto').lower()
+    if output == 'auto':
+        return 'table' if sys.stdout.isatty() else 'csv'
+    return output
+
+
+class TableWriter:
+    """Write DataFrames to stdout chunk by chunk in one format, for results that arrive in pieces.
+
+    CSV and Parquet keep a single header/schema across chunks, and writing stops
+    quietly once ``limit`` rows are out. When the reader goes away (``| head``) the
+    command exits without a traceback.
+    """
+
+    def __init__(self, output='auto', limit=0):
+        self.format = resolve_format(output)
+        self.limit = limit
+        self.rows = 0
+        self._parquet = None
+        self._header_written = False
+        if self.format == 'parquet' and sys.stdout.isatty():
+            raise click.ClickException("Parquet output is binary, redirect it to a file.")
+
+    @property
+    def full(self):
+        return bool(self.limit) and self.rows >= self.limit
+
+    @traced('write rows', 'render')
+    def write(self, df):
+        if self.full or df.empty:
+            return
+        if self.limit:
+            df = df.head(self.limit - self.rows)
+        step = PAGE_ROWS if self.format == 'table' else CHUNK_ROWS
+        try:
+            for start in range(0, len(df), step):
+                self._write_chunk(df.iloc[start:start + step])
+            sys.stdout.flush()
+        except BrokenPipeError:
+            _reader_gone()
+        self.rows += len(df)
+
+    def close(self):
+        try:
+            if self._parquet is not None:
+                self._parquet.close()
+                self._parquet = None
+            sys.stdout.flush()
+        except BrokenPipeError:
+            _reader_gone()
+
+    def _write_chunk(self, chunk):
+        if self.format == 'table':
+            print(tabulate(chunk, headers="keys", tablefmt="psql"))
+        elif self.format == 'csv':
+            chunk.to_csv(sys.stdout, header=not self._header_written, index=False)
+            self._header_written = True
+        elif self.format == 'ndjson':
+            sys.stdout.write(chunk.to_json(orient='records', lines=True, date_format='iso', default_handler=str))
+            sys.stdout.write('\n')
+        elif self.format == 'parquet':
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if self._parquet is None:
+                self._parquet = pq.ParquetWriter(sys.stdout.buffer, table.schema, compression='zstd')
+            else:
+                table = table.cast(self._parquet.schema)
+            self._parquet.write_table(table)
+
+
+@traced('show', 'render')
+def show(df, output='auto', limit=0):
+    """Write a whole DataFrame to stdout.
+
+    On a terminal a table taller than the screen goes through the pager one page at
+    a time, so only the pages that are looked at get formatted.
+    """
+    output = resolve_format(output)
+    if limit:
+        df = df.head(limit)
+    if output == 'table' and sys.stdout.isatty() and len(df) > shutil.get_terminal_size().lines:
+        click.echo_via_pager(_table_pages(df))
+        return
+    writer = TableWriter(output)
+    writer.write(df)
+    writer.close()
+
+
+def _reader_gone():
+    # the reader went away (| head), point stdout at devnull so the flush at exit does not fail, then stop
+    os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+    sys.exit(1)
+
+
+def _table_pages(df):
+    for start in range(0, len(df), PAGE_ROWS):
+        yield tabulate(df.iloc[start:start + PAGE_ROWS], headers="keys", tablefmt="psql") + '\n'
@@ -0,0 +1,420 @@
+import click
+import re
+import numpy as np
+from .tokenconfig import TokenConfig
+from .cache import PropDbCache
+from .config import Config
+from .output import output_options, show
+from .export import format_option, save_frame, parameter_units
+from .trace import traced
+
+# names answered from the category, family and type index instead of element properties
+INDEX_NAMES = {'category': 'Category', 'family': 'Family', 'type': 'Type', 'familytype': 'Type'}
+# properties the data_revit commands leave out of the rows
+IGNORED_PROPERTIES = ['parent', 'instanceof_objid', 'child', 'viewable_in']
+OPERATORS = ['=', '!=', '>', '>=', '<', '<=', 'in', 'not in']
+TOKEN = re.compile(r"\s*(?:(?P<string>'[^']*'|\"[^\"]*\")|(?P<op>!=|>=|<=|=|>|<|\(|\)|,)"
+                   r"|(?P<word>[^\s=!<>(),'\"]+))")
+INTERNAL_CATEGORY = re.compile(r'^__\w+__$')
+
+
+def parse_query(text):
+    """Parse a query like ``Category=Rooms AND Area>20 AND Level IN (L1,L2)``.
+
+    Conditions are ``name op value`` with =, !=, >, >=, <, <=, IN (...) and NOT IN (...),
+    joined by AND, OR and NOT and grouped with parentheses. Names and values with spaces
+    are fine as they are; quote them when they hold an operator or a keyword. Return a
+    tree of ('and'|'or', [nodes]), ('not', node) and ('cmp', name, op, [values]).
+    """
+    tokens = []
+    position = 0
+    text = text or ''
+    while position < len(text.rstrip()):
+        match = TOKEN.match(text, position)
+        if not match or match.end() == position:
+            raise click.ClickException(f"Can not read the query at: {text[position:]}")
+        position = match.end()
+        if match.group('string') is not None:
+            tokens.append(('value', match.group('string')[1:-1]))
+        elif match.group('op') is not None:
+            tokens.append(('op', match.group('op')))
+        elif match.group('word').upper() in ['AND', 'OR', 'NOT', 'IN']:
+            tokens.append(('keyword', match.group('word').upper()))
+        else:
+            tokens.append(('word', match.group('word')))
+    parser = _Parser(tokens)
+    node = parser.expression()
+    if parser.peek() is not None:
+        raise click.ClickException(f"Unexpected '{parser.peek()[1]}' in the query.")
+    return node
+
+
+class _Parser:
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.position = 0
+
+    def peek(self, offset=0):
+        if self.position + offset < len(self.tokens):
+            return self.tokens[self.position + offset]
+        return None
+
+    def take(self, kind=None, value=None):
+        token = self.peek()
+        if token is None or (kind and token[0] != kind) or (value and token[1] != value):
+            found = f"'{token[1]}'" if token else 'the end'
+            raise click.ClickException(f"Expected {value or kind} in the query, found {found}.")
+        self.position += 1
+        return token
+
+    def expression(self):
+        nodes = [self.conjunction()]
+        while self.peek() == ('keyword', 'OR'):
+            self.take()
+            nodes.append(self.conjunction())
+        return nodes[0] if len(nodes) == 1 else ('or', nodes)
+
+    def conjunction(self):
+        nodes = [self.factor()]
+        while self.peek() == ('keyword', 'AND'):
+            self.take()
+            nodes.append(self.factor())
+        return nodes[0] if len(nodes) == 1 else ('and', nodes)
+
+    def factor(self):
+        if self.peek() == ('keyword', 'NOT'):
+            self.take()
+            return ('not', self.factor())
+        if self.peek() == ('op', '('):
+            self.take()
+            node = self.expression()
+            self.take('op', ')')
+            return node
+        return self.condition()
+
+    def condition(self):
+        name = self.text()
+        if self.peek() == ('keyword', 'NOT'):
+            self.take()
+            self.take('keyword', 'IN')
+            return ('cmp', name, 'not in', self.value_list())
+        if self.peek() == ('keyword', 'IN'):
+            self.take()
+            return ('cmp', name, 'in', self.value_list())
+        op = self.take('op')[1]
+        if op not in OPERATORS:
+            raise click.ClickException(f"Expected an operator after {name} in the query, found '{op}'.")
+        return ('cmp', name, op, [self.text()])
+
+    def value_list(self):
+        self.take('op', '(')
+        values = [self.text()]
+        while self.peek() == ('op', ','):
+            self.take()
+            values.append(self.text())
+        self.take('op', ')')
+        return values
+
+    def text(self):
+        # unquoted names and values run over spaces until an operator or keyword
+        token = self.peek()
+        if token is not None and token[0] == 'value':
+            self.take()
+            return token[1]
+        words = [self.take('word')[1]]
+        while self.peek() is not None and self.peek()[0] == 'word':
+            words.append(self.take()[1])
+        return ' '.join(words)
+
+
+def query_names(node):
+    """Names used by the conditions of a parsed query, in order."""
+    if node[0] == 'cmp':
+        return [node[1]]
+    if node[0] == 'not':
+        return query_names(node[1])
+    return list(dict.fromkeys(name for child in node[1] for name in query_names(child)))
+
+
+class PropertyArrays:
+    """The attribute/value pairs of a property database as numpy arrays.
+
+    A property of many elements is answered with a handful of vectorized lookups over
+    the pairs: every element gets the value index of its own property, overridden by
+    the one of its type (``instanceof_objid``) like the data_revit rows, or -1.
+    """
+
+    def __init__(self, propdb):
+        self.propdb = propdb
+        offsets = np.asarray(propdb.offsets, dtype=np.int64)
+        pairs = np.asarray(propdb.avs, dtype=np.int64).reshape(-1, 2)
+        self.count = len(offsets)
+        self.offsets = np.append(offsets, len(pairs))
+        self.owners = np.searchsorted(offsets, np.arange(len(pairs)), side='right') - 1
+        self.attrs = pairs[:, 0]
+        self.values = pairs[:, 1]
+        self.attr_names = np.array([attr[0] if isinstance(attr, list) and attr else '' for attr in propdb.attrs],
+                                   dtype=object)
+        categories = [attr[1] if isinstance(attr, list) and len(attr) > 1 else None for attr in propdb.attrs]
+        # type properties come from get_properties, which leaves out the internal categories
+        self.type_attrs = np.array([bool(category) and not INTERNAL_CATEGORY.match(category)
+                                    for category in categories], dtype=bool)
+        self.instance_of = np.full(self.count, -1, dtype=np.int64)
+        mask = np.isin(self.attrs, self.attr_indices('instanceof_objid'))
+        self.instance_of[self.owners[mask]] = [int(propdb.vals[value]) for value in self.values[mask]]
+        self._level_nodes = None
+
+    def attr_indices(self, name):
+        return np.flatnonzero(self.attr_names == name)
+
+    def value_indices(self, name, ids):
+        """Value index of a property on every element of ids, -1 where it has none."""
+        attrs = self.attr_indices('name' if name == 'Name' else name)
+        result = self._lookup(attrs, ids)
+        types = self.instance_of[ids]
+        has_type = types >= 0
+        if has_type.any():
+            type_values = self._lookup(attrs[self.type_attrs[attrs]], types[has_type])
+            result[has_type] = np.where(type_values >= 0, type_values, result[has_type])
+        return result
+
+    def column(self, name, ids):
+        """Values of a property on every element of ids, None where it has none."""
+        indices = self.value_indices(name, ids)
+        vals = self.propdb.vals
+        return [vals[index] if index >= 0 else None for index in indices.tolist()]
+
+    def properties(self, db_id):
+        """Properties of one element updated with the ones of its type, like a data_revit row."""
+        properties = {}
+        for position in range(self.offsets[db_id], self.offsets[db_id + 1]):
+            name = self.attr_names[self.attrs[position]]
+            if name and name not in IGNORED_PROPERTIES:
+                properties['Name' if name == 'name' else name] = self.propdb.vals[self.values[position]]
+        type_id = self.instance_of[db_id]
+        if type_id >= 0:
+            for position in range(self.offsets[type_id], self.offsets[type_id + 1]):
+                if self.type_attrs[self.attrs[position]]:
+                    properties[self.attr_names[self.attrs[position]]] = self.propdb.vals[self.values[position]]
+        return properties
+
+    def leaves(self, ids, is_sub_family):
+        """Drop the category, family and type nodes from ids, and the sub families unless they are asked for."""
+        if self._level_nodes is None:
+            levels = np.isin(self.attrs, np.flatnonzero(np.isin(self.attr_names, ['_RC', '_RFN', '_RFT'])))
+            self._level_nodes = np.zeros(self.count, dtype=bool)
+            self._level_nodes[self.owners[levels]] = True
+        keep = ~self._level_nodes[ids]
+        if not is_sub_family:
+            sub_families = np.zeros(self.count, dtype=bool)
+            attrs = [i for i, attr in enumerate(self.propdb.attrs) if isinstance(attr, list) and len(attr) > 1
+                     and attr[0] == 'Sub Family' and attr[1] == '__internalref__']
+            sub_families[self.owners[np.isin(self.attrs, attrs)]] = True
+            keep &= ~sub_families[ids]
+        return ids[keep]
+
+    def property_names(self, ids):
+        """Every property name on the elements of ids or their types, in attribute order."""
+        own = np.isin(self.owners, ids)
+        types = self.instance_of[ids]
+        typed = np.isin(self.owners, types[types >= 0]) & self.type_attrs[self.attrs]
+        attrs = np.unique(self.attrs[own | typed])
+        names = [self.attr_names[attr] for attr in attrs if self.attr_names[attr] not in IGNORED_PROPERTIES]
+        return ['Name' if name == 'name' else name for name in dict.fromkeys(names) if name]
+
+    def _lookup(self, attrs, ids):
+        result = np.full(len(ids), -1, dtype=np.int64)
+        if len(attrs) == 0 or len(ids) == 0:
+            return result
+        mask = np.isin(self.attrs, attrs)
+        # the last pair of an element wins, like the dict the toolkit builds
+        values = np.full(self.count, -1, dtype=np.int64)
+        values[self.owners[mask]] = self.values[mask]
+        return values[ids]
+
+
+class RevitQuery:
+    """Evaluate a parsed query over the elements of a property database.
+
+    Category, Family and Type conditions that every result must meet are pushed down to
+    the element ranges of the index, so only the elements under the matching family
+    types are looked at. The other conditions are vectorized over the property arrays,
+    and rows are only built for the matching elements and the asked parameters.
+    """
+
+    def __init__(self, propdb, urn=None, region=None):
+        self.propdb = propdb
+        self.index = getattr(propdb, 'index', None)
+        if self.index is None:
+            from .revitindex import RevitIndex
+            self.index = RevitIndex.attach(propdb, urn, region)
+        self.arrays = PropertyArrays(propdb)
+        self._names = None
+
+    @traced('query elements', 'transform')
+    def element_ids(self, node=None, is_sub_family=False):
+        """dbIds of the elements matching a parsed query, or of every element without one, in tree order."""
+        node = node or ('and', [])
+        pushed = {}
+        for condition in (node[1] if node[0] == 'and' else [node]):
+            name = INDEX_NAMES.get(condition[1].lower().replace(' ', '')) if condition[0] == 'cmp' else None
+            if name and condition[2] in ['=', 'in'] and name not in pushed:
+                pushed[name] = condition[3]
+        ids = self.index.element_ids(categories=pushed.get('Category'), families=pushed.get('Family'),
+                                     family_types=pushed.get('Type'))
+        ids = _unique(ids)
+        ids = self.arrays.leaves(ids, is_sub_family)
+        return ids[self._mask(node, ids)]
+
+    @traced('query rows', 'transform')
+    def rows(self, ids, parameters, display_unit=False):
+        """DataFrame of the elements of ids with their dbId, external_id and the parameters."""
+        import pandas as pd
+        data = {'dbId': ids, 'external_id': [self.propdb.ids[i] for i in ids.tolist()]}
+        units = parameter_units(self.propdb, parameters) if display_unit else {}
+        for name in parameters:
+            index_name = INDEX_NAMES.get(name.lower().replace(' ', ''))
+            if index_name:
+                data[index_name] = self.index_names(index_name, ids)
+                continue
+            values = self.arrays.column(name, ids)
+            if name in units:
+                values = [f"{value} {units[name]}" if value is not None else None for value in values]
+            data[name] = values
+        return pd.DataFrame(data)
+
+    def _mask(self, node, ids):
+        if node[0] == 'and':
+            mask = np.ones(len(ids), dtype=bool)
+            for child in node[1]:
+                # later conditions only look at the elements still in
+                mask[mask] = self._mask(child, ids[mask])
+            return mask
+        if node[0] == 'or':
+            mask = np.zeros(len(ids), dtype=bool)
+            for child in node[1]:
+                mask[~mask] = self._mask(child, ids[~mask])
+            return mask
+        if node[0] == 'not':
+            return ~self._mask(node[1], ids)
+        _, name, op, literals = node
+        index_name = INDEX_NAMES.get(name.lower().replace(' ', ''))
+        if index_name:
+            if index_name == 'Category':
+                # "Revit Walls" and "Walls" are the same category, like data_revit_by_categories
+                literals = [value[5:].strip() if value.startswith('Revit') else value for value in literals]
+            values = self.index_names(index_name, ids)
+            present = np.array([value is not None for value in values], dtype=bool)
+            unique, inverse = np.unique(np.array([value or '' for value in values], dtype=str), return_inverse=True)
+            return _compare(unique.tolist(), inverse.reshape(-1), present, op, literals)
+        indices = self.arrays.value_indices(name, ids)
+        present = indices >= 0
+        unique, inverse = np.unique(indices, return_inverse=True)
+        vals = self.propdb.vals
+        return _compare([vals[i] if i >= 0 else None for i in unique.tolist()], inverse.reshape(-1), present, op,
+                        literals)
+
+    def index_names(self, name, ids):
+        """Category, Family or Type name of every element of ids from the index, None outside it."""
+        if self._names is None:
+            arrays = self.index.arrays
+            # family type position of every element in the index
+            positions = np.full(self.arrays.count, -1, dtype=np.int64)
+            positions[arrays['element_ids']] = np.repeat(np.arange(len(arrays['type_ids'])),
+                                                         np.diff(arrays['element_ptr']))
+            names = np.char.strip(self.index.names.astype(str))
+            self._names = (positions, {'Category': names[arrays['type_categories']],
+                                       'Family': names[arrays['type_families']],
+                                       'Type': names[arrays['type_names']]})
+        positions, columns = self._names
+        found = positions[ids]
+        return [str(columns[name][p]) if p >= 0 else None for p in found.tolist()]
+
+
+def _unique(ids):
+    """Unique ids in the order they first appear."""
+    _, first = np.unique(ids, return_index=True)
+    return ids[np.sort(first)]
+
+
+def _compare(values, inverse, present, op, literals):
+    """Compare every distinct value once and spread the result over the elements."""
+    if op in ['=', '!=', 'in', 'not in']:
+        matched = np.array([value is not None and any(_equals(value, literal) for literal in literals)
+                            for value in values], dtype=bool)
+        result = matched[inverse]
+        return result if op in ['=', 'in'] else present & ~result
+    literal = literals[0]
+    number = _number(literal)
+    matched = []
+    for value in values:
+        if value is None:
+            matched.append(False)
+            continue
+        left, right = (_number(value), number) if number is not None and _number(value) is not None \
+            else (str(value), literal)
+        matched.append({'>': left > right, '>=': left >= right, '<': left < right, '<=': left <= right}[op])
+    return np.array(matched, dtype=bool)[inverse] & present
+
+
+def _equals(value, literal):
+    number = _number(literal)
+    if number is not None and _number(value) is not None:
+        return _number(value) == number
+    return str(value).strip() == literal.strip()
+
+
+def _number(value):
+    if isinstance(value, bool):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+@click.command()
+@click.option('--urn', prompt='URN', default=lambda: Config.load_derivative_urn(),
+              help='The derivative urn of the item version.')
+@click.option('--region', prompt='Region', default=lambda: Config.load_region(), help='The region of the item.')
+@click.option('--query', prompt='Query', default=lambda: Config.load_revit_query(),
+              help='The conditions of the elements, e.g. "Category=Rooms AND Area>20 AND Level IN (L1,L2)".')
+@click.option('--parameters', prompt='Parameters', default='',
+              help='The parameters of the rows, * for all, empty for the ones in the query.')
+@click.option('--is_sub_family', prompt='Is Sub Family(y/n)', default="n", help='The is sub family of the elements.')
+@click.option('--display_unit', prompt='Display Unit(y/n)', default="n", help='The display unit of the item.')
+@click.option('--save_data', prompt='Save Data(y/n)', default='n', help='Save data to file.')
+@format_option
+@output_options
+def revit_query(urn, region, query, parameters, is_sub_family, display_unit, save_data, save_format, output, limit):
+    """Read the Revit elements matching a query by urn."""
+    if not urn:
+        click.echo("Please provide a urn.")
+        return
+    if not query:
+        click.echo("Please provide a query.")
+        return
+    node = parse_query(query)
+    token = TokenConfig.load_config()
+    Config.save_region(region)
+    propdb = PropDbCache.load(urn, token, region)
+    Config.save_derivative_urn(urn)
+    Config.save_revit_query(query)
+    is_sub_family = str.lower(is_sub_family) == 'y'
+    display_unit = str.lower(display_unit) == 'y'
+    engine = RevitQuery(propdb, urn, region)
+    ids = engine.element_ids(node, is_sub_family)
+    if parameters.strip() == '*':
+        list_parameters = engine.arrays.property_names(ids)
+    elif parameters.strip():
+        list_parameters = [name.strip() for name in parameters.split(',') if name.strip()]
+    else:
+        list_parameters = list(dict.fromkeys(['Name'] + query_names(node)))
+    df = engine.rows(ids, list_parameters, display_unit)
+    if df.empty:
+        click.echo("No data found.")
+        return
+    if str.lower(save_data) == 'y':
+        file_path = save_frame(df, 'data_revit_query', save_format, parameter_units(propdb, df.columns))
+        click.echo(f"Revit data saved to {file_path}", err=True)
+    show(df, output, limit)
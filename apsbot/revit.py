@@ -1,10 +1,13 @@
 import click
 from .tokenconfig import TokenConfig
-from aps_toolkit import PropDbReaderRevit
+from .cache import PropDbCache
+from .snapshot import RevitSnapshot
 from .config import Config
 import pandas as pd
-from tabulate import tabulate
-import os
+from .output import output_options, show
+from .export import format_option, save_frame, parameter_units
+from .models import model_options, read_models, ModelExtraction
+from .checkpoint import Checkpoint, PERSIST_ELEMENTS
 import warnings
 
 
@@ -13,14 +16,16 @@ import warnings
               help='The derivative urn of the item version.')
 @click.option('--region', prompt='Region', default=lambda: Config.load_region(), help='The region of the item.')
 @click.option('--save_data', prompt='Save Data(y/n)', default="n", help='Save data to file.')
-def revit_parameters(urn, region, save_data):
+@format_option
+@output_options
+def revit_parameters(urn, region, save_data, save_format, output, limit):
     """Read all parameters by urn."""
-    token = TokenConfig.load_config()
-    Config.save_region(region)
-    propdb = PropDbReaderRevit(urn, token, region)
     if not urn:
         click.echo("Please provide a urn.")
         return
+    token = TokenConfig.load_config()
+    Config.save_region(region)
+    propdb = PropDbCache.load(urn, token, region)
     Config.save_derivative_urn(urn)
     list = propdb.get_all_parameters()
     series = pd.Series(list)
@@ -29,11 +34,9 @@ def revit_parameters(urn, region, save_data):
         click.echo("No data found.")
         return
     if str.lower(save_data) == 'y':
-        folder = Config.load_folder_path()
-        file_path = os.path.join(folder, 'parameters.csv')
-        df.to_csv(file_path, index=False)
-        click.echo(f"Revit data saved to {file_path}")
-    print(tabulate(df, headers="keys", tablefmt="psql"))
+        file_path = save_frame(df, 'parameters', save_format)
+        click.echo(f"Revit data saved to {file_path}", err=True)
+    show(df, output, limit)
 
 
 ## all categories
@@ -42,14 +45,16 @@ def revit_parameters(urn, region, save_data):
               help='The derivative urn of the item version.')
 @click.option('--region', prompt='Region', default=lambda: Config.load_region(), help='The region of the item.')
 @click.option('--save_data', prompt='Save Data(y/n)', default='n', help='Save data to file.')
-def revit_categories(urn, region, save_data):
+@format_option
+@output_options
+def revit_categories(urn, region, save_data, save_format, output, limit):
     """Read all categories by urn."""
-    token = TokenConfig.load_config()
-    Config.save_region(region)
-    propdb = PropDbReaderRevit(urn, token, region)
     if not urn:
         click.echo("Please provide a urn.")
         return
+    token = TokenConfig.load_config()
+    Config.save_region(region)
+    propdb = PropDbCache.load(urn, token, region)
     Config.save_derivative_urn(urn)
     dict_categories = propdb.get_all_categories()
     df = pd.DataFrame.from_dict(dict_categories, orient='index', columns=['Category'])
@@ -62,11 +67,9 @@ def revit_categories(urn, region, save_data):
         click.echo("No data found.")
         return
     if str.lower(save_data) == 'y':
-        folder = Config.load_folder_path()
-        file_path = os.path.join(folder, 'categories.csv')
-        df.to_csv(file_path, index=False)
-        click.echo(f"Revit data saved to {file_path}")
-    print(tabulate(df, headers="keys", tablefmt="psql"))
+        file_path = save_frame(df, 'categories', save_format)
+        click.echo(f"Revit data saved to {file_path}", err=True)
+    show(df, output, limit)
 
 
 # families
@@ -75,14 +78,16 @@ def revit_categories(urn, region, save_data):
               help='The derivative urn of the item version.')
 @click.option('--region', prompt='Region', default=lambda: Config.load_region(), help='The region of the item.')
 @click.option('--save_data', prompt='Save Data(y/n)', default='n', help='Save data to file.')
-def revit_families(urn, region, save_data):
+@format_option
+@output_options
+def revit_families(urn, region, save_data, save_format, output, limit):
     """Read all families by urn."""
-    token = TokenConfig.load_config()
-    Config.save_region(region)
-    propdb = PropDbReaderRevit(urn, token, region)
     if not urn:
         click.echo("Please provide a urn.")
         return
+    token = TokenConfig.load_config()
+    Config.save_region(region)
+    propdb = PropDbCache.load(urn, token, region)
     Config.save_derivative_urn(urn)
     dict_families = propdb.get_all_families()
     df = pd.DataFrame.from_dict(dict_families, orient='index', columns=['Family'])
@@ -95,11 +100,9 @@ def revit_families(urn, region, save_data):
         click.echo("No data found.")
         return
     if str.lower(save_data) == 'y':
-        folder = Config.load_folder_path()
-        file_path = os.path.join(folder, 'families.csv')
-        df.to_csv(file_path, index=False)
-        click.echo(f"Revit data saved to {file_path}")
-    print(tabulate(df, headers="keys", tablefmt="psql"))
+        file_path = save_frame(df, 'families', save_format)
+        click.echo(f"Revit data saved to {file_path}", err=True)
+    show(df, output, limit)
 
 
 # family types
@@ -108,14 +111,16 @@ def revit_families(urn, region, save_data):
               help='The derivative urn of the item version.')
 @click.option('--region', prompt='Region', default=lambda: Config.load_region(), help='The region of the item.')
 @click.option('--save_data', prompt='Save Data(y/n)', default='n', help='Save data to file.')
-def revit_family_types(urn, region, save_data):
+@format_option
+@output_options
+def revit_family_types(urn, region, save_data, save_format, output, limit):
     """Read all family types by urn."""
-    token = TokenConfig.load_config()
-    Config.save_region(region)
-    propdb = PropDbReaderRevit(urn, token, region)
     if not urn:
         click.echo("Please provide a urn.")
         return
+    token = TokenConfig.load_config()
+    Config.save_region(region)
+    propdb = PropDbCache.load(urn, token, region)
     Config.save_derivative_urn(urn)
     dict_families = propdb.get_all_families_types()
     df = pd.DataFrame.from_dict(dict_families, orient='index', columns=['Family Type'])
@@ -128,11 +133,9 @@ def revit_family_types(urn, region, save_data):
         click.echo("No data found.")
         return
     if str.lower(save_data) == 'y':
-        folder = Config.load_folder_path()
-        file_path = os.path.join(folder, 'family_types.csv')
-        df.to_csv(file_path, index=False)
-        click.echo(f"Revit data saved to {file_path}")
-    print(tabulate(df, headers="keys", tablefmt="psql"))
+        file_path = save_frame(df, 'family_types', save_format)
+        click.echo(f"Revit data saved to {file_path}", err=True)
+    show(df, output, limit)
 
 
 # revit categories and family and types
@@ -141,45 +144,47 @@ def revit_family_types(urn, region, save_data):
               help='The derivative urn of the item version.')
 @click.option('--region', prompt='Region', default=lambda: Config.load_region(), help='The region of the item.')
 @click.option('--save_data', prompt='Save Data(y/n)', default='n', help='Save data to file.')
-def revit_categories_families_types(urn, region, save_data):
+@format_option
+@output_options
+def revit_categories_families_types(urn, region, save_data, save_format, output, limit):
     """Read all categories, families, and family types by urn."""
-    token = TokenConfig.load_config()
-    Config.save_region(region)
-    propdb = PropDbReaderRevit(urn, token, region)
     if not urn:
         click.echo("Please provide a urn.")
         return
+    token = TokenConfig.load_config()
+    Config.save_region(region)
+    propdb = PropDbCache.load(urn, token, region)
     Config.save_derivative_urn(urn)
     df = propdb.get_categories_families_types()
     if df.empty:
         click.echo("No data found.")
         return
     if str.lower(save_data) == 'y':
-        folder = Config.load_folder_path()
-        file_path = os.path.join(folder, 'categories_families_types.csv')
-        df.to_csv(file_path, index=False)
-        click.echo(f"Revit data saved to {file_path}")
-    print(tabulate(df, headers="keys", tablefmt="psql"))
+        file_path = save_frame(df, 'categories_families_types', save_format)
+        click.echo(f"Revit data saved to {file_path}", err=True)
+    show(df, output, limit)
 
 
 ## by categories
 @click.command()
 @click.option('--urn', prompt='URN', default=lambda: Config.load_derivative_urn(),
-              help='The derivative urn of the item version.')
+              help='The derivative urn of the item version, urns separated by commas or an items file.')
 @click.option('--region', prompt='Region', default=lambda: Config.load_region(), help='The region of the item.')
 @click.option('--categories', prompt='Categories', default=lambda: Config.load_revit_categories(),
               help='The categories of the elements.')
 @click.option('--is_sub_family', prompt='Is Sub Family(y/n)', default="n", help='The is sub family of the elements.')
 @click.option('--display_unit', prompt='Display Unit(y/n)', default="n", help='The display unit of the item.')
 @click.option('--save_data', prompt='Save Data(y/n)', default='n', help='Save data to file.')
-def data_revit_by_categories(urn, region, categories, is_sub_family, display_unit, save_data):
+@format_option
+@model_options
+@output_options
+def data_revit_by_categories(urn, region, categories, is_sub_family, display_unit, save_data, save_format, workers,
+                             max_memory, output, limit):
     """Read Revit data by categories."""
-    token = TokenConfig.load_config()
-    Config.save_region(region)
-    propdb = PropDbReaderRevit(urn, token, region)
     if not urn:
         click.echo("Please provide a urn.")
         return
+    Config.save_region(region)
     if not categories:
         click.echo("Please provide categories.")
         return
@@ -195,38 +200,56 @@ def data_revit_by_categories(urn, region, categories, is_sub_family, display_uni
     else:
         display_unit = False
     # main function
-    print("Categories: ", list_categories)
-    df = propdb.get_data_by_categories(list_categories, is_sub_family, display_unit=display_unit)
+    click.echo(f"Categories: {list_categories}", err=True)
+    models = read_models(urn)
+    if not models:
+        click.echo("No urns found.")
+        return
+    failed = []
+    if len(models) > 1:
+        job = {'categories': list_categories, 'is_sub_family': is_sub_family, 'display_unit': display_unit}
+        df, units, failed = _extract_models(models, region, 'data_by_categories', job, workers, max_memory)
+    else:
+        urn = models[0][0]
+        propdb = None
+        df = RevitSnapshot.read(urn, region, is_sub_family, display_unit, categories=list_categories)
+        if df is None:
+            token = TokenConfig.load_config()
+            propdb = PropDbCache.load(urn, token, region)
+            df = propdb.get_data_by_categories(list_categories, is_sub_family, display_unit=display_unit)
+        units = _parameter_units(df, propdb, urn, region, is_sub_family, display_unit)
     if df.empty:
         click.echo("No data found.")
+        _check_failed(failed, models)
         return
     if str.lower(save_data) == 'y':
-        folder = Config.load_folder_path()
-        file_path = os.path.join(folder, 'data_revit_categories.csv')
-        df.to_csv(file_path, index=False)
-        click.echo(f"Revit data saved to {file_path}")
-    print(tabulate(df, headers="keys", tablefmt="psql"))
+        file_path = save_frame(df, 'data_revit_categories', save_format, units)
+        click.echo(f"Revit data saved to {file_path}", err=True)
+    show(df, output, limit)
+    _check_failed(failed, models)
 
 
 ## data_revit_by_family
 @click.command()
 @click.option('--urn', prompt='URN', default=lambda: Config.load_derivative_urn(),
-              help='The derivative urn of the item version.')
+              help='The derivative urn of the item version, urns separated by commas or an items file.')
 @click.option('--region', prompt='Region', default=lambda: Config.load_region(), help='The region of the item.')
 @click.option('--families', prompt='Families', default=lambda: Config.load_revit_families(),
               help='The list family names of the elements.')
 @click.option('--is_sub_family', prompt='Is Sub Family(y/n)', default="n", help='The is sub family of the elements.')
 @click.option('--display_unit', prompt='Display Unit(y/n)', default="n", help='The display unit of the item.')
 @click.option('--save_data', prompt='Save Data(y/n)', default='n', help='Save data to file.')
-def data_revit_by_family(urn, region, families, is_sub_family, display_unit, save_data):
+@format_option
+@model_options
+@output_options
+def data_revit_by_family(urn, region, families, is_sub_family, display_unit, save_data, save_format, workers,
+                         max_memory, output, limit):
     """Read Revit data by family."""
 
-    token = TokenConfig.load_config()
-    Config.save_region(region)
-    propdb = PropDbReaderRevit(urn, token, region)
     if not urn:
         click.echo("Please provide a urn.")
         return
+    Config.save_region(region)
     if not families:
         click.echo("Please provide family.")
         return
@@ -242,36 +265,54 @@ def data_revit_by_family(urn, region, families, is_sub_family, display_unit, sav
     else:
         display_unit = False
     # main function
-    print("Families: ", list_families)
-    df = propdb.get_data_by_families(families, is_sub_family, display_unit=display_unit)
+    click.echo(f"Families: {list_families}", err=True)
+    models = read_models(urn)
+    if not models:
+        click.echo("No urns found.")
+        return
+    failed = []
+    if len(models) > 1:
+        job = {'families': list_families, 'is_sub_family': is_sub_family, 'display_unit': display_unit}
+        df, units, failed = _extract_models(models, region, 'data_by_families', job, workers, max_memory)
+    else:
+        urn = models[0][0]
+        propdb = None
+        df = RevitSnapshot.read(urn, region, is_sub_family, display_unit, families=list_families)
+        if df is None:
+            token = TokenConfig.load_config()
+            propdb = PropDbCache.load(urn, token, region)
+            df = propdb.get_data_by_families(list_families, is_sub_family, display_unit=display_unit)
+        units = _parameter_units(df, propdb, urn, region, is_sub_family, display_unit)
     if df.empty:
         click.echo("No data found.")
+        _check_failed(failed, models)
         return
     if str.lower(save_data) == 'y':
-        folder = Config.load_folder_path()
-        file_path = os.path.join(folder, 'data_revit_families.csv')
-        df.to_csv(file_path, index=False)
-        click.echo(f"Revit data saved to {file_path}")
-    print(tabulate(df, headers="keys", tablefmt="psql"))
+        file_path = save_frame(df, 'data_revit_families', save_format, units)
+        click.echo(f"Revit data saved to {file_path}", err=True)
+    show(df, output, limit)
+    _check_failed(failed, models)
 
 
 ## data_revit_by_family_types
 @click.command()
 @click.option('--urn', prompt='URN', default=lambda: Config.load_derivative_urn(),
-              help='The derivative urn of the item version.')
+              help='The derivative urn of the item version, urns separated by commas or an items file.')
 @click.option('--region', prompt='Region', default=lambda: Config.load_region(), help='The region of the item.')
 @click.option('--family_types', prompt='Family Types', default=lambda: Config.load_revit_family_types(),
               help='The list family types name of the elements.')
 @click.option('--display_unit', prompt='Display Unit(y/n)', default="n", help='The display unit of the item.')
 @click.option('--save_data', prompt='Save Data(y/n)', default='n', help='Save data to file.')
-def data_revit_by_family_types(urn, region, family_types, display_unit, save_data):
+@format_option
+@model_options
+@output_options
+def data_revit_by_family_types(urn, region, family_types, display_unit, save_data, save_format, workers, max_memory,
+                               output, limit):
     """Read Revit data by family types."""
-    token = TokenConfig.load_config()
-    Config.save_region(region)
-    propdb = PropDbReaderRevit(urn, token, region)
     if not urn:
         click.echo("Please provide a urn.")
         return
+    Config.save_region(region)
     if not family_types:
         click.echo("Please provide list name if family types.\b e.g. <Wall,Door>")
         return
@@ -283,23 +324,39 @@ def data_revit_by_family_types(urn, region, family_types, display_unit, save_dat
     else:
         display_unit = False
     # main function
-    print("Family Types: ", list_family_types)
-    df = propdb.get_data_by_family_types(list_family_types, display_unit=display_unit)
+    click.echo(f"Family Types: {list_family_types}", err=True)
+    models = read_models(urn)
+    if not models:
+        click.echo("No urns found.")
+        return
+    failed = []
+    if len(models) > 1:
+        job = {'family_types': list_family_types, 'is_sub_family': False, 'display_unit': display_unit}
+        df, units, failed = _extract_models(models, region, 'data_by_family_types', job, workers, max_memory)
+    else:
+        urn = models[0][0]
+        propdb = None
+        df = RevitSnapshot.read(urn, region, False, display_unit, family_types=list_family_types)
+        if df is None:
+            token = TokenConfig.load_config()
+            propdb = PropDbCache.load(urn, token, region)
+            df = propdb.get_data_by_family_types(list_family_types, display_unit=display_unit)
+        units = _parameter_units(df, propdb, urn, region, False, display_unit)
     if df.empty:
         click.echo("No data found.")
+        _check_failed(failed, models)
         return
     if str.lower(save_data) == 'y':
-        folder = Config.load_folder_path()
-        file_path = os.path.join(folder, 'data_revit_family_types.csv')
-        df.to_csv(file_path, index=False)
-        click.echo(f"Revit data saved to {file_path}")
-    print(tabulate(df, headers="keys", tablefmt="psql"))
+        file_path = save_frame(df, 'data_revit_family_types', save_format, units)
+        click.echo(f"Revit data saved to {file_path}", err=True)
+    show(df, output, limit)
+    _check_failed(failed, models)
 
 
 ## by categories and parameteres
 @click.command()
 @click.option('--urn', prompt='URN', default=lambda: Config.load_derivative_urn(),
-              help='The derivative urn of the item version.')
+              help='The derivative urn of the item version, urns separated by commas or an items file.')
 @click.option('--region', prompt='Region', default=lambda: Config.load_region(), help='The region of the item.')
 @click.option('--categories', prompt='Categories', default=lambda: Config.load_revit_categories(),
               help='The categories of the elements.')
@@ -308,14 +365,17 @@ def data_revit_by_family_types(urn, region, family_types, display_unit, save_dat
 @click.option('--is_sub_family', prompt='Is Sub Family(y/n)', default="n", help='The is sub family of the elements.')
 @click.option('--display_unit', prompt='Display Unit(y/n)', default="n", help='The display unit of the item.')
 @click.option('--save_data', prompt='Save Data(y/n)', default='n', help='Save data to file.')
-def data_revit_by_cats_params(urn, region, categories, parameters, is_sub_family, display_unit, save_data):
+@format_option
+@model_options
+@click.option('--resume', default='n', help='Continue an interrupted run from its last checkpoint (y/n).')
+@output_options
+def data_revit_by_cats_params(urn, region, categories, parameters, is_sub_family, display_unit, save_data, save_format,
+                              workers, max_memory, resume, output, limit):
     """Read Revit data by categories and parameters."""
-    token = TokenConfig.load_config()
-    Config.save_region(region)
-    propdb = PropDbReaderRevit(urn, token, region)
     if not urn:
         click.echo("Please provide a urn.")
         return
+    Config.save_region(region)
     if not categories:
         click.echo("Please provide categories.")
         return
@@ -336,16 +396,107 @@ def data_revit_by_cats_params(urn, region, categories, parameters, is_sub_family
     else:
         display_unit = False
     # main function
-    print("Categories: ", list_categories)
-    print("Parameters: ", list_parameters)
-    df = propdb.get_data_by_categories_and_params(list_categories, list_parameters, is_sub_family,
-                                                  display_unit=display_unit)
+    click.echo(f"Categories: {list_categories}", err=True)
+    click.echo(f"Parameters: {list_parameters}", err=True)
+    models = read_models(urn)
+    if not models:
+        click.echo("No urns found.")
+        return
+    failed = []
+    resume = str.lower(resume) == 'y'
+    checkpoint_job = {'urn': urn, 'region': region, 'categories': list_categories, 'parameters': list_parameters,
+                      'is_sub_family': is_sub_family, 'display_unit': display_unit}
+    checkpoint = None
+    if len(models) > 1:
+        # every model is saved to the checkpoint as it finishes
+        checkpoint = Checkpoint('data_revit_by_cats_params', checkpoint_job, resume)
+        job = {'categories': list_categories, 'parameters': list_parameters,
+               'is_sub_family': is_sub_family, 'display_unit': display_unit}
+        df, units, failed = _extract_models(models, region, 'data_by_cats_params', job, workers, max_memory,
+                                            checkpoint)
+    else:
+        urn = models[0][0]
+        propdb = None
+        df = RevitSnapshot.read(urn, region, is_sub_family, display_unit, categories=list_categories,
+                                parameters=list_parameters)
+        if df is None:
+            token = TokenConfig.load_config()
+            propdb = PropDbCache.load(urn, token, region)
+            # the categories of a small model are combined in memory, only large ones or --resume y go to disk
+            checkpoint = Checkpoint('data_revit_by_cats_params', checkpoint_job, resume,
+                                    persist=resume or len(propdb.ids) >= PERSIST_ELEMENTS)
+            df = _extract_by_categories(propdb, list_categories, list_parameters, is_sub_family, display_unit,
+                                        checkpoint)
+        units = _parameter_units(df, propdb, urn, region, is_sub_family, display_unit)
     if df.empty:
         click.echo("No data found.")
+        _finish_checkpoint(checkpoint, failed)
+        _check_failed(failed, models)
         return
     if str.lower(save_data) == 'y':
-        folder = Config.load_folder_path()
-        file_path = os.path.join(folder, 'data_revit_categories_params.csv')
-        df.to_csv(file_path, index=False)
-        click.echo(f"Revit data saved to {file_path}")
-    print(tabulate(df, headers="keys", tablefmt="psql"))
+        file_path = save_frame(df, 'data_revit_categories_params', save_format, units)
+        click.echo(f"Revit data saved to {file_path}", err=True)
+    show(df, output, limit)
+    _finish_checkpoint(checkpoint, failed)
+    _check_failed(failed, models)
+
+
+def _extract_by_categories(propdb, categories, parameters, is_sub_family, display_unit, checkpoint):
+    """Read the parameters of one category at a time, skipping the categories the checkpoint has."""
+    if checkpoint.resumed:
+        click.echo(f"Resumed with {checkpoint.rows()} rows read earlier.", err=True)
+    names = [name for name in dict.fromkeys(propdb.get_all_categories().values()) if name in categories]
+    for name in names:
+        if checkpoint.done(name):
+            continue
+        # the toolkit appends Name to the list it gets
+        df = propdb.get_data_by_categories_and_params([name], list(parameters), is_sub_family,
+                                                      display_unit=display_unit)
+        checkpoint.save(name, df)
+    frames = list(checkpoint.frames())
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+
+def _finish_checkpoint(checkpoint, failed):
+    if checkpoint is None:
+        return
+    # failed models keep the checkpoint, so a run with --resume y only extracts them again
+    if len(failed):
+        click.echo("Run again with --resume y to retry the failed models.", err=True)
+        return
+    checkpoint.clear()
+
+
+def _parameter_units(df, propdb, urn, region, is_sub_family, display_unit):
+    """Units of the parameters in df, from the property database or else from the snapshot df was read from."""
+    if propdb is not None:
+        return parameter_units(propdb, df.columns)
+    units = RevitSnapshot.units(urn, region, is_sub_family, display_unit)
+    return {name: unit for name, unit in units.items() if name in df.columns}
+
+
+def _extract_models(models, region, extract, job, workers, max_memory, checkpoint=None):
+    """Run an extraction on every model in worker processes. Return the combined frame, units and failed models."""
+    token = TokenConfig.load_config()
+    extraction = ModelExtraction(token, region, extract, job, workers, max_memory, checkpoint)
+    click.echo(f"Extracting {len(models)} models with {extraction.workers} workers.", err=True)
+    if checkpoint is not None and checkpoint.resumed:
+        done = [urn for urn, _ in models if checkpoint.done(urn)]
+        click.echo(f"Resumed with {len(done)} of {len(models)} models done earlier.", err=True)
+
+    def on_model(status):
+        error = f": {status['error']}" if status['error'] else ''
+        click.echo(f"{status['status']} {status['model']}, {status['rows']} rows in {status['seconds']}s{error}",
+                   err=True)
+
+    TokenConfig.start_auto_refresh(token)
+    try:
+        df, statuses = extraction.run(models, on_model)
+    finally:
+        TokenConfig.stop_auto_refresh()
+    return df, extraction.units, statuses[statuses['status'] == 'failed']
+
+
+def _check_failed(failed, models):
+    if len(failed):
+        raise click.ClickException(f"{len(failed)} of {len(models)} models failed.")
@@ -0,0 +1,192 @@
+import os
+import numpy as np
+from .config import Config
+from .trace import traced
+
+# bump when the arrays change so older index files are rebuilt
+INDEX_VERSION = 1
+# property names of category, family and type nodes
+LEVELS = ['_RC', '_RFN', '_RFT']
+
+
+class RevitIndex:
+    """Category, family and type index of one Revit property database.
+
+    It is built once per model with a single pass over the attribute/value arrays and
+    saved as ``index.npz`` next to the cached property database, so it goes away with
+    the cache entry. Everything is an array: category, family and type nodes in tree
+    order with codes into one name table, and the element dbIds under each type as a
+    range (``element_ptr[i]:element_ptr[i + 1]``) of one flat ``element_ids`` array.
+    """
+    file_name = 'index.npz'
+
+    def __init__(self, arrays):
+        self.arrays = arrays
+        self.names = arrays['names']
+
+    @classmethod
+    def path(cls, urn, region):
+        from .cache import PropDbCache
+        return os.path.join(Config.load_cache_folder(), PropDbCache.cache_key(urn, region), cls.file_name)
+
+    @classmethod
+    @traced('load index', 'parse')
+    def load(cls, propdb, urn, region):
+        """Return the index of a property database, building and saving it on first use."""
+        path = cls.path(urn, region)
+        if os.path.exists(path):
+            with np.load(path) as data:
+                arrays = {name: data[name] for name in data.files}
+            if int(arrays['version']) == INDEX_VERSION:
+                return cls(arrays)
+        index = cls.build(propdb)
+        index.save(path)
+        return index
+
+    @classmethod
+    def attach(cls, propdb, urn, region):
+        """Answer the category, family and type lookups of a reader from its index instead of walking the tree.
+
+        The toolkit's data_by_* methods call these lookups too, so they only walk the
+        subtrees of the matching nodes.
+        """
+        index = cls.load(propdb, urn, region)
+        propdb.index = index
+        propdb.get_all_categories = index.categories
+        propdb.get_all_families = index.families
+        propdb.get_all_families_types = index.family_types
+        propdb.get_categories_families_types = index.categories_families_types
+        return index
+
+    @classmethod
+    def build(cls, propdb):
+        """Build the index from the arrays of a property database reader."""
+        offsets = np.asarray(propdb.offsets, dtype=np.int64)
+        pairs = np.asarray(propdb.avs, dtype=np.int64).reshape(-1, 2)
+        count = len(offsets)
+        # dbId owning each attribute/value pair, dbId 0 is not an object
+        owners = np.searchsorted(offsets, np.arange(len(pairs)), side='right') - 1
+        valid = owners > 0
+        attr_names = [attr[0] if isinstance(attr, list) and attr else None for attr in propdb.attrs]
+        attr_categories = [attr[1] if isinstance(attr, list) and len(attr) > 1 else None for attr in propdb.attrs]
+
+        # children of every node, in property order
+        child_attrs = [i for i, category in enumerate(attr_categories) if category == '__child__']
+        mask = valid & np.isin(pairs[:, 0], child_attrs)
+        parents = owners[mask]
+        children = np.array([int(propdb.vals[value]) for value in pairs[mask, 1]], dtype=np.int64)
+        child_ptr = np.concatenate([[0], np.cumsum(np.bincount(parents, minlength=count))])
+
+        # first value index of _RC, _RFN and _RFT on every node, -1 when missing
+        level_values = []
+        for name in LEVELS:
+            values = np.full(count, -1, dtype=np.int64)
+            mask = valid & np.isin(pairs[:, 0], [i for i, attr_name in enumerate(attr_names) if attr_name == name])
+            level_owners, first = np.unique(owners[mask], return_index=True)
+            values[level_owners] = pairs[mask, 1][first]
+            level_values.append(values)
+
+        def children_of(node):
+            if 0 < node < count:
+                return children[child_ptr[node]:child_ptr[node + 1]]
+            return children[:0]
+
+        def first_nodes(values):
+            # same walk as the toolkit: depth first, stopping at the first node with a non-empty value
+            found = []
+            stack = list(children_of(1)[::-1])
+            while stack:
+                node = stack.pop()
+                value = values[node] if 0 < node < count else -1
+                if value < 0:
+                    stack.extend(children_of(node)[::-1])
+                elif str(propdb.vals[value]) != '':
+                    found.append(node)
+            return np.array(found, dtype=np.int64)
+
+        names = {}
+
+        def code(value):
+            return names.setdefault(str(value), len(names))
+
+        def value_codes(nodes, values, strip=True):
+            return np.array([code(str(propdb.vals[values[node]]).strip() if strip else propdb.vals[values[node]])
+                             if values[node] >= 0 else code('') for node in nodes], dtype=np.int32)
+
+        categories, families, types = [first_nodes(values) for values in level_values]
+        element_ptr = [0]
+        element_ids = []
+        for node in types:
+            stack = list(children_of(node)[::-1])
+            while stack:
+                child = stack.pop()
+                element_ids.append(child)
+                stack.extend(children_of(child)[::-1])
+            element_ptr.append(len(element_ids))
+        arrays = {
+            'version': np.array(INDEX_VERSION),
+            'category_ids': categories,
+            'category_names': value_codes(categories, level_values[0]),
+            'family_ids': families,
+            'family_names': value_codes(families, level_values[1]),
+            'type_ids': types,
+            'type_names': value_codes(types, level_values[2]),
+            # the toolkit reports the category and family of a type as stored, without strip
+            'type_categories': value_codes(types, level_values[0], strip=False),
+            'type_families': value_codes(types, level_values[1], strip=False),
+            'element_ptr': np.array(element_ptr, dtype=np.int64),
+            'element_ids': np.array(element_ids, dtype=np.int64),
+        }
+        arrays['names'] = np.array(list(names), dtype=str)
+        return cls(arrays)
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = path + f'.tmp{os.getpid()}.npz'
+        np.savez_compressed(temp_path, **self.arrays)
+        os.replace(temp_path, path)
+
+    def categories(self):
+        """Category nodes as {dbId: name}, like PropDbReaderRevit.get_all_categories."""
+        return self._dict('category_ids', 'category_names')
+
+    def families(self):
+        """Family nodes as {dbId: name}, like PropDbReaderRevit.get_all_families."""
+        return self._dict('family_ids', 'family_names')
+
+    def family_types(self):
+        """Family type nodes as {dbId: name}, like PropDbReaderRevit.get_all_families_types."""
+        return self._dict('type_ids', 'type_names')
+
+    def categories_families_types(self):
+        """Every family type with its category and family, like PropDbReaderRevit.get_categories_families_types."""
+        import pandas as pd
+        df = pd.DataFrame({
+            'dbId': self.arrays['type_ids'],
+            'Category': self.names[self.arrays['type_categories']],
+            'Family': self.names[self.arrays['type_families']],
+            'FamilyType': self.names[self.arrays['type_names']],
+        })
+        return df.sort_values(by=['Category', 'Family', 'FamilyType'])
+
+    def type_positions(self, categories=None, families=None, family_types=None):
+        """Positions of the family types matching every given list of names, in tree order."""
+        mask = np.ones(len(self.arrays['type_ids']), dtype=bool)
+        if categories:
+            # same as the toolkit: "Revit Walls" and "Walls" select the same category
+            categories = [c[5:].strip() if c.startswith("Revit") else c for c in categories]
+        for names, column in [(categories, 'type_categories'), (families, 'type_families'),
+                              (family_types, 'type_names')]:
+            if names:
+                mask &= np.isin(np.char.strip(self.names[self.arrays[column]]), [str(name).strip() for name in names])
+        return np.flatnonzero(mask)
+
+    def element_ids(self, categories=None, families=None, family_types=None):
+        """dbIds of every node under the matching family types, read from their ranges."""
+        ptr = self.arrays['element_ptr']
+        ranges = [self.arrays['element_ids'][ptr[i]:ptr[i + 1]]
+                  for i in self.type_positions(categories, families, family_types)]
+        return np.concatenate(ranges) if ranges else np.array([], dtype=np.int64)
+
+    def _dict(self, ids, names):
+        return dict(zip(self.arrays[ids].tolist(), self.names[self.arrays[names]].tolist()))
@@ -0,0 +1,201 @@
+import json
+import os
+import random
+import sys
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlparse
+from .config import Config
+from .httpcache import HttpCache
+from .tokenconfig import TokenConfig
+from .trace import span, http_name
+
+# methods that are safe to send again after a server error or a dropped connection
+IDEMPOTENT_METHODS = ['GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS']
+APS_HOST = 'https://developer.api.autodesk.com'
+
+
+class APSSession(requests.Session):
+    """One process-wide session for every APS call, with keep-alive connection pooling.
+
+    429 and 503 responses, which the server did not act on, are retried for every
+    method. Other 5xx responses and connection errors are only retried for idempotent
+    methods. Waits follow Retry-After when the server sends it and jittered
+    exponential backoff otherwise. A 401 on the current token refreshes it once
+    through TokenConfig and resends the request with the new token.
+
+    The APS_HOST environment variable sends every call, the toolkit's too, to another
+    host such as tools/mock_oss.py. APSBOT_RECORD appends every response to a JSON lines
+    file that the mock can replay.
+    """
+    max_retries = 5
+    backoff_base = 0.5
+    backoff_cap = 30
+
+    def __init__(self, pool_size=None):
+        super().__init__()
+        self.pool_size = 0
+        self.mount_pool(max(16, pool_size or 0, Config.load_transfer_workers(), Config.load_crawl_workers()))
+        self.retries = 0
+        self._local = threading.local()
+        self._refresh_lock = threading.Lock()
+        self.host = os.environ.get('APS_HOST', '').rstrip('/') or None
+        self.record_path = os.environ.get('APSBOT_RECORD') or None
+        self._record_lock = threading.Lock()
+
+    def mount_pool(self, pool_size):
+        """Mount adapters keeping up to pool_size connections per host alive."""
+        self.pool_size = pool_size
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.mount('http://', adapter)
+        self.mount('https://', adapter)
+
+    def request(self, method, url, **kwargs):
+        if self.host and url.startswith(APS_HOST):
+            url = self.host + url[len(APS_HOST):]
+        response = self._send(method.upper(), url, **kwargs)
+        if self.record_path and not kwargs.get('stream'):
+            self._record(method.upper(), response)
+        return response
+
+    def _send(self, method, url, **kwargs):
+        refreshed = False
+        for attempt in range(self.max_retries + 1):
+            try:
+                with span(http_name(method, url), 'http', url=url, attempt=attempt) as args:
+                    response = super().request(method, url, **kwargs)
+                    args['status'] = response.status_code
+                    args['bytes'] = int(response.headers.get('Content-Length') or 0) if kwargs.get('stream') \
+                        else len(response.content)
+            except (requests.ConnectionError, requests.Timeout):
+                if method not in IDEMPOTENT_METHODS or attempt == self.max_retries:
+                    raise
+                self._sleep(None, attempt)
+                continue
+            status = response.status_code
+            if status == 401 and not refreshed and self._refresh_token(kwargs):
+                refreshed = True
+                continue
+            retry = status in [429, 503] or (status >= 500 and method in IDEMPOTENT_METHODS)
+            if not retry or attempt == self.max_retries:
+                return response
+            self._sleep(response, attempt)
+            response.close()
+        return response
+
+    def _record(self, method, response):
+        parsed = urlparse(response.url)
+        if parsed.path.startswith('/authentication/'):
+            # token responses stay out of fixture files
+            return
+        record = {
+            'method': method,
+            'path': parsed.path,
+            'query': parsed.query,
+            'status': response.status_code,
+            'headers': {key: response.headers[key] for key in ['Content-Type', 'ETag'] if key in response.headers},
+            'body': response.content.decode('utf-8', errors='replace'),
+        }
+        with self._record_lock, open(self.record_path, 'a', encoding='utf-8') as file:
+            file.write(json.dumps(record) + '\n')
+
+    def _sleep(self, response, attempt):
+        self.retries += 1
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        try:
+            delay = min(float(retry_after), self.backoff_cap * 2)
+        except (TypeError, ValueError):
+            delay = min(self.backoff_cap, self.backoff_base * 2 ** attempt) * random.uniform(0.5, 1.5)
+        time.sleep(delay)
+
+    def _refresh_token(self, kwargs):
+        """Refresh the current token if it is the one the request was sent with. Return True to resend."""
+        token = TokenConfig.current
+        headers = kwargs.get('headers') or {}
+        authorization = headers.get('Authorization') or headers.get('authorization')
+        if token is None or authorization is None or getattr(self._local, 'refreshing', False):
+            return False
+        with self._refresh_lock:
+            # another thread may have refreshed it while this request was in flight
+            if authorization.split(' ')[-1] == token.access_token:
+                # the refresh itself goes through this session, do not recurse on its own 401
+                self._local.refreshing = True
+                try:
+                    if not TokenConfig.on_unauthorized(token):
+                        return False
+                finally:
+                    self._local.refreshing = False
+        kwargs['headers'] = dict(headers, Authorization=f'Bearer {token.access_token}')
+        return True
+
+
+class RequestsShim:
+    """Stands in for the ``requests`` module inside an aps_toolkit module, sending its calls through a session.
+
+    With ``cache=True`` GETs go through HttpCache first.
+    """
+
+    def __init__(self, session, cache=False):
+        self.session = session
+        self.cache = cache
+
+    def __getattr__(self, name):
+        # exceptions, Response and the rest still come from requests
+        return getattr(requests, name)
+
+    def request(self, method, url, **kwargs):
+        return self.session.request(method, url, **kwargs)
+
+    def get(self, url, params=None, **kwargs):
+        if self.cache:
+            return HttpCache.get(self.session, url, params, **kwargs)
+        return self.session.get(url, params=params, **kwargs)
+
+    def head(self, url, **kwargs):
+        return self.session.head(url, **kwargs)
+
+    def post(self, url, data=None, json=None, **kwargs):
+        return self.session.post(url, data=data, json=json, **kwargs)
+
+    def put(self, url, data=None, **kwargs):
+        return self.session.put(url, data=data, **kwargs)
+
+    def patch(self, url, data=None, **kwargs):
+        return self.session.patch(url, data=data, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.session.delete(url, **kwargs)
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def shared_session(pool_size=None):
+    """Return the process-wide APSSession, creating it on first use.
+
+    The connection pool grows to pool_size so that many workers never have to
+    open connections outside of it.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = APSSession(pool_size)
+        elif pool_size and pool_size > _session.pool_size:
+            _session.mount_pool(pool_size)
+        return _session
+
+
+def install_session():
+    """Send the HTTP calls of every loaded aps_toolkit module through the shared session."""
+    for name, module in list(sys.modules.items()):
+        if name.startswith('aps_toolkit.') and getattr(module, 'requests', None) is requests:
+            module.requests = RequestsShim(shared_session())
+
+
+def use_http_cache(toolkit_class):
+    """Serve the Data Management GETs of the aps_toolkit module defining toolkit_class from HttpCache."""
+    module = sys.modules[toolkit_class.__module__]
+    module.requests = RequestsShim(shared_session(), cache=True)
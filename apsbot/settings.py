@@ -1,6 +1,8 @@
 import os
 import click
 from apsbot.config import Config
+from apsbot.httpcache import DEFAULT_TTLS
+from apsbot.export import FORMATS
 
 
 @click.command()
@@ -17,3 +19,35 @@ def set_folder(folder_path):
     else:
         Config.save_folder_path(folder_path)
     click.echo(f"Default folder has been set to {folder_path}")
+
+
+@click.command()
+@click.option('--seconds', prompt='Token Expiry Margin(seconds)', default=lambda: Config.load_token_margin(), type=int,
+              help='Refresh the token this many seconds before it expires.')
+def set_token_margin(seconds):
+    """This command sets how long before expiry a saved token is refreshed."""
+    if seconds < 0:
+        click.echo("Invalid margin.")
+        return
+    Config.save_token_margin(seconds)
+    click.echo(f"Token expiry margin has been set to {seconds} seconds")
+
+
+@click.command()
+@click.option('--endpoint', prompt='Endpoint', type=click.Choice(list(DEFAULT_TTLS)),
+              help='The Data Management endpoint.')
+@click.option('--seconds', prompt='Cache TTL(seconds)', type=int,
+              help='Use cached responses this many seconds without asking the server, -1 turns the cache off.')
+def set_http_cache_ttl(endpoint, seconds):
+    """This command sets how long cached responses of an endpoint are used without revalidation."""
+    Config.save_http_cache_ttl(endpoint, seconds)
+    click.echo(f"HTTP cache TTL of {endpoint} has been set to {seconds} seconds")
+
+
+@click.command()
+@click.option('--save_format', prompt='Export Format', type=click.Choice(FORMATS, case_sensitive=False),
+              default=lambda: Config.load_export_format(), help='The default file format of saved data.')
+def set_export_format(save_format):
+    """This command sets the default file format of saved data."""
+    Config.save_export_format(save_format.lower())
+    click.echo(f"Export format has been set to {save_format}")
@@ -0,0 +1,144 @@
+import click
+import json
+import os
+import time
+from .tokenconfig import TokenConfig
+from .cache import PropDbCache
+from .config import Config
+from .export import arrow_safe, parameter_units
+import pandas as pd
+
+# same names the property database uses on category, family and type nodes
+INDEX_COLUMNS = ['_RC', '_RFN', '_RFT']
+
+
+class RevitSnapshot:
+    """Columnar Parquet snapshot of every element of a Revit model.
+
+    Rows are sorted by category, family and type and written in small row groups,
+    so the min/max statistics of each row group act as the index: filtered reads
+    only decompress the row groups and columns they need.
+    """
+    row_group_size = 10000
+
+    @classmethod
+    def path(cls, urn, region, is_sub_family, display_unit):
+        """Return the snapshot file path for a urn and extraction flags."""
+        key = PropDbCache.cache_key(urn, region)
+        flags = f"{'sub' if is_sub_family else 'nosub'}-{'unit' if display_unit else 'raw'}"
+        return os.path.join(Config.load_cache_folder(), 'snapshots', f"{key}-{flags}.parquet")
+
+    @classmethod
+    def exists(cls, urn, region, is_sub_family, display_unit):
+        """Check whether a snapshot exists and pyarrow is available to read it."""
+        if not os.path.exists(cls.path(urn, region, is_sub_family, display_unit)):
+            return False
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            return False
+        return True
+
+    @classmethod
+    def build(cls, propdb, urn, region, is_sub_family, display_unit):
+        """Walk the whole property database once and write it as a snapshot. Return the row count."""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        types = propdb.get_categories_families_types()
+        frames = []
+        for _, row in types.iterrows():
+            df = propdb._get_recursive_ids([int(row['dbId'])], is_sub_family, display_unit)
+            if df.empty:
+                continue
+            df.insert(0, '_RC', row['Category'])
+            df.insert(1, '_RFN', row['Family'])
+            df.insert(2, '_RFT', row['FamilyType'])
+            frames.append(df)
+        df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=INDEX_COLUMNS)
+        df = df.sort_values(by=INDEX_COLUMNS, kind='stable').reset_index(drop=True)
+        # parquet needs one type per column, revit values can mix numbers and text
+        df = arrow_safe(df)
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        metadata = dict(table.schema.metadata or {})
+        metadata[b'apsbot'] = json.dumps({
+            'urn': urn,
+            'region': region,
+            'is_sub_family': is_sub_family,
+            'display_unit': display_unit,
+            'units': parameter_units(propdb, df.columns),
+            'created': time.time(),
+        }).encode('utf-8')
+        table = table.replace_schema_metadata(metadata)
+        path = cls.path(urn, region, is_sub_family, display_unit)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = path + f'.tmp{os.getpid()}'
+        pq.write_table(table, temp_path, compression='zstd', row_group_size=cls.row_group_size)
+        os.replace(temp_path, path)
+        return len(df)
+
+    @classmethod
+    def units(cls, urn, region, is_sub_family, display_unit):
+        """Return the parameter units recorded in a snapshot, empty when there is none."""
+        if not cls.exists(urn, region, is_sub_family, display_unit):
+            return {}
+        import pyarrow.parquet as pq
+        metadata = pq.read_schema(cls.path(urn, region, is_sub_family, display_unit)).metadata or {}
+        return json.loads(metadata.get(b'apsbot', b'{}')).get('units', {})
+
+    @classmethod
+    def read(cls, urn, region, is_sub_family, display_unit, categories=None, families=None, family_types=None,
+             parameters=None):
+        """Read the matching rows from the snapshot, or return None when no snapshot exists."""
+        if not cls.exists(urn, region, is_sub_family, display_unit):
+            return None
+        import pyarrow.parquet as pq
+        path = cls.path(urn, region, is_sub_family, display_unit)
+        filters = []
+        if categories:
+            # same as the toolkit: "Revit Walls" and "Walls" select the same category
+            categories = [c[5:].strip() if c.startswith("Revit") else c for c in categories]
+            filters.append(('_RC', 'in', categories))
+        if families:
+            filters.append(('_RFN', 'in', families))
+        if family_types:
+            filters.append(('_RFT', 'in', family_types))
+        columns = None
+        if parameters:
+            schema_names = pq.read_schema(path).names
+            columns = [c for c in ['dbId', 'external_id'] + parameters if c in schema_names]
+        table = pq.read_table(path, columns=columns, filters=filters or None, memory_map=True)
+        df = table.to_pandas()
+        df = df.drop(columns=[c for c in INDEX_COLUMNS if c in df.columns])
+        # drop the columns that are empty for the selected elements, like a fresh extraction
+        df = df.dropna(axis=1, how='all')
+        if parameters:
+            df = df.dropna(how='all', subset=[c for c in df.columns if c not in ['dbId', 'external_id']])
+        if (families or family_types) and 'Name' in df.columns:
+            df["Family Name"] = df["Name"].str.extract(r'(.*)\s\[')
+        return df.reset_index(drop=True)
+
+
+@click.command()
+@click.option('--urn', prompt='URN', default=lambda: Config.load_derivative_urn(),
+              help='The derivative urn of the item version.')
+@click.option('--region', prompt='Region', default=lambda: Config.load_region(), help='The region of the item.')
+@click.option('--is_sub_family', prompt='Is Sub Family(y/n)', default="n", help='The is sub family of the elements.')
+@click.option('--display_unit', prompt='Display Unit(y/n)', default="n", help='The display unit of the item.')
+def revit_snapshot(urn, region, is_sub_family, display_unit):
+    """Snapshot all Revit data by urn so data_revit commands read it without the property database."""
+    if not urn:
+        click.echo("Please provide a urn.")
+        return
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        click.echo("Snapshots need pyarrow, install it with: pip install apsbot[parquet]")
+        return
+    token = TokenConfig.load_config()
+    Config.save_region(region)
+    Config.save_derivative_urn(urn)
+    is_sub_family = str.lower(is_sub_family) == 'y'
+    display_unit = str.lower(display_unit) == 'y'
+    propdb = PropDbCache.load(urn, token, region)
+    count = RevitSnapshot.build(propdb, urn, region, is_sub_family, display_unit)
+    click.echo(f"Snapshot of {count} elements saved to {RevitSnapshot.path(urn, region, is_sub_family, display_unit)}")
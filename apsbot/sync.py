@@ -0,0 +1,148 @@
+import click
+import hashlib
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import pandas as pd
+from .config import Config
+from .oss import OSS
+from .output import output_options, show
+from .session import shared_session
+from .tokenconfig import TokenConfig
+from .transfer import MultipartUpload, RangedDownload
+
+
+class BucketSync:
+    """Mirror a local folder and a bucket prefix in one direction.
+
+    Files are matched by their path relative to the folder, and only copied when the
+    size or sha1 differs. All transfers share the session's connection pool, and at most
+    ``workers`` files are in flight at a time.
+    """
+
+    def __init__(self, token, region, bucket_name, folder, prefix='', workers=None):
+        self.bucket_name = bucket_name
+        self.folder = os.path.abspath(folder)
+        self.prefix = prefix or ''
+        self.workers = workers or Config.load_transfer_workers()
+        self.oss = OSS(token, region, shared_session(self.workers))
+
+    def local_files(self):
+        """Return {relative path: size} of every file under the folder."""
+        files = {}
+        for root, _, names in os.walk(self.folder):
+            for name in names:
+                if name.endswith('.part'):
+                    continue
+                path = os.path.join(root, name)
+                files[os.path.relpath(path, self.folder).replace(os.sep, '/')] = os.path.getsize(path)
+        return files
+
+    def remote_objects(self):
+        """Return {relative path: object} of every object under the prefix."""
+        objects = {}
+        for page in self.oss.iter_objects(self.bucket_name, self.prefix or None):
+            for item in page:
+                objects[item['objectKey'][len(self.prefix):]] = item
+        return objects
+
+    def plan(self, direction, delete=False):
+        """Return a DataFrame of the actions needed to make the destination match the source."""
+        local = self.local_files()
+        remote = self.remote_objects()
+        rows = []
+        action = 'upload' if direction == 'upload' else 'download'
+        source, target = (local, remote) if direction == 'upload' else (remote, local)
+        for path in sorted(source):
+            size = local[path] if direction == 'upload' else remote[path]['size']
+            if path not in target:
+                rows.append(self._row(action, path, size, 'missing'))
+            elif local[path] != remote[path]['size']:
+                rows.append(self._row(action, path, size, 'size'))
+            elif remote[path].get('sha1') and self._sha1(path) != remote[path]['sha1']:
+                rows.append(self._row(action, path, size, 'sha1'))
+        if delete:
+            for path in sorted(set(target) - set(source)):
+                size = remote[path]['size'] if direction == 'upload' else local[path]
+                rows.append(self._row('delete_remote' if direction == 'upload' else 'delete_local', path, size,
+                                      'extra'))
+        return pd.DataFrame(rows, columns=['action', 'path', 'object_name', 'size', 'reason'])
+
+    def apply(self, plan, on_progress=None):
+        """Run the actions of a plan. Return the plan with a status column."""
+        plan = plan.copy()
+        plan['status'] = 'ok'
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {executor.submit(self._apply_row, row): index for index, row in plan.iterrows()}
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    plan.loc[futures[future], 'status'] = f"failed: {e}"
+                if on_progress:
+                    on_progress(1)
+        return plan
+
+    def _apply_row(self, row):
+        path = os.path.join(self.folder, *row['path'].split('/'))
+        # one connection per file, the pool size is the concurrency limit
+        if row['action'] == 'upload':
+            MultipartUpload(self.oss, self.bucket_name, row['object_name'], path, workers=1).run()
+        elif row['action'] == 'download':
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            RangedDownload(self.oss, self.bucket_name, row['object_name'], path, workers=1).run()
+        elif row['action'] == 'delete_remote':
+            self.oss.delete_object(self.bucket_name, row['object_name'])
+        elif row['action'] == 'delete_local':
+            os.remove(path)
+
+    def _row(self, action, path, size, reason):
+        return {'action': action, 'path': path, 'object_name': self.prefix + path, 'size': size, 'reason': reason}
+
+    def _sha1(self, path):
+        digest = hashlib.sha1()
+        with open(os.path.join(self.folder, *path.split('/')), 'rb') as file:
+            for data in iter(lambda: file.read(1024 * 1024), b''):
+                digest.update(data)
+        return digest.hexdigest()
+
+
+@click.command()
+@click.option('--bucket_name', prompt='Bucket Name', default=lambda: Config.load_bucket_name(),
+              help='The key of the bucket.')
+@click.option('--region', prompt='Region', default=lambda: Config.load_region(), help='The region of the bucket.')
+@click.option('--folder', prompt='Folder', default=lambda: Config.load_folder_path(), help='The local folder to sync.')
+@click.option('--direction', prompt='Direction', type=click.Choice(['upload', 'download'], case_sensitive=False),
+              default='upload', help='upload makes the bucket match the folder, download the other way around.')
+@click.option('--prefix', default='', help='The object name prefix that maps to the folder.')
+@click.option('--delete', default='n', help='Delete files that only exist on the destination (y/n).')
+@click.option('--dry_run', default='n', help='Only print the plan (y/n).')
+@click.option('--workers', default=lambda: Config.load_transfer_workers(), type=int,
+              help='The number of files transferred in parallel.')
+@output_options
+def bucket_sync(bucket_name, region, folder, direction, prefix, delete, dry_run, workers, output, limit):
+    """This command syncs a local folder with a bucket, transferring only changed files."""
+    if direction == 'upload' and not os.path.isdir(folder):
+        click.echo("Invalid folder path.")
+        return
+    token = TokenConfig.load_config()
+    Config.save_region(region)
+    Config.save_bucket_name(bucket_name)
+    sync = BucketSync(token, region, bucket_name, folder, prefix, workers)
+    plan = sync.plan(direction.lower(), str.lower(delete) == 'y')
+    if plan.empty:
+        click.echo("Everything is up to date.")
+        return
+    if str.lower(dry_run) == 'y':
+        show(plan, output, limit)
+        click.echo(f"{len(plan)} actions, {plan['size'].sum() / 1024 / 1024:.1f} MB.", err=True)
+        return
+    start = time.time()
+    with click.progressbar(length=len(plan), label=f"Syncing {len(plan)} files", file=sys.stderr) as bar:
+        result = sync.apply(plan, on_progress=bar.update)
+    failed = result[result['status'] != 'ok']
+    click.echo(f"Synced {len(result) - len(failed)} of {len(result)} files in {time.time() - start:.1f}s.", err=True)
+    if not failed.empty:
+        show(failed, output, limit)
+        raise click.ClickException(f"{len(failed)} files failed to sync.")
@@ -1,50 +1,138 @@
+import click
 import json
 import os
+import threading
+import time
 from aps_toolkit import Token
 from aps_toolkit import ClientType
-from aps_toolkit import RevokeType
 from aps_toolkit import Auth
+from .config import Config, atomic_write_json, file_lock
+from .trace import traced
 
 
 class TokenConfig:
     config_path = 'token_config.json'
+    _refresh_lock = threading.Lock()
+    _refresh_timer = None
+    # the token of this process, the shared session refreshes it on a 401
+    current = None
 
     @classmethod
     def save_config(cls, token):
         """Save token information to a JSON file."""
+        issued_at = time.time()
         token_data = {
             'APS_ACCESS_TOKEN': token.access_token,
             'APS_REFRESH_TOKEN': token.refresh_token,
             'APS_TOKEN_TYPE': token.token_type,
             'APS_EXPIRES_IN': token.expires_in,
+            'APS_ISSUED_AT': issued_at,
+            'APS_EXPIRES_AT': cls._expires_at(token, issued_at),
         }
-        with open(cls.config_path, 'w') as file:
-            json.dump(token_data, file, indent=4)
+        with file_lock(cls.config_path):
+            atomic_write_json(cls.config_path, token_data)
 
     @classmethod
+    @traced('token load', 'auth')
     def load_config(cls):
-        """Load token information from a JSON file."""
+        """Load token information from a JSON file.
+
+        The token is trusted locally until the configured margin before its expiry time,
+        so most commands start without any network round-trip.
+        """
         if not os.path.exists(cls.config_path):
             return None
         with open(cls.config_path, 'r') as file:
             token_data = json.load(file)
-            access_token = token_data['APS_ACCESS_TOKEN']
-            refresh_token = token_data['APS_REFRESH_TOKEN']
-            token_type = token_data['APS_TOKEN_TYPE']
-            expires_in = token_data['APS_EXPIRES_IN']
-            token = Token(access_token, token_type, expires_in, refresh_token)
-            if token.refresh_token is not None and token.access_token is not None and token.refresh_token != 'null':
-                status = token.introspect(ClientType.PRIVATE)
-                if status['active']:
-                    return token
-                else:
-                    print("Token is expired.")
-                    token.revoke(RevokeType.REFRESH_TOKEN_PRIVATE)
-                    auth = Auth()
-                    token = auth.refresh_new_token(token.refresh_token)
-                    cls.save_config(token)
-                    return token
-            else:
-                token = Auth().auth2leg()
+        access_token = token_data['APS_ACCESS_TOKEN']
+        refresh_token = token_data['APS_REFRESH_TOKEN']
+        token_type = token_data['APS_TOKEN_TYPE']
+        expires_in = token_data['APS_EXPIRES_IN']
+        token = Token(access_token, token_type, expires_in, refresh_token)
+        token.expires_at = token_data.get('APS_EXPIRES_AT')
+        cls.current = token
+        if token.access_token is not None and token.expires_at is not None:
+            if time.time() < token.expires_at - Config.load_token_margin():
+                return token
+            return cls.refresh(token)
+        # token saved by an older version without expiry time, ask the server once
+        if cls._has_refresh_token(token):
+            status = token.introspect(ClientType.PRIVATE)
+            if status['active']:
+                token.expires_at = status.get('exp')
                 cls.save_config(token)
+                return token
+            click.echo("Token is expired.", err=True)
+        return cls.refresh(token)
+
+    @classmethod
+    def refresh(cls, token):
+        """Get a new access token and update the token object in place so every holder sees it."""
+        with cls._refresh_lock:
+            if cls._has_refresh_token(token):
+                new_token = Auth().refresh_new_token(token.refresh_token)
+            else:
+                new_token = Auth().auth2leg()
+            token.access_token = new_token.access_token
+            token.refresh_token = new_token.refresh_token
+            token.token_type = new_token.token_type
+            token.expires_in = new_token.expires_in
+            cls.save_config(token)
+            token.expires_at = cls._expires_at(token, time.time())
         return token
+
+    @classmethod
+    def on_unauthorized(cls, token):
+        """Handle a 401 response: introspect the token and refresh it if the server says it is not active.
+
+        Return True when the token has been refreshed and the request is worth retrying.
+        """
+        if token is None:
+            return False
+        if cls._has_refresh_token(token):
+            status = token.introspect(ClientType.PRIVATE)
+            if status.get('active'):
+                return False
+        cls.refresh(token)
+        return True
+
+    @classmethod
+    def start_auto_refresh(cls, token):
+        """Refresh the token in the background shortly before it expires, for long-running commands."""
+        cls.stop_auto_refresh()
+        if token is None or getattr(token, 'expires_at', None) is None:
+            return
+
+        def run():
+            try:
+                cls.refresh(token)
+            except Exception as e:
+                click.echo(f"Background token refresh failed: {e}", err=True)
+                return
+            cls.start_auto_refresh(token)
+
+        delay = max(token.expires_at - Config.load_token_margin() - time.time(), 0)
+        cls._refresh_timer = threading.Timer(delay, run)
+        cls._refresh_timer.daemon = True
+        cls._refresh_timer.start()
+
+    @classmethod
+    def stop_auto_refresh(cls):
+        """Stop the background refresh started by start_auto_refresh."""
+        if cls._refresh_timer is not None:
+            cls._refresh_timer.cancel()
+            cls._refresh_timer = None
+
+    @classmethod
+    def _expires_at(cls, token, issued_at):
+        expires_in = token.expires_in
+        if expires_in is None:
+            return None
+        # aps_toolkit stores the expiry as a timestamp, the raw OAuth response as seconds
+        if float(expires_in) > 1e9:
+            return float(expires_in)
+        return issued_at + float(expires_in)
+
+    @classmethod
+    def _has_refresh_token(cls, token):
+        return token.refresh_token is not None and token.access_token is not None and token.refresh_token != 'null'
@@ -0,0 +1,157 @@
+import functools
+import inspect
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+# stages of a command, the order of the summary table
+CATEGORIES = ['command', 'auth', 'http', 'parse', 'transform', 'render', 'save']
+
+
+class Tracer:
+    """Timed spans of one command run, for ``apsbot --profile`` and ``APSBOT_TRACE=1``.
+
+    Spans are kept in memory as Chrome trace "complete" events (name, category, start,
+    duration, thread and arguments) and written out when the command ends, together
+    with a summary per stage on stderr. Nothing is recorded while tracing is off.
+    """
+    enabled = False
+    events = []
+    started = None
+    profiler = None
+    command = None
+
+    @classmethod
+    def start(cls, command=None, cprofile=False):
+        cls.enabled = True
+        cls.events = []
+        cls.command = command
+        cls.started = time.perf_counter()
+        if cprofile:
+            import cProfile
+            cls.profiler = cProfile.Profile()
+            cls.profiler.enable()
+
+    @classmethod
+    def add(cls, name, category, start, end, args=None):
+        cls.events.append({
+            'name': name,
+            'cat': category,
+            'ph': 'X',
+            'ts': round((start - cls.started) * 1e6, 1),
+            'dur': round((end - start) * 1e6, 1),
+            'pid': os.getpid(),
+            'tid': threading.get_ident(),
+            'args': args or {},
+        })
+
+    @classmethod
+    def finish(cls, trace_file=None):
+        """Stop tracing, write the Chrome trace (and cProfile stats) and print the summary to stderr."""
+        if not cls.enabled:
+            return None
+        cls.add(cls.command or 'apsbot', 'command', cls.started, time.perf_counter())
+        cls.enabled = False
+        trace_file = trace_file or cls.default_path()
+        os.makedirs(os.path.dirname(os.path.abspath(trace_file)), exist_ok=True)
+        with open(trace_file, 'w') as file:
+            json.dump({'traceEvents': cls.events, 'displayTimeUnit': 'ms'}, file)
+        print(cls.summary(), file=sys.stderr)
+        print(f"Trace saved to {trace_file}, open it in chrome://tracing or https://ui.perfetto.dev", file=sys.stderr)
+        if cls.profiler is not None:
+            import pstats
+            cls.profiler.disable()
+            profile_file = os.path.splitext(trace_file)[0] + '.prof'
+            cls.profiler.dump_stats(profile_file)
+            pstats.Stats(cls.profiler, stream=sys.stderr).sort_stats('cumulative').print_stats(15)
+            print(f"cProfile stats saved to {profile_file}", file=sys.stderr)
+            cls.profiler = None
+        return trace_file
+
+    @classmethod
+    def default_path(cls):
+        from .config import Config
+        name = f"{cls.command or 'apsbot'}-{time.strftime('%Y%m%d-%H%M%S')}.trace.json"
+        return os.path.join(Config.load_folder_path() or '.', 'traces', name)
+
+    @classmethod
+    def summary(cls):
+        """Calls, total, mean and max milliseconds and bytes of every span name, grouped by stage."""
+        from tabulate import tabulate
+        groups = {}
+        for event in cls.events:
+            group = groups.setdefault((event['cat'], event['name']), [0, 0.0, 0.0, 0])
+            group[0] += 1
+            group[1] += event['dur'] / 1000
+            group[2] = max(group[2], event['dur'] / 1000)
+            group[3] += event['args'].get('bytes') or 0
+        order = {category: i for i, category in enumerate(CATEGORIES)}
+        rows = [[category, name, calls, round(total, 1), round(total / calls, 1), round(longest, 1), size or '']
+                for (category, name), (calls, total, longest, size) in
+                sorted(groups.items(), key=lambda item: (order.get(item[0][0], len(order)), -item[1][1]))]
+        return tabulate(rows, headers=['Stage', 'Span', 'Calls', 'Total ms', 'Mean ms', 'Max ms', 'Bytes'],
+                        tablefmt='psql')
+
+
+@contextmanager
+def _span(name, category, args):
+    start = time.perf_counter()
+    try:
+        yield args
+    finally:
+        Tracer.add(name, category, start, time.perf_counter(), args)
+
+
+@contextmanager
+def _no_span():
+    yield {}
+
+
+def span(name, category, **args):
+    """Time a block as a span. The yielded dict takes arguments known at the end, like bytes."""
+    if not Tracer.enabled:
+        return _no_span()
+    return _span(name, category, args)
+
+
+def traced(name, category):
+    """Decorator that times every call of a function as a span while tracing is on."""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not Tracer.enabled:
+                return function(*args, **kwargs)
+            with _span(name, category, {}):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def instrument(cls, prefix, category):
+    """Time the public methods of a class whose names start with prefix, e.g. the toolkit readers."""
+    for name in dir(cls):
+        # plain methods only, classmethods and staticmethods would lose their binding
+        method = inspect.getattr_static(cls, name)
+        if name.startswith(prefix) and inspect.isfunction(method) and not getattr(method, '_traced', False):
+            wrapper = traced(f"{cls.__name__}.{name}", category)(method)
+            wrapper._traced = True
+            setattr(cls, name, wrapper)
+
+
+def instrument_toolkit():
+    """Time the data readers of aps_toolkit while tracing is on."""
+    if Tracer.enabled:
+        from aps_toolkit import PropDbReaderRevit
+        instrument(PropDbReaderRevit, 'get_', 'transform')
+
+
+def http_name(method, url):
+    """Span name of a request: the method and path with the ids left out, so calls of one endpoint add up."""
+    parsed = urlparse(url)
+    segments = [':id' if ':' in segment or (len(segment) > 8 and any(char.isdigit() for char in segment)) else segment
+                for segment in parsed.path.split('/')]
+    return f"{method} {parsed.netloc}{'/'.join(segments)}"
@@ -0,0 +1,282 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import requests
+from .config import Config, atomic_write_json
+
+
+class MultipartUpload:
+    """Resumable, parallel upload of one file through OSS signed S3 multipart urls.
+
+    Finished part numbers are recorded in a manifest under the cache folder, so running
+    the same upload again after a failure only sends the missing parts.
+    """
+
+    def __init__(self, oss, bucket_name, object_name, file_path, chunk_size=None, workers=None):
+        self.oss = oss
+        self.bucket_name = bucket_name
+        self.object_name = object_name
+        self.file_path = os.path.abspath(file_path)
+        self.chunk_size = (chunk_size or Config.load_chunk_size()) * 1024 * 1024
+        self.workers = workers or Config.load_transfer_workers()
+        self.size = os.path.getsize(self.file_path)
+        self.parts = max(1, -(-self.size // self.chunk_size))
+        key = hashlib.sha1(f"{bucket_name}/{object_name}/{self.file_path}".encode('utf-8')).hexdigest()
+        self.manifest_path = os.path.join(Config.load_cache_folder(), 'uploads', f"{key}.json")
+        self._lock = threading.Lock()
+
+    def run(self, on_progress=None):
+        """Upload the missing parts and complete the upload. Return the OSS object details."""
+        manifest = self._load_manifest()
+        try:
+            return self._run(manifest, on_progress)
+        except requests.HTTPError as e:
+            # upload keys expire after 24 hours, start over once if the saved one is refused
+            if not manifest['done'] or e.response is None or e.response.status_code not in [400, 404]:
+                raise
+            return self._run(self._new_manifest(), on_progress)
+
+    def _run(self, manifest, on_progress):
+        missing = [part for part in range(1, self.parts + 1) if part not in manifest['done']]
+        if on_progress:
+            on_progress(self.size - sum(self._part_size(part) for part in missing))
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = []
+            for first, count in self._runs(missing):
+                result = self.oss.get_upload_urls(self.bucket_name, self.object_name, count, first,
+                                                  manifest['upload_key'])
+                if not manifest['upload_key']:
+                    manifest['upload_key'] = result['uploadKey']
+                    self._save_manifest(manifest)
+                for offset, url in enumerate(result['urls']):
+                    futures.append(executor.submit(self._upload_part, manifest, first + offset, url))
+            for future in as_completed(futures):
+                part = future.result()
+                if on_progress:
+                    on_progress(self._part_size(part))
+        result = self.oss.complete_upload(self.bucket_name, self.object_name, manifest['upload_key'], self.size)
+        if os.path.exists(self.manifest_path):
+            os.remove(self.manifest_path)
+        return result
+
+    def _upload_part(self, manifest, part, url):
+        with open(self.file_path, 'rb') as file:
+            file.seek((part - 1) * self.chunk_size)
+            data = file.read(self._part_size(part))
+        for attempt in range(3):
+            try:
+                self.oss.put_part(url, data)
+                break
+            except requests.HTTPError as e:
+                if attempt == 2:
+                    raise
+                # the signed url may have expired while waiting in the queue
+                if e.response is not None and e.response.status_code == 403:
+                    url = self.oss.get_upload_urls(self.bucket_name, self.object_name, 1, part,
+                                                   manifest['upload_key'])['urls'][0]
+                time.sleep(2 ** attempt)
+        with self._lock:
+            manifest['done'].append(part)
+            self._save_manifest(manifest)
+        return part
+
+    def _part_size(self, part):
+        if part < self.parts:
+            return self.chunk_size
+        return self.size - (self.parts - 1) * self.chunk_size
+
+    def _runs(self, parts):
+        """Group part numbers into contiguous runs of at most OSS.max_urls parts."""
+        runs = []
+        for part in parts:
+            if runs and runs[-1][0] + runs[-1][1] == part and runs[-1][1] < self.oss.max_urls:
+                runs[-1][1] += 1
+            else:
+                runs.append([part, 1])
+        return runs
+
+    def _new_manifest(self):
+        stat = os.stat(self.file_path)
+        manifest = {
+            'bucket_name': self.bucket_name,
+            'object_name': self.object_name,
+            'file_path': self.file_path,
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'chunk_size': self.chunk_size,
+            'upload_key': None,
+            'done': [],
+        }
+        self._save_manifest(manifest)
+        return manifest
+
+    def _load_manifest(self):
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, 'r') as file:
+                manifest = json.load(file)
+            stat = os.stat(self.file_path)
+            # only resume when the file and the part layout are unchanged
+            if manifest['size'] == stat.st_size and manifest['mtime'] == stat.st_mtime \
+                    and manifest['chunk_size'] == self.chunk_size:
+                return manifest
+        return self._new_manifest()
+
+    def _save_manifest(self, manifest):
+        atomic_write_json(self.manifest_path, manifest)
+
+
+class RangedDownload:
+    """Parallel, resumable download of one OSS object with HTTP byte ranges.
+
+    Ranges are written straight into a preallocated ``.part`` file; finished ranges are
+    recorded in a manifest so a rerun only fetches the rest. The result is checked
+    against the size and sha1 reported by OSS before it replaces the target file.
+    """
+    buffer_size = 1024 * 1024
+
+    def __init__(self, oss, bucket_name, object_name, file_path, chunk_size=None, workers=None):
+        self.oss = oss
+        self.bucket_name = bucket_name
+        self.object_name = object_name
+        self.file_path = file_path if file_path == '-' else os.path.abspath(file_path)
+        self.chunk_size = (chunk_size or Config.load_chunk_size()) * 1024 * 1024
+        self.workers = workers or Config.load_transfer_workers()
+        self.part_path = self.file_path + '.part'
+        key = hashlib.sha1(f"{bucket_name}/{object_name}/{self.file_path}".encode('utf-8')).hexdigest()
+        self.manifest_path = os.path.join(Config.load_cache_folder(), 'downloads', f"{key}.json")
+        self.size = None
+        self.sha1 = None
+        self._url = None
+        self._lock = threading.Lock()
+
+    def prepare(self):
+        """Ask OSS for the signed url, size and sha1 of the object. Return the size."""
+        info = self.oss.get_download_url(self.bucket_name, self.object_name)
+        self._url = info['url']
+        self.size = info.get('size')
+        if self.size is None:
+            self.size = int(self.oss.session.head(self._url).headers['Content-Length'])
+        self.sha1 = info.get('sha1')
+        return self.size
+
+    def run(self, on_progress=None):
+        """Download into file_path. Return the number of bytes downloaded."""
+        if self._url is None:
+            self.prepare()
+        manifest = self._load_manifest()
+        ranges = self._ranges()
+        missing = [index for index in range(len(ranges)) if index not in manifest['done']]
+        if on_progress:
+            on_progress(self.size - sum(ranges[index][1] - ranges[index][0] + 1 for index in missing))
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {executor.submit(self._fetch_to_file, manifest, index, *ranges[index]): index
+                       for index in missing}
+            for future in as_completed(futures):
+                future.result()
+                start, end = ranges[futures[future]]
+                if on_progress:
+                    on_progress(end - start + 1)
+        self._verify(self.part_path)
+        os.replace(self.part_path, self.file_path)
+        if os.path.exists(self.manifest_path):
+            os.remove(self.manifest_path)
+        return self.size
+
+    def stream(self, output, on_progress=None):
+        """Write the object to a binary stream in order, fetching a few ranges ahead in parallel."""
+        if self._url is None:
+            self.prepare()
+        ranges = self._ranges()
+        digest = hashlib.sha1()
+        window = self.workers * 2
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            pending = {}
+            for index in range(len(ranges)):
+                # keep a bounded read-ahead so memory stays at window * chunk_size
+                for ahead in range(index, min(index + window, len(ranges))):
+                    if ahead not in pending:
+                        pending[ahead] = executor.submit(self._fetch_to_memory, *ranges[ahead])
+                data = pending.pop(index).result()
+                output.write(data)
+                digest.update(data)
+                if on_progress:
+                    on_progress(len(data))
+        output.flush()
+        if self.sha1 and digest.hexdigest() != self.sha1:
+            raise Exception("Checksum mismatch, the streamed object is corrupt.")
+        return self.size
+
+    def _ranges(self):
+        if self.size == 0:
+            return []
+        return [(start, min(start + self.chunk_size, self.size) - 1) for start in range(0, self.size, self.chunk_size)]
+
+    def _with_retry(self, func, start, end):
+        for attempt in range(3):
+            try:
+                return func(start, end)
+            except requests.RequestException as e:
+                if attempt == 2:
+                    raise
+                response = getattr(e, 'response', None)
+                # the signed url expired, get a fresh one
+                if response is not None and response.status_code == 403:
+                    with self._lock:
+                        self._url = self.oss.get_download_url(self.bucket_name, self.object_name)['url']
+                time.sleep(2 ** attempt)
+
+    def _fetch_to_file(self, manifest, index, start, end):
+        def fetch(start, end):
+            response = self.oss.get_range(self._url, start, end)
+            with open(self.part_path, 'r+b') as file:
+                file.seek(start)
+                for data in response.iter_content(self.buffer_size):
+                    file.write(data)
+        self._with_retry(fetch, start, end)
+        with self._lock:
+            manifest['done'].append(index)
+            atomic_write_json(self.manifest_path, manifest)
+
+    def _fetch_to_memory(self, start, end):
+        return self._with_retry(lambda start, end: self.oss.get_range(self._url, start, end).content, start, end)
+
+    def _verify(self, path):
+        if os.path.getsize(path) != self.size:
+            raise Exception(f"Size mismatch, expected {self.size} bytes but got {os.path.getsize(path)}.")
+        if not self.sha1:
+            return
+        digest = hashlib.sha1()
+        with open(path, 'rb') as file:
+            for data in iter(lambda: file.read(self.buffer_size), b''):
+                digest.update(data)
+        if digest.hexdigest() != self.sha1:
+            # the part file is corrupt, do not resume from it
+            os.remove(path)
+            if os.path.exists(self.manifest_path):
+                os.remove(self.manifest_path)
+            raise Exception("Checksum mismatch, the downloaded object is corrupt.")
+
+    def _load_manifest(self):
+        if os.path.exists(self.manifest_path) and os.path.exists(self.part_path):
+            with open(self.manifest_path, 'r') as file:
+                manifest = json.load(file)
+            # only resume when the object and the range layout are unchanged
+            if manifest['size'] == self.size and manifest['sha1'] == self.sha1 \
+                    and manifest['chunk_size'] == self.chunk_size:
+                return manifest
+        os.makedirs(os.path.dirname(self.part_path) or '.', exist_ok=True)
+        with open(self.part_path, 'wb') as file:
+            file.truncate(self.size)
+        manifest = {
+            'bucket_name': self.bucket_name,
+            'object_name': self.object_name,
+            'size': self.size,
+            'sha1': self.sha1,
+            'chunk_size': self.chunk_size,
+            'done': [],
+        }
+        atomic_write_json(self.manifest_path, manifest)
+        return manifest
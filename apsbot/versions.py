@@ -0,0 +1,182 @@
+import click
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import pandas as pd
+from .config import Config, atomic_write_json
+from .dm import DataManagement, FolderCrawler
+from .tokenconfig import TokenConfig
+from .output import output_options, show
+
+VERSION_COLUMNS = ['project_id', 'project_name', 'folder_id', 'item_id', 'item_name', 'version', 'version_id',
+                   'derivative_urn', 'create_time', 'last_modified_time', 'last_modified_user', 'storage_size']
+
+
+class HubVersionReport:
+    """Version history of every matching item of every project in a hub.
+
+    The output folder is one table partitioned by project (``project_id=<id>/versions.<format>``).
+    A project's partition is written in one go when the project is complete, and a
+    checkpoint under ``_checkpoints`` marks it done, so a rerun skips it.
+    """
+
+    def __init__(self, dm, hub_id, output_folder, extensions='.rvt', output_format='csv', workers=8,
+                 project_workers=4):
+        self.dm = dm
+        self.hub_id = hub_id
+        self.output_folder = output_folder
+        self.extensions = extensions
+        self.output_format = output_format
+        self.workers = workers
+        self.project_workers = project_workers
+
+    def run(self, on_project=None):
+        """Report every project that has no checkpoint yet. Return a DataFrame with one status row per project."""
+        projects = list(self.dm.iter_projects(self.hub_id))
+        results = []
+        todo = []
+        for project in projects:
+            checkpoint = self._load_checkpoint(project['id'])
+            if checkpoint is not None:
+                results.append(checkpoint)
+            else:
+                todo.append(project)
+        # requests of every project share one pool, projects only wait on it
+        with ThreadPoolExecutor(max_workers=self.workers) as executor, \
+                ThreadPoolExecutor(max_workers=self.project_workers) as projects_executor:
+            futures = {projects_executor.submit(self._report_project, executor, project): project
+                       for project in todo}
+            for future in as_completed(futures):
+                project = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = {'project_id': project['id'], 'project_name': project['attributes'].get('name'),
+                              'items': 0, 'versions': 0, 'status': f"failed: {e}"}
+                results.append(result)
+                if on_project:
+                    on_project(result)
+        return pd.DataFrame(results, columns=['project_id', 'project_name', 'items', 'versions', 'status'])
+
+    def _report_project(self, executor, project):
+        project_id = project['id']
+        project_name = project['attributes'].get('name')
+        crawler = FolderCrawler(self.dm, project_id, self.workers, executor)
+        futures = []
+        for folder in self.dm.get_top_folders(self.hub_id, project_id):
+            for _, rows in crawler.crawl(folder['id'], self.extensions):
+                futures.extend(executor.submit(self._item_rows, project_name, row) for row in rows)
+        rows = []
+        for future in futures:
+            rows.extend(future.result())
+        self._write_partition(project_id, pd.DataFrame(rows, columns=VERSION_COLUMNS))
+        result = {'project_id': project_id, 'project_name': project_name, 'items': len(futures),
+                  'versions': len(rows), 'status': 'ok'}
+        atomic_write_json(self._checkpoint_path(project_id), dict(result, finished=time.time()))
+        return result
+
+    def _item_rows(self, project_name, item):
+        rows = []
+        for version in self.dm.get_item_versions(item['project_id'], item['item_id']):
+            attributes = version['attributes']
+            derivatives = version.get('relationships', {}).get('derivatives', {}).get('data') or {}
+            rows.append({
+                'project_id': item['project_id'],
+                'project_name': project_name,
+                'folder_id': item['folder_id'],
+                'item_id': item['item_id'],
+                'item_name': item['item_name'],
+                'version': attributes.get('versionNumber'),
+                'version_id': version.get('id'),
+                'derivative_urn': derivatives.get('id'),
+                'create_time': attributes.get('createTime'),
+                'last_modified_time': attributes.get('lastModifiedTime'),
+                'last_modified_user': attributes.get('lastModifiedUserName'),
+                'storage_size': attributes.get('storageSize'),
+            })
+        return rows
+
+    def _write_partition(self, project_id, df):
+        folder = os.path.join(self.output_folder, f"project_id={self._safe(project_id)}")
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, f"versions.{self.output_format}")
+        temp_path = path + '.tmp'
+        # the partition column lives in the folder name, fixed dtypes keep every partition on one schema
+        df = df.drop(columns=['project_id'])
+        numbers = ['version', 'storage_size']
+        # a missing storageSize makes the column float, convert the numbers before the text columns
+        df[numbers] = df[numbers].apply(lambda column: pd.to_numeric(column, errors='coerce').astype('Int64'))
+        df = df.astype({column: 'string' for column in df.columns if column not in numbers})
+        if self.output_format == 'parquet':
+            df.to_parquet(temp_path, index=False)
+        else:
+            df.to_csv(temp_path, index=False)
+        os.replace(temp_path, path)
+
+    def _load_checkpoint(self, project_id):
+        path = self._checkpoint_path(project_id)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r') as file:
+            checkpoint = json.load(file)
+        checkpoint.pop('finished', None)
+        checkpoint['status'] = 'done earlier'
+        return checkpoint
+
+    def _checkpoint_path(self, project_id):
+        return os.path.join(self.output_folder, '_checkpoints', f"{self._safe(project_id)}.json")
+
+    def _safe(self, name):
+        return ''.join(char if char.isalnum() or char in '.-_' else '_' for char in name)
+
+
+@click.command()
+@click.option('--hub_id', prompt='Hub Id', default=lambda: Config.load_hub_id(), help='The hub to report.')
+@click.option('--extension', prompt='Extension', default='.rvt', help='The file extensions to report, comma separated.')
+@click.option('--output_folder', default=lambda: os.path.join(Config.load_folder_path(), 'hub_versions'),
+              help='The folder of the partitioned output table.')
+@click.option('--format', 'output_format', type=click.Choice(['csv', 'parquet'], case_sensitive=False), default='csv',
+              help='The file format of each partition.')
+@click.option('--workers', default=lambda: Config.load_crawl_workers(), type=int,
+              help='The number of requests sent in parallel.')
+@click.option('--restart', default='n', help='Ignore the checkpoints of an earlier run (y/n).')
+@output_options
+def hub_versions(hub_id, extension, output_folder, output_format, workers, restart, output, limit):
+    """Report the version history of every item in every project of a hub."""
+    if not hub_id:
+        click.echo("Please provide a Hub Id.")
+        return
+    output_format = output_format.lower()
+    if output_format == 'parquet':
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            click.echo("Parquet output needs pyarrow, install it with: pip install apsbot[parquet]")
+            return
+    Config.save_hub_id(hub_id)
+    token = TokenConfig.load_config()
+    report = HubVersionReport(DataManagement(token, workers=workers), hub_id, output_folder, extension,
+                              output_format, workers)
+    if str.lower(restart) == 'y':
+        checkpoints = os.path.join(output_folder, '_checkpoints')
+        for name in os.listdir(checkpoints) if os.path.isdir(checkpoints) else []:
+            os.remove(os.path.join(checkpoints, name))
+    start = time.time()
+
+    def on_project(result):
+        click.echo(f"{result['project_name']}: {result['versions']} versions of {result['items']} items, "
+                   f"{result['status']}", err=not sys.stdout.isatty())
+
+    TokenConfig.start_auto_refresh(token)
+    try:
+        df = report.run(on_project)
+    finally:
+        TokenConfig.stop_auto_refresh()
+    show(df, output, limit)
+    click.echo(f"{df['versions'].sum()} versions of {df['items'].sum()} items in {time.time() - start:.1f}s, "
+               f"saved to {output_folder}", err=True)
+    failed = df[df['status'].str.startswith('failed')]
+    if not failed.empty:
+        raise click.ClickException(f"{len(failed)} projects failed, run the command again to retry them.")
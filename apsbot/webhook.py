@@ -4,8 +4,8 @@ from .config import Config
 from aps_toolkit import Webhooks
 import pandas as pd
 import json
-import os
-from tabulate import tabulate
+from .export import format_option, save_frame
+from .output import output_options, show
 @click.command()
 @click.option('--webhook_id', prompt='Webhook Id', help='The id of the webhook.')
 def webhook_delete(webhook_id):
@@ -20,7 +20,9 @@ def webhook_delete(webhook_id):
 
 @click.command()
 @click.option('--save_data', prompt='Save Data(y/n)', default='n', help='Save data to file.')
-def webhooks_get_all(save_data):
+@format_option
+@output_options
+def webhooks_get_all(save_data, save_format, output, limit):
     """This command lists all webhooks."""
     token = TokenConfig.load_config()
     webhook = Webhooks(token)
@@ -29,13 +31,11 @@ def webhooks_get_all(save_data):
         click.echo("No webhooks found.")
         return
     if str.lower(save_data) == 'y':
-        folder = Config.load_folder_path()
-        file_path = os.path.join(folder, 'webhooks.csv')
-        result.to_csv(file_path, index=False)
-        click.echo(f"Webhooks data saved to {file_path}")
+        file_path = save_frame(result, 'webhooks', save_format)
+        click.echo(f"Webhooks data saved to {file_path}", err=True)
     # just show hookId, event, folder
     df = result[["hookId","folder","projectId","event"]]
-    print(tabulate(df, headers="keys", tablefmt="psql"))
+    show(df, output, limit)
 
 @click.command()
 @click.option('--hook_id', prompt='Hook Id',default=Config.load_webhook_id(), help='The id of the webhook.')
@@ -0,0 +1,204 @@
+"""End to end benchmark of apsbot commands against the mock APS server.
+
+Every case runs ``python -m apsbot ...`` in a fresh interpreter against tools/mock_oss.py
+(through APS_HOST) and a scratch folder with its own config, token and property
+database cache, and reports the median wall time, the peak RSS and the number of
+requests the mock answered. Revit cases run once per synthetic model size.
+
+The mock serves Data Management and OSS listings itself. Bucket and webhook listings
+come from fixtures in the format ``APSBOT_RECORD`` writes; pass ``--fixtures`` with a
+file recorded against the real API to replay real responses instead.
+
+    python benchmarks/bench_commands.py --sizes 10000,100000 --runs 3
+    python benchmarks/bench_commands.py --save_baseline
+    python benchmarks/bench_commands.py --max_slowdown 1.5
+"""
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import click
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'tools'))
+from mock_oss import start_mock_oss, add_folder_tree, load_fixtures  # noqa: E402
+from apsbot.httpcache import DEFAULT_TTLS  # noqa: E402
+
+BASELINE_PATH = os.path.join(ROOT, 'benchmarks', 'baselines.json')
+REGION = 'US'
+PROJECT = 'b.project'
+BUCKET = 'bench'
+# the toolkit builds rows one concat at a time, so extraction cases stop at this size
+EXTRACT_MAX_SIZE = 10000
+
+
+def api_cases(root, item_id):
+    """Commands that only talk to the API, by case name."""
+    return {
+        'hubs': ['hubs', '--save_data', 'n'],
+        'projects': ['projects', '--hub_id', 'b.hub', '--save_data', 'n'],
+        'items': ['items', '--project_id', PROJECT, '--folder_id', root, '--extension', '.rvt', '--is_sub_folder', 'y',
+                  '--save_data', 'n'],
+        'item-versions': ['item-versions', '--project_id', PROJECT, '--item_id', item_id, '--save_data', 'n'],
+        'buckets': ['buckets', '--region', REGION],
+        'bucket-objects': ['bucket-objects', '--bucket_name', BUCKET, '--region', REGION],
+        'webhooks-get-all': ['webhooks-get-all', '--save_data', 'n'],
+    }
+
+
+def revit_cases(size):
+    """Commands that read the cached synthetic model of size elements, by case name."""
+    model = ['--urn', f"bench-{size}", '--region', REGION]
+    cases = {
+        'revit-categories': ['revit-categories', *model, '--save_data', 'n'],
+        'revit-family-types': ['revit-family-types', *model, '--save_data', 'n'],
+        'revit-query': ['revit-query', *model, '--query', 'Category = Walls AND Area > 10', '--parameters', '',
+                        '--is_sub_family', 'n', '--display_unit', 'n', '--save_data', 'n'],
+    }
+    if size <= EXTRACT_MAX_SIZE:
+        cases['data-revit-by-categories'] = ['data-revit-by-categories', *model, '--categories', 'Walls',
+                                             '--is_sub_family', 'n', '--display_unit', 'n', '--save_data', 'n']
+    return {f"{name}[{size}]": args for name, args in cases.items()}
+
+
+def fixture_records(buckets, hooks):
+    """Bucket and webhook listings in the format APSBOT_RECORD writes."""
+    bucket_items = [{'bucketKey': f"{BUCKET}-{number}", 'createdDate': 1700000000000 + number * 1000,
+                     'policyKey': 'transient'} for number in range(buckets)]
+    hook_items = [{'hookId': f"hook-{number}", 'tenant': 'bench', 'callbackUrl': 'https://example.com/callback',
+                   'createdBy': 'bench', 'event': 'dm.version.added', 'createdDate': '2024-01-01T00:00:00.000+0000',
+                   'system': 'data', 'status': 'active', 'scope': {'folder': f"urn:adsk.wipprod:fs.folder:co.f{number}"},
+                   'hookAttribute': {'projectId': PROJECT}} for number in range(hooks)]
+    headers = {'Content-Type': 'application/json'}
+    return [
+        {'method': 'GET', 'path': '/oss/v2/buckets', 'query': '', 'status': 200, 'headers': headers,
+         'body': json.dumps({'items': bucket_items})},
+        {'method': 'GET', 'path': '/webhooks/v1/hooks', 'query': '', 'status': 200, 'headers': headers,
+         'body': json.dumps({'data': hook_items})},
+    ]
+
+
+def prepare(workdir, server, sizes, folders, fixtures):
+    """Write the config, token, fixtures and cached models of the scratch folder, fill the mock."""
+    with open(os.path.join(workdir, 'config.json'), 'w') as file:
+        json.dump({
+            'FOLDER_PATH': workdir,
+            'CACHE_FOLDER': os.path.join(workdir, 'cache'),
+            'DEFAULT_REGION': REGION,
+            # every request should reach the mock so the counts stay comparable
+            'HTTP_CACHE_TTL': {endpoint: -1 for endpoint in DEFAULT_TTLS},
+        }, file)
+    with open(os.path.join(workdir, 'token_config.json'), 'w') as file:
+        json.dump({'APS_ACCESS_TOKEN': 'bench', 'APS_REFRESH_TOKEN': None, 'APS_TOKEN_TYPE': 'Bearer',
+                   'APS_EXPIRES_IN': 3600, 'APS_ISSUED_AT': time.time(), 'APS_EXPIRES_AT': time.time() + 10 ** 8}, file)
+    fixture_path = os.path.join(workdir, 'fixtures.jsonl')
+    with open(fixture_path, 'w') as file:
+        file.writelines(json.dumps(record) + '\n' for record in fixture_records(200, 200))
+    load_fixtures(server.state, fixture_path)
+    if fixtures:
+        load_fixtures(server.state, fixtures)
+    root = add_folder_tree(server.state, PROJECT, folders)
+    for number in range(2000):
+        server.state.objects[(BUCKET, f"object-{number:05d}.rvt")] = b'x' * 64
+    for size in sizes:
+        # in a child process, a forked command starts from the peak RSS of its parent
+        subprocess.run([sys.executable, os.path.join(ROOT, 'benchmarks', 'synth_propdb.py'), '--elements', str(size),
+                        '--urn', f"bench-{size}", '--region', REGION], cwd=workdir, stdout=subprocess.DEVNULL,
+                       check=True)
+    item_id = next(item for project, item in server.state.versions if project == PROJECT)
+    return root, item_id
+
+
+def run_case(args, workdir, url, server, runs):
+    """Median seconds, peak RSS in MB and requests per run of one command, after a warm-up run."""
+    env = {key: value for key, value in os.environ.items() if not key.startswith('APSBOT_')}
+    env.update(PYTHONPATH=ROOT, APS_HOST=url)
+    timings, peak, requests = [], 0, 0
+    for run in range(runs + 1):
+        before = server.state.requests
+        with tempfile.TemporaryFile() as stderr:
+            start = time.perf_counter()
+            process = subprocess.Popen([sys.executable, '-m', 'apsbot', *args, '--output', 'csv'], cwd=workdir,
+                                       env=env, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=stderr)
+            _, status, usage = os.wait4(process.pid, 0)
+            elapsed = time.perf_counter() - start
+            process.returncode = os.waitstatus_to_exitcode(status)
+            if process.returncode != 0:
+                stderr.seek(0)
+                raise click.ClickException(f"apsbot {' '.join(args)} failed:\n{stderr.read().decode(errors='replace')}")
+        if run == 0:
+            # the warm-up run builds the model indexes and fills the OS caches
+            continue
+        timings.append(elapsed)
+        peak = max(peak, usage.ru_maxrss / 1024)
+        requests = server.state.requests - before
+    return {'seconds': round(statistics.median(timings), 3), 'max_rss_mb': round(peak, 1), 'requests': requests}
+
+
+def compare(name, result, baseline, max_slowdown):
+    """Return the regressions of a case against its baseline."""
+    if baseline is None:
+        return []
+    problems = []
+    if max_slowdown is not None and result['seconds'] > baseline['seconds'] * max_slowdown:
+        problems.append(f"{name} took {result['seconds']}s, the baseline is {baseline['seconds']}s")
+    if result['requests'] > baseline['requests']:
+        problems.append(f"{name} sent {result['requests']} requests, the baseline is {baseline['requests']}")
+    return problems
+
+
+@click.command()
+@click.option('--sizes', default='10000,100000', help='The element counts of the synthetic models, comma separated.')
+@click.option('--cases', default='', help='Only run the cases whose name starts with one of these, comma separated.')
+@click.option('--runs', default=3, help='The number of timed runs per case.')
+@click.option('--folders', default=200, help='The number of folders in the mock project.')
+@click.option('--fixtures', default=None, help='A file of responses recorded with APSBOT_RECORD to replay.')
+@click.option('--save_baseline', is_flag=True, help='Save the results as the new baselines.')
+@click.option('--max_slowdown', default=None, type=float,
+              help='Fail if a case is this many times slower than its baseline.')
+def main(sizes, cases, runs, folders, fixtures, save_baseline, max_slowdown):
+    sizes = [int(size) for size in sizes.split(',') if size.strip()]
+    prefixes = [prefix.strip() for prefix in cases.split(',') if prefix.strip()]
+    baselines = {}
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH, 'r') as file:
+            baselines = json.load(file).get('cases', {})
+    server, url = start_mock_oss()
+    workdir = tempfile.mkdtemp(prefix='apsbot-bench-')
+    problems = []
+    results = {}
+    try:
+        root, item_id = prepare(workdir, server, sizes, folders, fixtures)
+        selected = dict(api_cases(root, item_id))
+        for size in sizes:
+            selected.update(revit_cases(size))
+        for name, args in selected.items():
+            if prefixes and not any(name.startswith(prefix) for prefix in prefixes):
+                continue
+            result = run_case(args, workdir, url, server, runs)
+            results[name] = result
+            click.echo(f"{name:<34} median {result['seconds'] * 1000:9.1f} ms  peak {result['max_rss_mb']:8.1f} MB  "
+                       f"requests {result['requests']:5d}")
+            problems += compare(name, result, baselines.get(name), max_slowdown)
+    finally:
+        server.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+    if save_baseline:
+        baselines.update(results)
+        with open(BASELINE_PATH, 'w') as file:
+            json.dump({'python': sys.version.split()[0], 'cases': baselines}, file, indent=4, sort_keys=True)
+            file.write('\n')
+        click.echo(f"Baselines saved to {BASELINE_PATH}")
+    for problem in problems:
+        click.echo(problem)
+    if problems:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""Startup time benchmark for the apsbot CLI.
+
+Runs a few cheap invocations in fresh interpreters and fails when the median
+wall time goes over the budget, or when ``apsbot --help`` imports one of the
+heavy subsystem dependencies again.
+
+    python benchmarks/bench_startup.py --runs 10 --max_seconds 0.5
+"""
+import os
+import statistics
+import subprocess
+import sys
+import time
+import click
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ['pandas', 'aps_toolkit', 'langchain', 'langchain_openai', 'langchain_experimental', 'openai',
+                 'tabulate', 'requests']
+CASES = {
+    'help': [sys.executable, '-m', 'apsbot', '--help'],
+    'set_folder_help': [sys.executable, '-m', 'apsbot', 'set-folder', '--help'],
+}
+CHECK_IMPORTS = (
+    "import sys; sys.argv = ['apsbot', '--help']\n"
+    "from apsbot.cli import apsbot\n"
+    "try:\n    apsbot()\nexcept SystemExit:\n    pass\n"
+    "sys.stderr.write(','.join(m for m in %r if m in sys.modules))" % HEAVY_MODULES
+)
+
+
+def time_case(command, runs):
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+@click.command()
+@click.option('--runs', default=5, help='The number of runs per case.')
+@click.option('--max_seconds', default=None, type=float, help='Fail if a median is over this many seconds.')
+def main(runs, max_seconds):
+    failed = False
+    for name, command in CASES.items():
+        timings = time_case(command, runs)
+        median = statistics.median(timings)
+        click.echo(f"{name:<16} median {median * 1000:8.1f} ms  min {min(timings) * 1000:8.1f} ms")
+        if max_seconds is not None and median > max_seconds:
+            click.echo(f"{name} is over the {max_seconds}s budget.")
+            failed = True
+    result = subprocess.run([sys.executable, '-c', CHECK_IMPORTS], cwd=ROOT, env=dict(os.environ, PYTHONPATH=ROOT),
+                            capture_output=True, text=True, check=True)
+    imported = result.stderr.strip()
+    if imported:
+        click.echo(f"apsbot --help imported heavy modules: {imported}")
+        failed = True
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
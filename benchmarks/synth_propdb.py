@@ -0,0 +1,154 @@
+"""Synthetic Revit property databases for benchmarks.
+
+The tree has the shape the toolkit and apsbot expect: root, category, family and type
+nodes carrying _RC/_RFN/_RFT, and elements under each type with a name, category,
+area, level, comments and parent/instanceof links. The arrays are built with numpy,
+so a million elements take seconds.
+
+    python benchmarks/synth_propdb.py --elements 100000 --urn bench-100k
+"""
+import os
+import sys
+import click
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ATTRS = [
+    ('child', '__child__', ''),
+    ('parent', '__parent__', ''),
+    ('instanceof_objid', '__instanceof__', ''),
+    ('name', '__name__', ''),
+    ('_RC', '__category__', ''),
+    ('_RFN', '__category__', ''),
+    ('_RFT', '__category__', ''),
+    ('Category', '__category__', ''),
+    ('Area', 'Dimensions', 'autodesk.unit.unit:squareMeters-1.0.1'),
+    ('Level', 'Constraints', ''),
+    ('Comments', 'Identity Data', ''),
+    ('Type Mark', 'Identity Data', ''),
+]
+CATEGORY_NAMES = ['Walls', 'Doors', 'Windows', 'Rooms', 'Floors', 'Ceilings', 'Columns', 'Beams', 'Pipes', 'Ducts',
+                  'Furniture', 'Lighting Fixtures', 'Plumbing Fixtures', 'Stairs', 'Railings', 'Roofs', 'Casework',
+                  'Generic Models', 'Mechanical Equipment', 'Electrical Equipment']
+
+
+def make_propdb(elements, categories=20, families=10, types=5):
+    """Return the ids, offsets, avs, attrs and vals arrays of a model with that many elements."""
+    attrs = [0] + [[name, category, 20, context, '', name, 0, 0, ''] for name, category, context in ATTRS]
+    attr = {name: index + 1 for index, (name, _, _) in enumerate(ATTRS)}
+    type_count = categories * families * types
+    first_category = 2
+    first_family = first_category + categories
+    first_type = first_family + categories * families
+    first_element = first_type + type_count
+    count = first_element + elements
+    # values: every dbId as an int first, so links to node i are value i, then the strings and numbers
+    vals = list(range(count))
+    interned = {}
+
+    def value(item):
+        if item not in interned:
+            interned[item] = len(vals)
+            vals.append(item)
+        return interned[item]
+
+    category_names = [CATEGORY_NAMES[i % len(CATEGORY_NAMES)] + ('' if i < len(CATEGORY_NAMES) else f' {i}')
+                      for i in range(categories)]
+    node_pairs = [[], [(attr['name'], value('Model'))]]
+    node_pairs[1] += [(attr['child'], first_category + c) for c in range(categories)]
+    for c, category in enumerate(category_names):
+        node_pairs.append([(attr['_RC'], value(category)), (attr['name'], value(category))] +
+                          [(attr['child'], first_family + c * families + f) for f in range(families)])
+    family_names = []
+    for c, category in enumerate(category_names):
+        for f in range(families):
+            family = f"{category} Family {f}"
+            family_names.append(family)
+            node_pairs.append([(attr['_RC'], value(category)), (attr['_RFN'], value(family)),
+                               (attr['name'], value(family))] +
+                              [(attr['child'], first_type + (c * families + f) * types + t) for t in range(types)])
+    # elements are spread evenly over the types, type t owns elements bounds[t]:bounds[t + 1]
+    bounds = np.linspace(0, elements, type_count + 1).astype(np.int64)
+    for t in range(type_count):
+        family = family_names[t // types]
+        category = category_names[t // (families * types)]
+        type_name = f"Type {t % types}"
+        node_pairs.append([(attr['_RC'], value(category)), (attr['_RFN'], value(family)),
+                           (attr['_RFT'], value(type_name)), (attr['name'], value(type_name)),
+                           (attr['Type Mark'], value(f"TM-{t}"))] +
+                          [(attr['child'], first_element + e) for e in range(bounds[t], bounds[t + 1])])
+
+    # element properties, seven pairs each
+    numbers = np.arange(elements)
+    owner_types = np.repeat(np.arange(type_count), np.diff(bounds))
+    first_value = len(vals)
+    vals.extend(f"{family_names[t // types]} [{100000 + e}]" for e, t in zip(numbers.tolist(), owner_types.tolist()))
+    category_values = np.array([value('Revit ' + name) for name in category_names])
+    area_values = np.array([value(round(5 + i * 0.25, 2)) for i in range(400)])
+    level_values = np.array([value(f"L{i + 1}") for i in range(10)])
+    comment_values = np.array([value(f"Comment {i}") for i in range(50)])
+    type_ids = first_type + owner_types
+    element_attrs = np.array([attr['name'], attr['Category'], attr['Area'], attr['Level'], attr['Comments'],
+                              attr['parent'], attr['instanceof_objid']])
+    element_vals = np.column_stack([
+        first_value + numbers,
+        category_values[owner_types // (families * types)],
+        area_values[numbers % len(area_values)],
+        level_values[numbers % len(level_values)],
+        comment_values[numbers % len(comment_values)],
+        type_ids,
+        type_ids,
+    ])
+    element_avs = np.column_stack([np.broadcast_to(element_attrs, element_vals.shape), element_vals]) \
+        .reshape(elements, 2, 7).transpose(0, 2, 1).reshape(-1)
+
+    avs = []
+    offsets = []
+    for pairs in node_pairs:
+        offsets.append(len(avs) // 2)
+        for pair in pairs:
+            avs.extend(pair)
+    element_offsets = len(avs) // 2 + 7 * numbers
+    offsets.extend(element_offsets.tolist())
+    avs.extend(element_avs.tolist())
+    ids = ['', 'model'] + [f"node-{i}" for i in range(first_category, first_element)] + \
+          [f"element-{100000 + e}" for e in range(elements)]
+    return {'ids': ids, 'offsets': offsets, 'avs': avs, 'attrs': attrs, 'vals': vals}
+
+
+def make_reader(elements, **kwargs):
+    """Return a PropDbReaderRevit over a synthetic model, without any download."""
+    from aps_toolkit import PropDbReaderRevit
+    from aps_toolkit.units.DisplayUnits import DisplayUnits
+    reader = PropDbReaderRevit.__new__(PropDbReaderRevit)
+    for name, array in make_propdb(elements, **kwargs).items():
+        setattr(reader, name, array)
+    reader.units = DisplayUnits()
+    reader.host = "https://developer.api.autodesk.com"
+    reader.token = None
+    return reader
+
+
+def store(urn, region, elements):
+    """Put a synthetic model into the property database cache under urn, as if it had been downloaded."""
+    sys.path.insert(0, ROOT)
+    from apsbot.cache import PropDbCache
+    reader = make_reader(elements)
+    reader.urn = urn
+    reader.region = region
+    PropDbCache.store(urn, region, reader)
+    return reader
+
+
+@click.command()
+@click.option('--elements', default=10000, help='The number of elements of the model.')
+@click.option('--urn', default=None, help='The urn to cache the model under, bench-<elements> by default.')
+@click.option('--region', default='US', help='The region to cache the model under.')
+def main(elements, urn, region):
+    urn = urn or f"bench-{elements}"
+    store(urn, region, elements)
+    click.echo(f"Cached a synthetic model of {elements} elements as {urn}")
+
+
+if __name__ == '__main__':
+    main()
@@ -16,6 +16,10 @@ setup(
         "langchain_experimental==0.0.60",
         "langchain==0.2.3"
     ],
+    extras_require={
+        "parquet": ["pyarrow"],
+        "yaml": ["pyyaml"],
+    },
     entry_points={
         "console_scripts": [
             "apsbot=apsbot.cli:apsbot",
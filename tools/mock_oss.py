@@ -0,0 +1,455 @@
+"""In-memory mock of the OSS and Data Management endpoints used by apsbot, for testing without APS access.
+
+Start it and point apsbot at it with the APS_HOST environment variable:
+
+    python tools/mock_oss.py --port 8765 --fail_rate 0.1
+    APS_HOST=http://127.0.0.1:8765 apsbot bucket-upload-object --bucket_name test ...
+
+Signed S3 urls point back at the mock itself. ``--fail_rate`` makes that share of
+part uploads and range downloads fail with a 500 to exercise retries and resume.
+``--throttle_rate`` answers that share of Data Management requests with a 429.
+``--folders`` fills one project with a synthetic folder tree of that many folders.
+``--fixtures`` replays responses recorded with ``APSBOT_RECORD=<file> apsbot ...``, a
+recorded request is answered from the recording instead of the mock's own state.
+"""
+import hashlib
+import json
+import random
+import re
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, unquote, urlparse
+import click
+
+
+class MockOSSState:
+    def __init__(self, fail_rate=0.0, throttle_rate=0.0):
+        self.fail_rate = fail_rate
+        self.throttle_rate = throttle_rate
+        self.objects = {}  # (bucket, object) -> bytes
+        self.uploads = {}  # upload key -> {'bucket', 'object', 'parts': {number: bytes}}
+        self.folders = {}  # (project, folder) -> {'folders': [folder ids], 'versions': [tip version json], 'hidden': [...]}
+        self.projects = {}  # hub -> [project ids]
+        self.top_folders = {}  # project -> [folder ids]
+        self.versions = {}  # (project, item) -> [version json, newest first]
+        self.fixtures = {}  # (method, path, query) and (method, path) -> recorded response
+        self.requests = 0
+        self.lock = threading.Lock()
+
+
+class MockOSSHandler(BaseHTTPRequestHandler):
+    state = None
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def base_url(self):
+        return f"http://{self.server.server_address[0]}:{self.server.server_address[1]}"
+
+    def _send_json(self, data, status=200, etag=False):
+        body = json.dumps(data).encode('utf-8')
+        if etag:
+            # Data Management reads carry an ETag and answer a matching If-None-Match with 304
+            tag = f'"{hashlib.md5(body).hexdigest()}"'
+            if self.headers.get('If-None-Match') == tag:
+                self.send_response(304)
+                self.send_header('ETag', tag)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        if etag:
+            self.send_header('ETag', tag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_status(self, status):
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def _replay(self, method, path):
+        """Answer from a recorded response, matched on the path and query first and the path alone then."""
+        query = urlparse(self.path).query
+        record = self.state.fixtures.get((method, path, query)) or self.state.fixtures.get((method, path))
+        if record is None:
+            return False
+        body = record['body'].encode('utf-8')
+        self.send_response(record['status'])
+        for key, value in record.get('headers', {}).items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        return True
+
+    def _should_fail(self):
+        return self.state.fail_rate and random.random() < self.state.fail_rate
+
+    def _route(self):
+        with self.state.lock:
+            self.state.requests += 1
+        url = urlparse(self.path)
+        return url.path, {k: v[0] for k, v in parse_qs(url.query).items()}
+
+    def do_GET(self):
+        path, query = self._route()
+        if self._replay('GET', path):
+            return
+        match = re.match(r'^/oss/v2/buckets/([^/]+)/objects/([^/]+)/signeds3upload$', path)
+        if match:
+            bucket, name = match.group(1), unquote(match.group(2))
+            upload_key = query.get('uploadKey')
+            with self.state.lock:
+                if upload_key is None:
+                    upload_key = uuid.uuid4().hex
+                    self.state.uploads[upload_key] = {'bucket': bucket, 'object': name, 'parts': {}}
+                elif upload_key not in self.state.uploads:
+                    return self._send_json({'reason': 'Upload key not found'}, 404)
+            first = int(query.get('firstPart', 1))
+            parts = int(query.get('parts', 1))
+            urls = [f"{self.base_url}/s3/upload/{upload_key}/{number}" for number in range(first, first + parts)]
+            return self._send_json({'uploadKey': upload_key, 'urls': urls})
+        match = re.match(r'^/oss/v2/buckets/([^/]+)/objects/([^/]+)/signeds3download$', path)
+        if match:
+            bucket, name = match.group(1), unquote(match.group(2))
+            data = self.state.objects.get((bucket, name))
+            if data is None:
+                return self._send_json({'reason': 'Object not found'}, 404)
+            return self._send_json({
+                'status': 'complete',
+                'url': f"{self.base_url}/s3/download/{bucket}/{quote(name, safe='')}",
+                'size': len(data),
+                'sha1': hashlib.sha1(data).hexdigest(),
+            })
+        match = re.match(r'^/oss/v2/buckets/([^/]+)/objects$', path)
+        if match:
+            return self._list_objects(match.group(1), query)
+        match = re.match(r'^/s3/download/([^/]+)/([^/]+)$', path)
+        if match:
+            return self._download(match.group(1), unquote(match.group(2)))
+        match = re.match(r'^/data/v1/projects/([^/]+)/folders/([^/]+)/contents$', path)
+        if match:
+            return self._folder_contents(match.group(1), unquote(match.group(2)), query)
+        match = re.match(r'^/data/v1/projects/([^/]+)/items/([^/]+)/versions$', path)
+        if match:
+            return self._item_versions(match.group(1), unquote(match.group(2)), query)
+        match = re.match(r'^/data/v1/projects/([^/]+)/folders/([^/]+)/search$', path)
+        if match:
+            return self._search(match.group(1), unquote(match.group(2)), query)
+        if path == '/project/v1/hubs':
+            return self._hubs()
+        match = re.match(r'^/project/v1/hubs/([^/]+)/projects$', path)
+        if match:
+            return self._projects(match.group(1), query)
+        match = re.match(r'^/project/v1/hubs/([^/]+)/projects/([^/]+)/topFolders$', path)
+        if match:
+            return self._top_folders(match.group(2))
+        self._send_status(404)
+
+    def _folder_json(self, project, folder_id):
+        return {'type': 'folders', 'id': folder_id,
+                'attributes': {'name': self.state.folders[(project, folder_id)].get('name', folder_id.split('.')[-1]),
+                               'lastModifiedTimeRollup': self._rollup(project, folder_id)}}
+
+    def _rollup(self, project, folder_id):
+        folder = self.state.folders[(project, folder_id)]
+        times = [version['attributes']['lastModifiedTime'] for version in folder['versions'] + folder['hidden']]
+        times += [self._rollup(project, child) for child in folder['folders']]
+        return max([time for time in times if time] or [''])
+
+    def _hubs(self):
+        if self._throttled():
+            return
+        data = [{'type': 'hubs', 'id': hub,
+                 'attributes': {'name': hub, 'region': 'US', 'extension': {'type': 'hubs:autodesk.bim360:Account'}}}
+                for hub in self.state.projects]
+        return self._send_json({'data': data}, etag=True)
+
+    def _projects(self, hub, query):
+        if self._throttled():
+            return
+        page, links = self._page(f"/project/v1/hubs/{hub}/projects", self.state.projects.get(hub, []), query)
+        data = [{'type': 'projects', 'id': project,
+                 'attributes': {'name': project, 'extension': {'data': {'projectType': 'ACC'}}}} for project in page]
+        return self._send_json({'links': links, 'data': data}, etag=True)
+
+    def _top_folders(self, project):
+        if self._throttled():
+            return
+        return self._send_json({'data': [self._folder_json(project, folder_id)
+                                         for folder_id in self.state.top_folders.get(project, [])]}, etag=True)
+
+    def _search(self, project, folder_id, query):
+        if self._throttled():
+            return
+        since = query.get('filter[lastModifiedTime]-ge', '')
+        hidden = query.get('includeHidden') == 'true'
+        versions, included, queue = [], [], [folder_id]
+        while queue:
+            current = queue.pop(0)
+            folder = self.state.folders[(project, current)]
+            queue.extend(folder['folders'])
+            for version in folder['versions'] + (folder['hidden'] if hidden else []):
+                if version['attributes']['lastModifiedTime'] >= since:
+                    versions.append(version)
+                    included.append({'type': 'items', 'id': version['relationships']['item']['data']['id'],
+                                     'relationships': {'parent': {'data': {'type': 'folders', 'id': current}}}})
+        page, links = self._page(f"/data/v1/projects/{project}/folders/{quote(folder_id, safe='')}/search",
+                                 versions, query)
+        ids = {version['relationships']['item']['data']['id'] for version in page}
+        return self._send_json({'links': links, 'data': page, 'included': [item for item in included
+                                                                           if item['id'] in ids]})
+
+    def _throttled(self):
+        if self.state.throttle_rate and random.random() < self.state.throttle_rate:
+            self.send_response(429)
+            self.send_header('Retry-After', '0.05')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return True
+        return False
+
+    def _page(self, path, entries, query, page_size=50):
+        number = int(query.get('page[number]', 0))
+        page = entries[number * page_size:(number + 1) * page_size]
+        links = {'self': {'href': f"{self.base_url}{path}"}}
+        if (number + 1) * page_size < len(entries):
+            params = '&'.join(f"{quote(key)}={quote(value)}" for key, value in query.items() if key != 'page[number]')
+            links['next'] = {'href': f"{self.base_url}{path}?page[number]={number + 1}" + (f"&{params}" if params else '')}
+        return page, links
+
+    def _folder_contents(self, project, folder_id, query):
+        if self._throttled():
+            return
+        folder = self.state.folders.get((project, folder_id))
+        if folder is None:
+            return self._send_json({'reason': 'Folder not found'}, 404)
+        entries = [('folders', child) for child in folder['folders']] + \
+                  [('items', version) for version in folder['versions']]
+        page, links = self._page(f"/data/v1/projects/{project}/folders/{quote(folder_id, safe='')}/contents",
+                                 entries, query)
+        data = [self._folder_json(project, value) if kind == 'folders' else
+                {'type': 'items', 'id': value['relationships']['item']['data']['id']} for kind, value in page]
+        included = [value for kind, value in page if kind == 'items']
+        return self._send_json({'links': links, 'data': data, 'included': included}, etag=True)
+
+    def _item_versions(self, project, item_id, query):
+        if self._throttled():
+            return
+        versions = self.state.versions.get((project, item_id))
+        if versions is None:
+            return self._send_json({'reason': 'Item not found'}, 404)
+        page, links = self._page(f"/data/v1/projects/{project}/items/{quote(item_id, safe='')}/versions",
+                                 versions, query)
+        return self._send_json({'links': links, 'data': page}, etag=True)
+
+    def _list_objects(self, bucket, query):
+        limit = min(int(query.get('limit', 10)), 100)
+        prefix = query.get('beginsWith', '')
+        start_at = query.get('startAt')
+        names = sorted(name for b, name in self.state.objects if b == bucket and name.startswith(prefix))
+        if start_at is not None:
+            names = [name for name in names if name >= start_at]
+        page, rest = names[:limit], names[limit:]
+        items = []
+        for name in page:
+            data = self.state.objects[(bucket, name)]
+            items.append({'bucketKey': bucket, 'objectKey': name, 'objectId': f"urn:adsk.objects:os.object:{bucket}/{name}",
+                          'sha1': hashlib.sha1(data).hexdigest(), 'size': len(data),
+                          'location': f"{self.base_url}/oss/v2/buckets/{bucket}/objects/{quote(name, safe='')}"})
+        result = {'items': items}
+        if rest:
+            params = f"limit={limit}&startAt={quote(rest[0], safe='')}"
+            if prefix:
+                params += f"&beginsWith={quote(prefix, safe='')}"
+            result['next'] = f"{self.base_url}/oss/v2/buckets/{bucket}/objects?{params}"
+        return self._send_json(result)
+
+    def _download(self, bucket, name):
+        data = self.state.objects.get((bucket, name))
+        if data is None:
+            return self._send_status(404)
+        if self._should_fail():
+            return self._send_status(500)
+        range_header = self.headers.get('Range')
+        if range_header:
+            start, end = range_header.replace('bytes=', '').split('-')
+            start, end = int(start), min(int(end or len(data) - 1), len(data) - 1)
+            body = data[start:end + 1]
+            self.send_response(206)
+            self.send_header('Content-Range', f"bytes {start}-{end}/{len(data)}")
+        else:
+            body = data
+            self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_PUT(self):
+        path, query = self._route()
+        if self._replay('PUT', path):
+            return
+        match = re.match(r'^/s3/upload/([^/]+)/(\d+)$', path)
+        if not match:
+            return self._send_status(404)
+        body = self._read_body()
+        if self._should_fail():
+            return self._send_status(500)
+        with self.state.lock:
+            upload = self.state.uploads.get(match.group(1))
+            if upload is None:
+                return self._send_status(404)
+            upload['parts'][int(match.group(2))] = body
+        self.send_response(200)
+        self.send_header('ETag', hashlib.md5(body).hexdigest())
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_POST(self):
+        path, query = self._route()
+        if self._replay('POST', path):
+            return
+        match = re.match(r'^/oss/v2/buckets/([^/]+)/objects/([^/]+)/signeds3upload$', path)
+        if not match:
+            return self._send_status(404)
+        bucket, name = match.group(1), unquote(match.group(2))
+        data = json.loads(self._read_body() or b'{}')
+        with self.state.lock:
+            upload = self.state.uploads.pop(data.get('uploadKey'), None)
+            if upload is None:
+                return self._send_json({'reason': 'Upload key not found'}, 404)
+            numbers = sorted(upload['parts'])
+            if numbers != list(range(1, len(numbers) + 1)):
+                self.state.uploads[data['uploadKey']] = upload
+                return self._send_json({'reason': 'Missing parts'}, 400)
+            content = b''.join(upload['parts'][number] for number in numbers)
+            if 'size' in data and data['size'] != len(content):
+                return self._send_json({'reason': 'Size mismatch'}, 400)
+            self.state.objects[(bucket, name)] = content
+        return self._send_json({'bucketKey': bucket, 'objectKey': name, 'size': len(content),
+                                'objectId': f"urn:adsk.objects:os.object:{bucket}/{name}",
+                                'contentType': 'application/octet-stream',
+                                'location': f"{self.base_url}/oss/v2/buckets/{bucket}/objects/{quote(name, safe='')}"})
+
+    def do_DELETE(self):
+        path, query = self._route()
+        if self._replay('DELETE', path):
+            return
+        match = re.match(r'^/oss/v2/buckets/([^/]+)/objects/([^/]+)$', path)
+        if not match:
+            return self._send_status(404)
+        with self.state.lock:
+            removed = self.state.objects.pop((match.group(1), unquote(match.group(2))), None)
+        self._send_status(200 if removed is not None else 404)
+
+
+def mock_version(project, item_id, name, number, modified, extension='versions:autodesk.bim360:File'):
+    """Build the JSON of one item version the way Data Management returns it."""
+    return {
+        'type': 'versions',
+        'id': f"urn:adsk.wipprod:fs.file:vf.{item_id.split('.')[-1]}?version={number}",
+        'attributes': {'displayName': name, 'versionNumber': number, 'lastModifiedTime': modified,
+                       'extension': {'type': extension}},
+        'relationships': {
+            'item': {'data': {'type': 'items', 'id': item_id}},
+            'derivatives': {'data': {'type': 'derivatives', 'id': f"dXJu{item_id.split('.')[-1]}_v{number}"}},
+        },
+    }
+
+
+def add_folder_tree(state, project, folders, files_per_folder=3, versions=2, breadth=5, hub='b.hub'):
+    """Fill a project of a hub with a breadth-first tree of folders holding .rvt and .pdf items. Return the root id."""
+    root = f"urn:adsk.wipprod:fs.folder:co.{project.split('.')[-1]}root"
+    state.projects.setdefault(hub, []).append(project)
+    state.top_folders[project] = [root]
+    state.folders[(project, root)] = {'folders': [], 'versions': [], 'hidden': []}
+    queue = [root]
+    for number in range(1, folders):
+        parent = queue[(number - 1) // breadth]
+        folder_id = f"urn:adsk.wipprod:fs.folder:co.{project.split('.')[-1]}f{number}"
+        state.folders[(project, parent)]['folders'].append(folder_id)
+        state.folders[(project, folder_id)] = {'folders': [], 'versions': [], 'hidden': []}
+        queue.append(folder_id)
+    for number, folder_id in enumerate(queue):
+        for index in range(files_per_folder):
+            item_id = f"urn:adsk.wipprod:dm.lineage:{project.split('.')[-1]}i{number}x{index}"
+            name = f"model-{number}-{index}.{'rvt' if index % 3 else 'pdf'}"
+            history = [mock_version(project, item_id, name, version, f"2024-01-{version:02d}T00:00:00.0000000Z")
+                       for version in range(versions, 0, -1)]
+            state.versions[(project, item_id)] = history
+            state.folders[(project, folder_id)]['versions'].append(history[0])
+    return root
+
+
+def add_item_version(state, project, item_id, modified, deleted=False):
+    """Add a new tip version to an item, a deleted version hides the item from folder listings."""
+    history = state.versions[(project, item_id)]
+    extension = 'versions:autodesk.bim360:Deleted' if deleted else 'versions:autodesk.bim360:File'
+    version = mock_version(project, item_id, history[0]['attributes']['displayName'],
+                           history[0]['attributes']['versionNumber'] + 1, modified, extension)
+    history.insert(0, version)
+    for folder in state.folders.values():
+        for key in ['versions', 'hidden']:
+            for index, tip in enumerate(folder[key]):
+                if tip['relationships']['item']['data']['id'] == item_id:
+                    del folder[key][index]
+                    folder['hidden' if deleted else 'versions'].append(version)
+                    return version
+    return version
+
+
+def load_fixtures(state, path):
+    """Load the responses recorded with APSBOT_RECORD into the mock. Return how many were loaded."""
+    count = 0
+    with open(path, 'r', encoding='utf-8') as file:
+        for line in file:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            state.fixtures[(record['method'], record['path'], record.get('query', ''))] = record
+            state.fixtures.setdefault((record['method'], record['path']), record)
+            count += 1
+    return count
+
+
+def start_mock_oss(port=0, fail_rate=0.0, throttle_rate=0.0):
+    """Start the mock in a background thread. Return (server, base_url)."""
+    state = MockOSSState(fail_rate, throttle_rate)
+    handler = type('Handler', (MockOSSHandler,), {'state': state})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.state = state
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+@click.command()
+@click.option('--port', default=8765, help='The port to listen on.')
+@click.option('--fail_rate', default=0.0, help='The share of part transfers that fail with a 500.')
+@click.option('--throttle_rate', default=0.0, help='The share of Data Management requests that get a 429.')
+@click.option('--folders', default=0, help='The number of folders in the synthetic project "b.project".')
+@click.option('--fixtures', default=None, help='A file of responses recorded with APSBOT_RECORD to replay.')
+def main(port, fail_rate, throttle_rate, folders, fixtures):
+    server, url = start_mock_oss(port, fail_rate, throttle_rate)
+    click.echo(f"Mock OSS listening on {url}, set APS_HOST={url}")
+    if fixtures:
+        click.echo(f"Replaying {load_fixtures(server.state, fixtures)} recorded responses from {fixtures}")
+    if folders:
+        root = add_folder_tree(server.state, 'b.project', folders)
+        click.echo(f"Project b.project of hub b.hub has {folders} folders under {root}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()